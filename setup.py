@@ -32,9 +32,10 @@ dev_requirements = [
     "wheel>=0.33.1",
 ]
 
-requirements = ["numpy", "pytest"]
+requirements = ["numpy", "scipy", "pytest"]
 
 extra_requirements = {
+    "numba": ["numba"],
     "test": test_requirements,
     "docs": docs_requirements,
     "setup": setup_requirements,
@@ -12,5 +12,26 @@ __copyright__ = "Copyright (c) 2020, Joshua Vendrow"
 
 
 from .fnnls import fnnls
+from .fnnls import fnnls_gram
 from .fnnls import RK
 from .fnnls import RGS
+from .batch import fnnls_batch
+from .batch import fnnls_sequence
+from .parallel import fnnls_parallel
+from .engines import CholeskyEngine
+from .solver import NNLSSolver
+from .engines import FactorCache
+from .gram import gram
+from .streaming import fnnls_chunked
+from .stats import SolverStats
+from .path import fnnls_path
+from .nmf import nmf
+from .screening import fnnls_screened
+from .screening import screen
+from .online import OnlineNNLS
+from .operators import Convolution
+from .sketching import fnnls_sketched
+from .sketching import sketch
+from .firstorder import apg_gram
+from .firstorder import cd_gram
+from .dispatch import solve
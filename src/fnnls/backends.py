@@ -0,0 +1,348 @@
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# Exit codes of the compiled loop, as exit reasons of SolverStats
+_EXIT_REASONS = ("converged", "all_passive", "stalled")
+
+
+def _resolve_backend(backend, ZTZ, engine=None, callback=None, upper=None, additions=1):
+    """
+    Resolve the backend argument of fnnls to "numpy" or "numba".
+
+    "auto" selects "numba" when numba is importable and the problem is
+    one the compiled loop handles, a dense ZTZ without an engine object,
+    a callback, upper bounds or multiple additions, and "numpy" otherwise.
+    """
+
+    if backend == "numpy":
+        return backend
+
+    if backend not in ("numba", "auto"):
+        raise ValueError("Expected backend to be \"numpy\", \"numba\" or \"auto\", but backend is {}".format(backend))
+
+    supported = (isinstance(ZTZ, np.ndarray) and callback is None and upper is None and additions == 1
+                 and (engine is None or isinstance(engine, str)))
+
+    if backend == "auto":
+        return "numba" if numba is not None and supported else "numpy"
+
+    if numba is None:
+        raise ImportError("backend=\"numba\" requires numba, which could not be imported")
+    if not supported:
+        raise ValueError("backend=\"numba\" only supports a dense ZTZ, without an engine object, a callback, upper bounds or additions")
+
+    return backend
+
+
+def _fnnls_numba(ZTZ, ZTx, P_initial, epsilon, workspace, stats=None):
+    """
+    The active set loop of _fnnls, run by the compiled kernel on the
+    arrays of workspace. lstsq and the engine are not used, the
+    least squares problems are solved with the Cholesky factorization
+    of the kernel.
+
+    Returns
+    -------
+    d, P, w, iterations:
+        See _fnnls.
+    """
+
+    P, current_P, d, s, w = workspace
+
+    ZTZ = np.ascontiguousarray(ZTZ)
+    ZTx = np.ascontiguousarray(ZTx, dtype=ZTZ.dtype)
+
+    iterations, inner_iterations, solves, exit_code = _active_set(
+        ZTZ, ZTx, np.asarray(P_initial, dtype=np.int64), ZTZ.dtype.type(epsilon * ZTZ.shape[0]),
+        ZTZ.dtype.type(epsilon), P, d, s, w)
+
+    if stats is not None:
+        stats.iterations += iterations
+        stats.inner_iterations += inner_iterations
+        stats.lstsq_calls += solves
+        stats.exit_reason = _EXIT_REASONS[exit_code]
+
+    return d, P, w, iterations
+
+
+def _jit(function):
+    """
+    Compile function with numba if it is available, leaving it as
+    plain Python otherwise so that the module can still be imported.
+    """
+
+    if numba is None:
+        return function
+
+    return numba.njit(cache=True, nogil=True)(function)
+
+
+@_jit
+def _factor_append(ZTZ, L, idx, k, j, epsilon):
+    """
+    Append index j, at position k, to the Cholesky factor L of
+    ZTZ[idx[:k]][:,idx[:k]], returning False if the new pivot is
+    not positive.
+    """
+
+    # Solve L r = ZTZ[idx[:k], j] into the new row of L
+    for a in range(k):
+        value = ZTZ[idx[a], j]
+        for b in range(a):
+            value -= L[a, b] * L[k, b]
+        L[k, a] = value / L[a, a]
+
+    rho = ZTZ[j, j]
+    for a in range(k):
+        rho -= L[k, a] * L[k, a]
+
+    if rho <= epsilon * (k + 1) * abs(ZTZ[j, j]) or rho <= 0:
+        return False
+
+    L[k, k] = np.sqrt(rho)
+    idx[k] = j
+
+    return True
+
+
+@_jit
+def _factor(ZTZ, L, idx, P, epsilon):
+    """
+    Factorize ZTZ[P][:,P] from scratch into L, with the indices of
+    P in ascending order in idx, returning the size of the factor,
+    or -1 if the block is singular.
+    """
+
+    k = 0
+
+    for j in range(P.shape[0]):
+        if P[j]:
+            if not _factor_append(ZTZ, L, idx, k, j, epsilon):
+                return -1
+            k += 1
+
+    return k
+
+
+@_jit
+def _solve(ZTZ, ZTx, L, idx, k, P, s):
+    """
+    Set s[P] to the solution of ZTZ[P][:,P] s = ZTx[P] with the
+    Cholesky factor L of the k indices idx, or with lstsq if the
+    factorization failed, k = -1, and s to zero outside of P.
+    """
+
+    for j in range(s.shape[0]):
+        s[j] = 0.
+
+    if k < 0:
+        index = np.flatnonzero(P)
+        A = np.empty((index.shape[0], index.shape[0]), dtype=ZTZ.dtype)
+        b = np.empty(index.shape[0], dtype=ZTZ.dtype)
+        for a in range(index.shape[0]):
+            b[a] = ZTx[index[a]]
+            for c in range(index.shape[0]):
+                A[a, c] = ZTZ[index[a], index[c]]
+        x = np.linalg.lstsq(A, b)[0]
+        for a in range(index.shape[0]):
+            s[index[a]] = x[a]
+        return
+
+    # Forward substitution L y = b, then back substitution L^T x = y,
+    # both in place in y
+    y = np.empty(k, dtype=ZTZ.dtype)
+
+    for a in range(k):
+        value = ZTx[idx[a]]
+        for b in range(a):
+            value -= L[a, b] * y[b]
+        y[a] = value / L[a, a]
+
+    for a in range(k - 1, -1, -1):
+        value = y[a]
+        for b in range(a + 1, k):
+            value -= L[b, a] * y[b]
+        y[a] = value / L[a, a]
+
+    for a in range(k):
+        s[idx[a]] = y[a]
+
+
+@_jit
+def _dual(ZTZ, ZTx, d, w):
+    """
+    Set w = ZTx - ZTZ*d in place.
+    """
+
+    n = d.shape[0]
+
+    for a in range(n):
+        value = ZTx[a]
+        for b in range(n):
+            if d[b] != 0.:
+                value -= ZTZ[a, b] * d[b]
+        w[a] = value
+
+
+@_jit
+def _infeasible(P, s, tolerance):
+    """
+    The C1 condition, some element of s in the passive set is
+    below the tolerance.
+    """
+
+    for j in range(P.shape[0]):
+        if P[j] and s[j] <= tolerance:
+            return True
+
+    return False
+
+
+@_jit
+def _active_set(ZTZ, ZTx, P_initial, tolerance, epsilon, P, d, s, w):
+    """
+    The whole active set loop of the Fast Non-negative Least Squares
+    Algorithm, with the same steps and tie breaking as _fnnls.
+
+    The passive set is kept as an ascending list of indices with the
+    Cholesky factor of its block of ZTZ, which is extended in place when
+    an index enters the passive set and recomputed when indices leave it.
+
+    Returns
+    -------
+    iterations, inner_iterations, solves, exit_code: int
+        The numbers of iterations of the outer and inner loops, of
+        least squares solves, and the index of the exit reason in
+        _EXIT_REASONS.
+    """
+
+    n = ZTZ.shape[0]
+    max_repetitions = 5
+
+    L = np.zeros((n, n), dtype=ZTZ.dtype)
+    idx = np.zeros(n, dtype=np.int64)
+    current_P = np.zeros(n, dtype=np.bool_)
+
+    # A1 + A2 + A3
+    for j in range(n):
+        P[j] = False
+        d[j] = 0.
+        s[j] = 0.
+    for a in range(P_initial.shape[0]):
+        P[P_initial[a]] = True
+
+    # A4
+    _dual(ZTZ, ZTx, d, w)
+
+    no_update = 0
+    iterations = 0
+    inner_iterations = 0
+    solves = 0
+    exit_code = 0
+
+    if P_initial.shape[0] != 0:
+
+        k = _factor(ZTZ, L, idx, P, epsilon)
+        _solve(ZTZ, ZTx, L, idx, k, P, s)
+        solves += 1
+
+        while _infeasible(P, s, tolerance):
+
+            for j in range(n):
+                if s[j] <= tolerance:
+                    P[j] = False
+                if not P[j]:
+                    s[j] = 0.
+
+            k = _factor(ZTZ, L, idx, P, epsilon)
+            _solve(ZTZ, ZTx, L, idx, k, P, s)
+            solves += 1
+
+        for j in range(n):
+            d[j] = s[j]
+        _dual(ZTZ, ZTx, d, w)
+
+    k = _factor(ZTZ, L, idx, P, epsilon)
+
+    while True:
+
+        # B1, with B2 + B3 breaking ties on the first index like np.argmax
+        best = -1
+        for j in range(n):
+            if not P[j] and w[j] > tolerance and (best < 0 or w[j] > w[best]):
+                best = j
+
+        if best < 0:
+            exit_code = 1
+            for j in range(n):
+                if not P[j]:
+                    exit_code = 0
+            break
+
+        iterations += 1
+
+        for j in range(n):
+            current_P[j] = P[j]
+
+        P[best] = True
+
+        # The new index is appended to the factor if it is the largest
+        # in the passive set, which keeps idx ascending, and the factor
+        # is recomputed otherwise
+        if k >= 0 and (k == 0 or idx[k - 1] < best):
+            if _factor_append(ZTZ, L, idx, k, best, epsilon):
+                k += 1
+            else:
+                k = -1
+        else:
+            k = _factor(ZTZ, L, idx, P, epsilon)
+
+        # B4
+        _solve(ZTZ, ZTx, L, idx, k, P, s)
+        solves += 1
+
+        # C1
+        while _infeasible(P, s, tolerance):
+
+            # C2
+            alpha = np.inf
+            for j in range(n):
+                if P[j] and s[j] <= tolerance:
+                    ratio = d[j] / (d[j] - s[j])
+                    if ratio < alpha:
+                        alpha = ratio
+
+            # C3 + C4
+            for j in range(n):
+                d[j] += alpha * (s[j] - d[j])
+                if d[j] <= tolerance:
+                    P[j] = False
+
+            # C5 + C6
+            k = _factor(ZTZ, L, idx, P, epsilon)
+            _solve(ZTZ, ZTx, L, idx, k, P, s)
+            solves += 1
+            inner_iterations += 1
+
+        # B5 + B6
+        for j in range(n):
+            d[j] = s[j]
+        _dual(ZTZ, ZTx, d, w)
+
+        unchanged = True
+        for j in range(n):
+            if current_P[j] != P[j]:
+                unchanged = False
+
+        no_update = no_update + 1 if unchanged else 0
+
+        if no_update >= max_repetitions:
+            exit_code = 2
+            break
+
+    return iterations, inner_iterations, solves, exit_code
@@ -0,0 +1,441 @@
+import numpy as np
+from scipy import sparse
+
+from .fnnls import _fnnls, _workspace, _residual, _check_P_initial
+from .engines import CholeskyEngine
+from .gram import gram, _block, _penalize
+
+
+def fnnls_batch(Z, X, P_initial = np.zeros(0, dtype=int),
+         lstsq = lambda A, x: np.linalg.inv(A).dot(x),
+         epsilon=None, engine=None, full_output=False, l1=0, l2=0, weights=None):
+    """
+    Solve many nonnegative least squares problems that share the
+    same matrix Z, min_D ||X - ZD|| subject to D >= 0, in one call.
+
+    Every column of X is solved with the Fast Non-negative Least
+    Squares algorithm of Bro and De Jong, but all columns advance
+    together: ZTZ is formed once, ZTX is formed with a single matrix
+    product, and at each step the columns that share the same passive
+    set are grouped so that every distinct system ZTZ[P][:,P] is
+    solved only once for all of them, in the style of the combinatorial
+    NNLS algorithm of Van Benthem and Keenan.
+
+    Parameters
+    ----------
+    Z: NumPy array or scipy.sparse matrix
+        Z is an m x n matrix.
+
+    X: Numpy array
+        X is an m x k matrix, each column is a right hand side.
+
+    P_initial: Numpy array, dtype=int or bool
+        By default, an empty array. An estimate for the indices
+        of the support of the solution, shared by every column,
+        or an n x k boolean matrix with an estimate of the support
+        of every column, such as the "P" returned by full_output.
+
+    lstsq: function
+        By default, the inverse of A multiplied by b.
+        Least squares function to use when calculating the
+        least squares solution min_x ||Ax - B||, where B
+        has one column per right hand side.
+        Must be of the form x = f(A,B).
+
+    epsilon: float
+        By default, it is the machine epsilon of the floating point
+        type of Z and X, the numerical tolerance
+
+    engine: str or object, optional
+        By default, None. See fnnls. Here, a FactorCache is
+        the most useful engine, since the passive sets of
+        different columns often recur.
+
+    full_output: bool, optional
+        By default, False. If True, also return a dictionary with
+        the final passive sets as an n x k boolean matrix under "P",
+        the dual vectors ZTX - ZTZ*D under "w", and the number of
+        iterations of the outer loop for every column under "iterations".
+
+    l1, l2: float, optional
+        By default, 0. The weights of the penalties l1*1^T*d and
+        l2*||d||^2 added to every column, see fnnls.
+
+    weights: Numpy array, optional
+        By default, None. A vector of length m of nonnegative
+        weights of the observations, shared by every column,
+        see fnnls.
+
+    Returns
+    -------
+    D: Numpy array
+        D is an n x k matrix
+    res: Numpy array
+        res is a vector of length k with the residual
+        ||x - Zd|| of every column
+    info: dict
+        Only returned if full_output is True.
+    """
+
+    Z, X, P_initial = _check(Z, X, P_initial, per_column=True)
+
+    # Calculating ZTZ and ZTX in advance, ZTX is a single matrix product
+    ZTZ, ZTX = gram(Z, X, weights=weights)
+    ZTZ, ZTX = _penalize(ZTZ, ZTX, l1, l2)
+
+    D, P, W, iterations = _fnnls_batch(ZTZ, ZTX, P_initial, lstsq, epsilon, engine)
+
+    res = _residual(Z, X, D, weights)  #Calculate residual loss ||x - Zd|| per column
+
+    if full_output:
+        return [D, res, {"P": P, "w": W, "iterations": iterations}]
+
+    return [D, res]
+
+
+def fnnls_sequence(Z, X, P_initial = np.zeros(0, dtype=int),
+         lstsq = lambda A, x: np.linalg.inv(A).dot(x),
+         epsilon=None, engine=None, full_output=False, l1=0, l2=0, weights=None):
+    """
+    Solve a sequence of related nonnegative least squares problems
+    that share the same matrix Z, min_d ||x_j - Zd|| subject to d >= 0
+    for the columns x_1, x_2, ... of X in order, such as the consecutive
+    frames of a signal.
+
+    ZTZ is formed once, and each problem is warm started from the final
+    passive set of the previous one, so that when consecutive solutions
+    share most of their support only a few iterations are needed. With
+    engine="cholesky", the factorization is also carried from one
+    problem to the next.
+
+    Parameters
+    ----------
+    Z: NumPy array or scipy.sparse matrix
+        Z is an m x n matrix.
+
+    X: Numpy array
+        X is an m x k matrix, with the right hand sides in order.
+
+    P_initial: Numpy array, dtype=int
+        By default, an empty array. An estimate for the indices
+        of the support of the solution for the first column.
+
+    lstsq: function
+        By default, the inverse of A multiplied by b.
+        Least squares function to use when calculating the
+        least squares solution min_x ||Ax - b||.
+        Must be of the form x = f(A,b).
+
+    epsilon: float
+        By default, it is the machine epsilon of the floating point
+        type of Z and X, the numerical tolerance
+
+    engine: str or object, optional
+        By default, None. See fnnls.
+
+    full_output: bool, optional
+        By default, False. If True, also return a dictionary with
+        the final passive set of the last column as an array of
+        indices under "P", and the number of iterations of the
+        outer loop for every column under "iterations".
+
+    l1, l2: float, optional
+        By default, 0. The weights of the penalties, see fnnls.
+
+    weights: Numpy array, optional
+        By default, None. A vector of length m of nonnegative
+        weights of the observations, shared by every column,
+        see fnnls.
+
+    Returns
+    -------
+    D: Numpy array
+        D is an n x k matrix
+    res: Numpy array
+        res is a vector of length k with the residual
+        ||x - Zd|| of every column
+    info: dict
+        Only returned if full_output is True.
+    """
+
+    Z, X, P_initial = _check(Z, X, P_initial)
+
+    n = Z.shape[1]
+    k = X.shape[1]
+
+    ZTZ, ZTX = gram(Z, X, weights=weights)
+    ZTZ, ZTX = _penalize(ZTZ, ZTX, l1, l2)
+
+    if epsilon is None:
+        epsilon = np.finfo(ZTZ.dtype).eps
+
+    if engine == "cholesky":
+        engine = CholeskyEngine(epsilon)
+
+    D = np.zeros((n, k), dtype=ZTZ.dtype)
+    iterations = np.zeros(k, dtype=int)
+
+    # The workspace and the engine are shared by the whole sequence
+    workspace = _workspace(n, ZTZ.dtype)
+
+    for j in range(k):
+
+        d, P, w, iterations[j] = _fnnls(ZTZ, ZTX[:, j], P_initial, lstsq, epsilon, engine, workspace)
+
+        D[:, j] = d
+
+        # Warm start the next problem from this support
+        P_initial = np.flatnonzero(P)
+
+    res = _residual(Z, X, D, weights)
+
+    if full_output:
+        return [D, res, {"P": P_initial, "iterations": iterations}]
+
+    return [D, res]
+
+
+def _check(Z, X, P_initial, per_column=False):
+    """
+    Validate the matrices Z and X, and an estimate
+    of the support, for the multiple right hand side
+    solvers, which is an n x k boolean matrix of
+    supports of every column if per_column is True.
+    """
+
+    if sparse.issparse(Z):
+        np.asarray_chkfinite(Z.data)
+        X, P_initial = map(np.asarray_chkfinite, (X, P_initial))
+    else:
+        Z, X, P_initial = map(np.asarray_chkfinite, (Z, X, P_initial))
+
+    if len(Z.shape) != 2:
+        raise ValueError("Expected a two-dimensional array, but Z is of shape {}".format(Z.shape))
+    if len(X.shape) != 2:
+        raise ValueError("Expected a two-dimensional array, but X is of shape {}".format(X.shape))
+    if X.shape[0] != Z.shape[0]:
+        raise ValueError("Incompatable dimensions. The first dimension of Z should match the first dimension of X, but Z is of shape {} and X is of shape {}".format(Z.shape, X.shape))
+
+    if per_column and len(P_initial.shape) == 2:
+        if P_initial.shape != (Z.shape[1], X.shape[1]):
+            raise ValueError("Incompatable dimensions. Expected P_initial of shape {}, but P_initial is of shape {}".format((Z.shape[1], X.shape[1]), P_initial.shape))
+        if P_initial.dtype != np.dtype(bool):
+            raise TypeError("Expected type bool for a two-dimensional P_initial, but P_initial is type {}".format(P_initial.dtype))
+
+        return Z, X, P_initial
+
+    if len(P_initial.shape) != 1:
+        raise ValueError("Expected a one-dimensional array, but P_initial is of shape {}".format(P_initial.shape))
+
+    _check_P_initial(P_initial, Z.shape[1])
+
+    return Z, X, P_initial
+
+
+def _fnnls_batch(ZTZ, ZTX, P_initial, lstsq, epsilon, engine=None):
+    """
+    The active set loop of fnnls_batch, run on every column of
+    ZTX at once.
+
+    The steps mirror the ones of fnnls, but operate on an n x k
+    boolean matrix P of passive sets, which starts from P_initial,
+    either indices shared by every column or an n x k boolean
+    matrix of passive sets. Columns that have converged
+    are dropped from the working set so that later iterations
+    only touch the columns that still need work.
+
+    Returns
+    -------
+    D: Numpy array
+        D is an n x k matrix
+    P: Numpy array, dtype=bool
+        The n x k matrix of final passive sets
+    W: Numpy array
+        The n x k matrix of final dual vectors ZTX - ZTZ*D
+    iterations: Numpy array, dtype=int
+        The number of iterations of the outer loop for every column
+    """
+
+    n, k = ZTX.shape
+
+    if epsilon is None:
+        epsilon = np.finfo(ZTZ.dtype).eps
+
+    if engine == "cholesky":
+        engine = CholeskyEngine(epsilon)
+
+    # Declaring constants for tolerance and max repetitions
+    tolerance = epsilon * n
+    max_repetitions = 5
+
+    # A1 + A2
+    P = np.zeros((n, k), dtype=bool)
+    if len(P_initial.shape) == 2:
+        P[:] = P_initial
+    else:
+        P[P_initial] = True
+
+    # A3
+    D = np.zeros((n, k), dtype=ZTZ.dtype)
+
+    # Initialize S
+    S = np.zeros((n, k), dtype=ZTZ.dtype)
+
+    # A4
+    W = ZTX - ZTZ @ D
+
+    # Count of amount of consecutive times each passive set has remained unchanged
+    no_update = np.zeros(k, dtype=int)
+
+    # Number of iterations of the outer loop for every column
+    iterations = np.zeros(k, dtype=int)
+
+    # Extra step in case a support is set to update S and D
+    if P.any():
+
+        cols = np.arange(k)
+        S = _solve_grouped(ZTZ, ZTX, P, cols, lstsq, engine)
+
+        # Drop the indices of the estimate where s is not positive until
+        # it is, so that D starts feasible and W is computed at D
+        infeasible = cols[_infeasible(P, S, tolerance)]
+
+        while infeasible.shape[0] != 0:
+
+            P[:, infeasible] &= ~(S[:, infeasible] <= tolerance)
+            S[:, infeasible] = _solve_grouped(ZTZ, ZTX, P, infeasible, lstsq, engine)
+
+            infeasible = infeasible[_infeasible(P[:, infeasible], S[:, infeasible], tolerance)]
+
+        D = S.copy()
+        W = ZTX - ZTZ @ D
+
+    # B1
+    # Columns that still have a positive entry of w in their active set
+    cols = np.flatnonzero(_unconverged(P, W, tolerance))
+
+    while cols.shape[0] != 0:
+
+        iterations[cols] += 1
+
+        current_P = P[:, cols] # Fancy indexing makes a copy to check for change
+
+        # B2 + B3
+        # Move the element in each active set with largest value
+        # of w into the passive set
+        P[np.argmax(np.where(current_P, -np.inf, W[:, cols]), axis=0), cols] = True
+
+        # B4
+        S[:, cols] = _solve_grouped(ZTZ, ZTX, P, cols, lstsq, engine)
+
+        # C1
+        # Columns with an element of the passive set below the tolerance
+        infeasible = cols[_infeasible(P[:, cols], S[:, cols], tolerance)]
+
+        while infeasible.shape[0] != 0:
+
+            # C2
+            q = P[:, infeasible] & (S[:, infeasible] <= tolerance)
+            Dq = D[:, infeasible]
+            Sq = S[:, infeasible]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                alpha = np.nanmin(np.where(q, Dq / (Dq - Sq), np.nan), axis=0)
+
+            # C3
+            D[:, infeasible] = Dq + alpha * (Sq - Dq)
+
+            # C4
+            P[:, infeasible] &= ~(D[:, infeasible] <= tolerance)
+
+            # C5 + C6
+            S[:, infeasible] = _solve_grouped(ZTZ, ZTX, P, infeasible, lstsq, engine)
+
+            infeasible = infeasible[_infeasible(P[:, infeasible], S[:, infeasible], tolerance)]
+
+        # B5
+        D[:, cols] = S[:, cols]
+        # B6
+        W[:, cols] = ZTX[:, cols] - ZTZ @ D[:, cols]
+
+        # Check if there has been a change to each passive set
+        unchanged = np.all(current_P == P[:, cols], axis=0)
+        no_update[cols] = np.where(unchanged, no_update[cols] + 1, 0)
+
+        cols = cols[_unconverged(P[:, cols], W[:, cols], tolerance) & (no_update[cols] < max_repetitions)]
+
+    return D, P, W, iterations
+
+
+def _unconverged(P, W, tolerance):
+    """
+    Check the B1 condition on every column, the passive set is not
+    full and some element of w in the active set is above the tolerance.
+    """
+
+    return np.any(~P & (W > tolerance), axis=0)
+
+
+def _infeasible(P, S, tolerance):
+    """
+    Check the C1 condition on every column, some element of s in
+    the passive set is below the tolerance.
+    """
+
+    return np.any(P & (S <= tolerance), axis=0)
+
+
+def _solve_grouped(ZTZ, ZTX, P, cols, lstsq, engine=None):
+    """
+    Solve the unconstrained least squares problem along the passive set
+    of every column in cols, solving each distinct passive set only once.
+
+    Parameters
+    ----------
+    ZTZ: NumPy array
+        ZTZ is an n x n matrix equal to Z.T * Z
+
+    ZTX: Numpy array
+        ZTX is an n x k matrix equal to Z.T * X
+
+    P: Numpy array, dtype=bool
+        The n x k matrix of passive sets.
+
+    cols: Numpy array, dtype=int
+        The columns to solve for.
+
+    lstsq: function
+        Least squares function of the form x = f(A,B).
+
+    engine: object, optional
+        By default, None. An object with a method
+        S = solve(ZTZ, P, ZTX[P]) to use in place of lstsq.
+
+    Returns
+    -------
+    S: Numpy array
+        An n x len(cols) matrix with the least squares solutions
+        along each passive set, and zeros outside of it.
+    """
+
+    S = np.zeros((ZTZ.shape[0], cols.shape[0]), dtype=ZTZ.dtype)
+
+    # Group the columns by passive set, sorting the group labels
+    # lets us split the columns into contiguous runs
+    groups, labels = np.unique(P[:, cols].T, axis=0, return_inverse=True)
+    labels = labels.ravel()
+    order = np.argsort(labels, kind='stable')
+    starts = np.cumsum(np.bincount(labels, minlength=groups.shape[0]))[:-1]
+
+    for p, members in zip(groups, np.split(order, starts)):
+
+        idx = np.flatnonzero(p)
+
+        if idx.shape[0] == 0:
+            continue
+
+        if engine is None:
+            S[idx[:, None], members] = lstsq(_block(ZTZ, idx, idx), ZTX[idx[:, None], cols[members]])
+        else:
+            S[idx[:, None], members] = engine.solve(ZTZ, p, ZTX[idx[:, None], cols[members]])
+
+    return S
@@ -0,0 +1,249 @@
+import numpy as np
+from scipy import sparse
+
+from .fnnls import fnnls_gram, _residual
+from .batch import _check
+from .gram import gram, _check_weights
+from .firstorder import apg_gram, cd_gram
+
+
+# The fastest method, with polish, for problems with n columns and a
+# solution with a fraction support of nonzero entries, for a nonnegative
+# or a signed Z, dense or sparse. Measured with
+#     python src/test/benchmark.py calibrate
+# and used for the nearest entry by log(n) and support.
+_CALIBRATION = [
+    # nonnegative, sparse, n, support, method
+    (True, False, 100, 0.18, "fnnls"),
+    (True, False, 100, 0.54, "fnnls"),
+    (True, False, 100, 0.96, "apg"),
+    (True, False, 300, 0.2, "fnnls"),
+    (True, False, 300, 0.54, "apg"),
+    (True, False, 300, 0.95, "apg"),
+    (True, False, 1000, 0.16, "fnnls"),
+    (True, False, 1000, 0.56, "apg"),
+    (True, False, 1000, 0.96, "apg"),
+    (True, True, 100, 0.34, "apg"),
+    (True, True, 100, 0.59, "apg"),
+    (True, True, 100, 0.94, "apg"),
+    (True, True, 300, 0.2, "apg"),
+    (True, True, 300, 0.54, "apg"),
+    (True, True, 300, 0.95, "apg"),
+    (True, True, 1000, 0.19, "cd"),
+    (True, True, 1000, 0.53, "apg"),
+    (True, True, 1000, 0.94, "apg"),
+    (False, False, 100, 0.44, "apg"),
+    (False, False, 100, 0.57, "apg"),
+    (False, False, 100, 0.96, "apg"),
+    (False, False, 300, 0.5, "apg"),
+    (False, False, 300, 0.62, "apg"),
+    (False, False, 300, 0.95, "apg"),
+    (False, False, 1000, 0.53, "apg"),
+    (False, False, 1000, 0.66, "apg"),
+    (False, False, 1000, 0.96, "apg"),
+    (False, True, 100, 0.56, "apg"),
+    (False, True, 100, 0.71, "apg"),
+    (False, True, 100, 0.94, "apg"),
+    (False, True, 300, 0.5, "apg"),
+    (False, True, 300, 0.66, "apg"),
+    (False, True, 300, 0.95, "apg"),
+    (False, True, 1000, 0.54, "apg"),
+    (False, True, 1000, 0.61, "apg"),
+    (False, True, 1000, 0.95, "apg"),
+]
+
+_METHODS = ("fnnls", "apg", "cd")
+
+
+def solve(Z, x, method="auto", polish=True, support=None, tol=1e-6, max_iterations=None,
+          lstsq = lambda A, x: np.linalg.inv(A).dot(x),
+          epsilon=None, engine=None, full_output=False, l1=0, l2=0, weights=None):
+    """
+    Solve min_d ||x - Zd|| subject to d >= 0, or its penalized form
+    as in fnnls, with the active set algorithm of fnnls or one of the
+    first order methods apg_gram and cd_gram, all of them run on the
+    same Gram quantities ZTZ and ZTx.
+
+    fnnls solves a least squares problem along the passive set at every
+    iteration, whose cost grows with the cube of the support of the
+    solution, while the first order methods only take products with
+    ZTZ, but need more iterations the worse ZTZ is conditioned. With
+    method "auto", the method is taken from a calibration table of the
+    fastest one on benchmark problems, by n, the fraction of nonzero
+    entries of the solution, whether Z is nonnegative, whose columns
+    are then strongly correlated and ZTZ poorly conditioned, and
+    whether Z is sparse.
+
+    Parameters
+    ----------
+    Z: NumPy array or scipy.sparse matrix
+        Z is an m x n matrix.
+
+    x: Numpy array
+        x is a m x 1 vector.
+
+    method: str, optional
+        By default, "auto". One of "fnnls", "apg", "cd" or "auto".
+
+    polish: bool, optional
+        By default, True. Whether to finish a first order method with
+        fnnls, warm started from its passive set, which gives the exact
+        solution, usually in a few iterations.
+
+    support: int, optional
+        By default, None. The expected number of nonzero entries of
+        the solution, for method "auto". By default, it is estimated
+        with 20 iterations of apg_gram, which are then continued if
+        apg_gram is selected. The estimate runs high on a nonnegative
+        Z, for which fnnls is selected, so fnnls is then started from
+        an empty passive set rather than from it. Below the smallest
+        n at which the calibration table has a method other than
+        fnnls, fnnls is taken without an estimate.
+
+    tol: float, optional
+        By default, 1e-6. The tolerance of the first order
+        methods, see apg_gram.
+
+    max_iterations: int, optional
+        By default, None, the default of the first order method.
+
+    lstsq: function
+        By default, the inverse of A multiplied by b.
+        Least squares function to use when calculating the
+        least squares solution min_x ||Ax - b||.
+        Must be of the form x = f(A,b).
+
+    epsilon: float
+        By default, it is the machine epsilon of the floating point
+        type of Z and x, the numerical tolerance
+
+    engine: str or object, optional
+        By default, None. See fnnls.
+
+    full_output: bool, optional
+        By default, False. If True, also return a dictionary with the
+        final passive set under "P", the dual vector under "w", the
+        number of iterations under "iterations", as in fnnls, of
+        fnnls if it was run and of the first order method otherwise,
+        the method under "method" and, for a first order method,
+        its number of iterations under "first_order_iterations".
+
+    l1, l2: float, optional
+        By default, 0. The weights of the penalties, see fnnls.
+
+    weights: Numpy array, optional
+        By default, None. A vector of length m of nonnegative
+        weights of the observations, see fnnls.
+
+    Returns
+    -------
+    d: Numpy array
+        d is a nx1 vector
+    res: float
+        The residual ||x - Zd||, without the penalties, and
+        weighted as ||sqrt(W)(x - Zd)|| with weights
+    info: dict
+        Only returned if full_output is True.
+    """
+
+    x = np.asarray_chkfinite(x)
+
+    if len(x.shape) != 1:
+        raise ValueError("Expected a one-dimensional array, but x is of shape {}".format(x.shape))
+    if method not in _METHODS + ("auto",):
+        raise ValueError("Expected method to be \"fnnls\", \"apg\", \"cd\" or \"auto\", but method is {}".format(method))
+
+    Z, _, _ = _check(Z, x[:, None], np.zeros(0, dtype=int))
+
+    m, n = Z.shape
+
+    if weights is not None:
+        weights = _check_weights(weights, m)
+
+    ZTZ, ZTx = gram(Z, x, weights=weights)
+
+    d = None
+
+    if method == "auto":
+
+        # Estimate the support from the first iterations of apg_gram
+        if support is None and n >= _smallest():
+            d, _, info = apg_gram(ZTZ, ZTx, tol=tol, max_iterations=20, full_output=True, l1=l1, l2=l2)
+            support = info["P"].shape[0]
+
+            if info["converged"]:
+                method = "apg"
+
+        if method == "auto":
+            method = _select(n, support, _nonnegative(Z), sparse.issparse(Z))
+
+    info = {}
+    first_order_iterations = None
+
+    if method != "fnnls":
+
+        kwargs = {} if max_iterations is None else {"max_iterations": max_iterations}
+        first_order = apg_gram if method == "apg" else cd_gram
+
+        d, _, info = first_order(ZTZ, ZTx, d_initial=d, tol=tol, full_output=True, l1=l1, l2=l2, **kwargs)
+        first_order_iterations = info["iterations"]
+
+    if method == "fnnls" or polish:
+        P_initial = np.zeros(0, dtype=int) if method == "fnnls" else info["P"]
+
+        try:
+            d, _, info = fnnls_gram(ZTZ, ZTx, None, P_initial, lstsq, epsilon, engine, full_output=True, l1=l1, l2=l2)
+        except np.linalg.LinAlgError:
+            # A first order solution can be nonzero on linearly dependent
+            # columns, whose passive set fnnls cannot start from
+            if not P_initial.shape[0]:
+                raise
+            d, _, info = fnnls_gram(ZTZ, ZTx, None, np.zeros(0, dtype=int), lstsq, epsilon, engine,
+                                    full_output=True, l1=l1, l2=l2)
+
+    res = _residual(Z, x, d, weights)  #Calculate residual loss ||x - Zd||
+
+    if full_output:
+        info = {key: info[key] for key in ("P", "w", "iterations")}
+        info.update(method=method)
+        if first_order_iterations is not None:
+            info.update(first_order_iterations=first_order_iterations)
+        return [d, res, info]
+
+    return [d, res]
+
+
+def _select(n, support, nonnegative, is_sparse):
+    """
+    The method of the calibration entry nearest to a problem, by
+    log(n) and the fraction of nonzero entries of the solution,
+    among the entries of the same kind of Z.
+    """
+
+    fraction = 1. if support is None else support / max(n, 1)
+
+    entries = [entry for entry in _CALIBRATION if entry[:2] == (nonnegative, is_sparse)] or _CALIBRATION
+
+    if not entries or n < _smallest():
+        return "fnnls"
+
+    distance = lambda entry: (np.log10(entry[2] / n)) ** 2 + (entry[3] - fraction) ** 2
+
+    return min(entries, key=distance)[4]
+
+
+def _smallest():
+    """
+    The smallest n of the calibration table at which a method other
+    than fnnls is the fastest, below which fnnls is always taken.
+    """
+
+    return min([entry[2] for entry in _CALIBRATION if entry[4] != "fnnls"], default=np.inf)
+
+
+def _nonnegative(Z):
+    """
+    Whether every entry of Z is nonnegative.
+    """
+
+    return bool((Z.data if sparse.issparse(Z) else Z).min(initial=0) >= 0)
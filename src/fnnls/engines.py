@@ -0,0 +1,295 @@
+from collections import OrderedDict
+
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, solve_triangular
+
+from .gram import _block
+
+
+class CholeskyEngine():
+    """
+    Solves the least squares problems along the passive set of fnnls
+    by maintaining a Cholesky factorization of the passive set block
+    of ZTZ across iterations.
+
+    Rather than factorizing ZTZ[P][:,P] from scratch at every step,
+    the factor R, with ZTZ[P][:,P] = R^T R, is updated by appending a
+    row and column when an index enters the passive set and downdated
+    with Givens rotations when an index leaves it. Each change of the
+    passive set, and each solve, then costs O(|P|^2) instead of O(|P|^3).
+
+    An engine holds the factorization of the last passive set it has
+    solved for, so an engine reused for a new problem on the same Z
+    with a similar support, for example one warm started with P_initial,
+    only updates the indices that differ. It must not be shared between
+    problems with different matrices Z.
+
+    Parameters
+    ----------
+    epsilon: float
+        By default, it is np.finfo(float).eps. Relative tolerance
+        below which a new pivot of the factorization is considered
+        to be zero, in which case the passive set block is singular
+        and the engine falls back to numpy.linalg.lstsq.
+    """
+
+    def __init__(self, epsilon=np.finfo(float).eps):
+
+        self.epsilon = epsilon
+
+        self._R = None
+        self._index = []
+        self._mask = None
+
+    def reset(self, n, dtype=float):
+        """
+        Clear the factorization for a Gram matrix of size n x n.
+        Space for the factor is allocated as the passive set grows,
+        so that it stays proportional to the passive set rather
+        than to n when n is large.
+
+        Parameters
+        ----------
+        n: int
+            The number of columns of Z.
+
+        dtype: data-type, optional
+            By default, float. The floating point type of ZTZ.
+        """
+
+        self._R = np.zeros((min(n, 64), min(n, 64)), dtype=dtype)
+        self._index = []
+        self._mask = np.zeros(n, dtype=bool)
+
+    def solve(self, ZTZ, P, b):
+        """
+        Solve ZTZ[P][:,P] s = b, updating the factorization
+        to the passive set P first.
+
+        Parameters
+        ----------
+        ZTZ: NumPy array
+            ZTZ is an n x n matrix equal to Z.T * Z
+
+        P: Numpy array, dtype=bool
+            The current passive set.
+
+        b: Numpy array
+            The right hand side along the passive set, b = ZTx[P].
+            It may also have one column per right hand side.
+
+        Returns
+        -------
+        s: Numpy array
+            The solution along the passive set, in the same
+            order as b.
+        """
+
+        n = ZTZ.shape[0]
+
+        # Start over when nothing of the previous factorization is kept,
+        # as happens when an engine is reused for a new problem
+        if self._R is None or self._mask.shape[0] != n or self._R.dtype != ZTZ.dtype or not np.any(P & self._mask):
+            self.reset(n, ZTZ.dtype)
+
+        # Downdate the indices that left the passive set
+        for j in np.flatnonzero(self._mask & ~P):
+            self._remove(j)
+
+        # Update with the indices that entered the passive set
+        for j in np.flatnonzero(P & ~self._mask):
+
+            if not self._add(ZTZ, j):
+
+                # The block is singular, start over with a
+                # fresh factorization at the next call
+                self.reset(n, ZTZ.dtype)
+                idx = np.flatnonzero(P)
+                return np.linalg.lstsq(_block(ZTZ, idx, idx), b, rcond=None)[0]
+
+        k = len(self._index)
+        R = self._R[:k, :k]
+
+        # Position in b of each index, in the order of the factorization
+        pos = np.searchsorted(np.flatnonzero(P), self._index)
+
+        s = np.empty(b.shape, dtype=R.dtype)
+        s[pos] = solve_triangular(R, solve_triangular(R, b[pos], trans='T'))
+
+        return s
+
+    def _add(self, ZTZ, j):
+        """
+        Append index j to the factorization, returning False if the
+        new pivot is not positive.
+        """
+
+        k = len(self._index)
+
+        # Double the space for the factor when it is full
+        if k == self._R.shape[0]:
+            size = min(2 * k, self._mask.shape[0])
+            R = np.zeros((size, size), dtype=self._R.dtype)
+            R[:k, :k] = self._R
+            self._R = R
+
+        R = self._R
+
+        r = solve_triangular(R[:k, :k], _block(ZTZ, self._index, [j])[:, 0], trans='T')
+        rho = ZTZ[j, j] - r @ r
+
+        if rho <= self.epsilon * k * abs(ZTZ[j, j]) or rho <= 0:
+            return False
+
+        R[:k, k] = r
+        R[k, k] = np.sqrt(rho)
+
+        self._index.append(j)
+        self._mask[j] = True
+
+        return True
+
+    def _remove(self, j):
+        """
+        Remove index j from the factorization.
+        """
+
+        pos = self._index.index(j)
+        k = len(self._index)
+        R = self._R
+
+        # Deleting the column leaves an upper Hessenberg matrix
+        R[:k, pos:k-1] = R[:k, pos+1:k]
+
+        # Restore the triangular form with Givens rotations
+        for i in range(pos, k-1):
+
+            a, b = R[i, i], R[i+1, i]
+            r = np.hypot(a, b)
+
+            if r == 0:
+                continue
+
+            c, s = a / r, b / r
+            top = R[i, i:k-1].copy()
+            R[i, i:k-1] = c * top + s * R[i+1, i:k-1]
+            R[i+1, i:k-1] = c * R[i+1, i:k-1] - s * top
+            R[i+1, i] = 0
+
+        R[k-1, :k] = 0
+        R[:k, k-1] = 0
+
+        del self._index[pos]
+        self._mask[j] = False
+
+
+class FactorCache():
+    """
+    A bounded least recently used cache of Cholesky factorizations of
+    the passive set blocks ZTZ[P][:,P], keyed by the passive set P.
+
+    When many related problems on the same Z are solved, the same
+    passive sets tend to recur, and with a cache each of them is
+    factorized only once, later solves reducing to two triangular
+    solves. A cache can be given as the engine of fnnls, fix_constraint,
+    fnnls_batch or NNLSSolver, and shared across calls, but only between
+    problems with the same matrix Z, since the key does not depend on ZTZ.
+
+    Parameters
+    ----------
+    maxsize: int, optional
+        By default, 1024. The maximum number of factorizations kept.
+
+    max_bytes: int, optional
+        By default, 2**28 (256 MiB). The maximum total size
+        of the factorizations kept.
+
+    Attributes
+    ----------
+    hits: int
+        The number of solves that reused a cached factorization.
+
+    misses: int
+        The number of solves that had to factorize.
+
+    nbytes: int
+        The total size of the factorizations currently kept.
+    """
+
+    def __init__(self, maxsize=1024, max_bytes=2**28):
+
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+
+        self._factors = OrderedDict()
+
+    def __len__(self):
+
+        return len(self._factors)
+
+    def clear(self):
+        """
+        Remove every factorization from the cache, keeping the counters.
+        """
+
+        self._factors.clear()
+        self.nbytes = 0
+
+    def solve(self, ZTZ, P, b):
+        """
+        Solve ZTZ[P][:,P] s = b, with the cached factorization
+        of the passive set P if there is one.
+
+        Parameters
+        ----------
+        ZTZ: NumPy array
+            ZTZ is an n x n matrix equal to Z.T * Z
+
+        P: Numpy array, dtype=bool
+            The current passive set.
+
+        b: Numpy array
+            The right hand side along the passive set, b = ZTx[P].
+            It may also have one column per right hand side.
+
+        Returns
+        -------
+        s: Numpy array
+            The solution along the passive set.
+        """
+
+        key = (P.shape[0], np.packbits(P).tobytes())
+        factor = self._factors.get(key)
+
+        if factor is not None:
+
+            self.hits += 1
+            self._factors.move_to_end(key)
+
+            return cho_solve(factor, b)
+
+        self.misses += 1
+
+        idx = np.flatnonzero(P)
+        A = _block(ZTZ, idx, idx)
+
+        try:
+            factor = cho_factor(A)
+        except np.linalg.LinAlgError:
+            # The block is singular, solve it without caching
+            return np.linalg.lstsq(A, b, rcond=None)[0]
+
+        self._factors[key] = factor
+        self.nbytes += factor[0].nbytes
+
+        # Evict the least recently used factorizations
+        while len(self._factors) > self.maxsize or self.nbytes > self.max_bytes:
+
+            _, (c, _) = self._factors.popitem(last=False)
+            self.nbytes -= c.nbytes
+
+        return cho_solve(factor, b)
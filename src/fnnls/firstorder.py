@@ -0,0 +1,343 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import eigsh, LinearOperator
+
+from .gram import _float_dtype, _matvec
+
+
+def apg_gram(ZTZ, ZTx, xTx=None, d_initial=None, tol=1e-6, max_iterations=10000,
+             full_output=False, l1=0, l2=0):
+    """
+    Accelerated projected gradient descent for the nonnegative least
+    squares problem, run on the precomputed quantities ZTZ = Z^T*Z and
+    ZTx = Z^T*x, as fnnls_gram.
+
+    Every iteration is a gradient step of length 1/L from an
+    extrapolated point, for L the largest eigenvalue of ZTZ, projected
+    onto d >= 0, with the momentum of Nesterov restarted whenever it
+    points uphill. An iteration costs a single product with ZTZ, so
+    that for large n and a solution with many nonzero entries, an
+    approximate solution costs much less than the passive set solves
+    of fnnls. The number of iterations grows with the square root of
+    the condition number of ZTZ.
+
+    Parameters
+    ----------
+    ZTZ: NumPy array, scipy.sparse matrix or operator
+        ZTZ is an n x n matrix equal to Z.T * Z
+
+    ZTx: Numpy array
+        ZTx is an n x 1 vector equal to Z.T * x
+
+    xTx: float, optional
+        By default, None. The squared norm of x, x.T * x,
+        which is needed to compute the residual.
+
+    d_initial: Numpy array, optional
+        By default, the zero vector. The first iterate, projected
+        onto d >= 0.
+
+    tol: float, optional
+        By default, 1e-6. The iterations stop once no entry of the
+        dual vector w = ZTx - ZTZ*d violates the optimality
+        conditions, w <= 0 and w = 0 where d > 0, by more than tol
+        times the largest entry of ZTx.
+
+    max_iterations: int, optional
+        By default, 10000. The largest number of iterations.
+
+    full_output: bool, optional
+        By default, False. If True, also return a dictionary with
+        the final passive set, the indices of the nonzero entries of
+        d, under "P", the dual vector under "w", the number of
+        iterations under "iterations" and whether tol was reached
+        under "converged".
+
+    l1, l2: float, optional
+        By default, 0. See fnnls.
+
+    Returns
+    -------
+    d: Numpy array
+        d is a nx1 vector
+    res: float or None
+        The residual ||x - Zd||, without the penalties, or None
+        if xTx is not given, see fnnls_gram.
+    info: dict
+        Only returned if full_output is True.
+    """
+
+    ZTZ, ZTx, d, b, tolerance = _check(ZTZ, ZTx, d_initial, tol, max_iterations, l1, l2)
+
+    L = _lipschitz(ZTZ) + l2
+
+    w = np.empty_like(d)
+    y = d.copy()
+    t = 1.
+    converged = False
+
+    for iterations in range(1, max_iterations + 1):
+
+        # The projected gradient step from y, with g = -w at y
+        _dual(ZTZ, b, y, l2, w)
+        d_next = np.maximum(y + w / L, 0)
+
+        # Restart the momentum when the step goes uphill
+        if w @ (d_next - d) < 0:
+            t = 1.
+
+        t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+        y = d_next + ((t - 1) / t_next) * (d_next - d)
+
+        d, t = d_next, t_next
+
+        if iterations % 10 == 0 or iterations == max_iterations:
+            _dual(ZTZ, b, d, l2, w)
+
+            if _kkt(d, w) <= tolerance:
+                converged = True
+                break
+
+    return _output(ZTZ, ZTx, xTx, d, b, l2, iterations, converged, full_output)
+
+
+def cd_gram(ZTZ, ZTx, xTx=None, d_initial=None, tol=1e-6, max_iterations=1000,
+            full_output=False, l1=0, l2=0):
+    """
+    Cyclic coordinate descent for the nonnegative least squares
+    problem, run on the precomputed quantities ZTZ = Z^T*Z and
+    ZTx = Z^T*x, as fnnls_gram.
+
+    Every coordinate d_j is in turn set to its exact minimizer with
+    the others fixed, max(0, d_j + w_j / ZTZ[j,j]), and the dual vector
+    w = ZTx - ZTZ*d updated with the row j of ZTZ, at a cost of O(n),
+    or of its number of nonzero entries for a sparse ZTZ. After a sweep
+    over every coordinate, the sweeps only go over the coordinates
+    that are nonzero or violate the optimality conditions, until they
+    converge, and a full sweep checks that no other coordinate has to
+    move, which makes the sweeps cheap once the support is found.
+
+    Parameters
+    ----------
+    ZTZ: NumPy array or scipy.sparse matrix
+        ZTZ is an n x n matrix equal to Z.T * Z
+
+    ZTx: Numpy array
+        ZTx is an n x 1 vector equal to Z.T * x
+
+    xTx: float, optional
+        By default, None. The squared norm of x, x.T * x,
+        which is needed to compute the residual.
+
+    d_initial: Numpy array, optional
+        By default, the zero vector. The first iterate, projected
+        onto d >= 0.
+
+    tol: float, optional
+        By default, 1e-6. See apg_gram.
+
+    max_iterations: int, optional
+        By default, 1000. The largest number of sweeps.
+
+    full_output: bool, optional
+        By default, False. See apg_gram, with the number of
+        sweeps under "iterations".
+
+    l1, l2: float, optional
+        By default, 0. See fnnls.
+
+    Returns
+    -------
+    d: Numpy array
+        d is a nx1 vector
+    res: float or None
+        The residual ||x - Zd||, without the penalties, or None
+        if xTx is not given, see fnnls_gram.
+    info: dict
+        Only returned if full_output is True.
+    """
+
+    ZTZ, ZTx, d, b, tolerance = _check(ZTZ, ZTx, d_initial, tol, max_iterations, l1, l2)
+
+    if not (isinstance(ZTZ, np.ndarray) or sparse.issparse(ZTZ)):
+        raise ValueError("Expected a NumPy array or a scipy.sparse matrix, but ZTZ is {}".format(type(ZTZ).__name__))
+
+    n = ZTZ.shape[0]
+
+    # The rows of ZTZ, equal to its columns, as slices of a CSR matrix
+    if sparse.issparse(ZTZ):
+        ZTZ = sparse.csr_matrix(ZTZ)
+        ZTZ.sort_indices()
+        diagonal = ZTZ.diagonal() + l2
+    else:
+        diagonal = np.diag(ZTZ) + l2
+
+    w = _dual(ZTZ, b, d, l2, np.empty_like(d))
+
+    coordinates = np.arange(n)
+    full = True
+    converged = False
+
+    for iterations in range(1, max_iterations + 1):
+
+        for j in coordinates:
+
+            if diagonal[j] <= 0:
+                continue
+
+            delta = max(-d[j], w[j] / diagonal[j])
+
+            if delta == 0:
+                continue
+
+            d[j] += delta
+
+            if sparse.issparse(ZTZ):
+                start, stop = ZTZ.indptr[j], ZTZ.indptr[j + 1]
+                w[ZTZ.indices[start:stop]] -= delta * ZTZ.data[start:stop]
+            else:
+                w -= delta * ZTZ[j]
+
+            w[j] -= delta * l2
+
+        # Recompute w after a full sweep, discarding the round off
+        # of the updates
+        if full:
+            _dual(ZTZ, b, d, l2, w)
+
+        violation = _kkt(d, w)
+
+        if violation <= tolerance:
+
+            if full:
+                converged = True
+                break
+
+            # Check every coordinate with a full sweep
+            coordinates, full = np.arange(n), True
+
+        else:
+            coordinates = np.flatnonzero((d > 0) | (w > tolerance))
+            full = False
+
+    return _output(ZTZ, ZTx, xTx, d, b, l2, iterations, converged, full_output)
+
+
+def _check(ZTZ, ZTx, d_initial, tol, max_iterations, l1, l2):
+    """
+    Validate the Gram quantities and the first iterate of the
+    first order methods, returning them with the penalized right
+    hand side b = ZTx - l1/2 and the absolute tolerance.
+    """
+
+    if sparse.issparse(ZTZ):
+        np.asarray_chkfinite(ZTZ.data)
+        ZTx = np.asarray_chkfinite(ZTx)
+    elif isinstance(ZTZ, np.ndarray) or not hasattr(ZTZ, "shape"):
+        ZTZ, ZTx = map(np.asarray_chkfinite, (ZTZ, ZTx))
+    else:
+        ZTx = np.asarray_chkfinite(ZTx)
+
+    if len(ZTZ.shape) != 2 or ZTZ.shape[0] != ZTZ.shape[1]:
+        raise ValueError("Expected a square two-dimensional array, but ZTZ is of shape {}".format(ZTZ.shape))
+    if len(ZTx.shape) != 1:
+        raise ValueError("Expected a one-dimensional array, but ZTx is of shape {}".format(ZTx.shape))
+
+    n = ZTZ.shape[0]
+
+    if ZTx.shape[0] != n:
+        raise ValueError("Incompatable dimensions. The length of ZTx should match the dimensions of ZTZ, but ZTZ is of shape {} and ZTx is of shape {}".format(ZTZ.shape, ZTx.shape))
+    if tol <= 0:
+        raise ValueError("Expected a positive tol, but tol is {}".format(tol))
+    if max_iterations < 1:
+        raise ValueError("Expected a positive max_iterations, but max_iterations is {}".format(max_iterations))
+    if l1 < 0 or l2 < 0:
+        raise ValueError("Expected nonnegative penalties, but l1 is {} and l2 is {}".format(l1, l2))
+
+    dtype = _float_dtype(ZTZ.dtype, ZTx.dtype)
+
+    if isinstance(ZTZ, np.ndarray) or sparse.issparse(ZTZ):
+        ZTZ = ZTZ.astype(dtype, copy=False)
+    ZTx = ZTx.astype(dtype, copy=False)
+
+    d = np.zeros(n, dtype=dtype)
+
+    if d_initial is not None:
+        d_initial = np.asarray_chkfinite(d_initial)
+
+        if d_initial.shape != (n,):
+            raise ValueError("Incompatable dimensions. Expected d_initial of shape {}, but d_initial is of shape {}".format((n,), d_initial.shape))
+
+        np.maximum(d_initial, 0, out=d)
+
+    b = ZTx - l1 / 2
+
+    return ZTZ, ZTx, d, b, tol * max(np.max(np.abs(ZTx), initial=0), np.finfo(dtype).tiny)
+
+
+def _dual(ZTZ, b, d, l2, w):
+    """
+    Set w = b - (ZTZ + l2*I)*d in place.
+    """
+
+    _matvec(ZTZ, d, w)
+    w *= -1
+    w += b
+
+    if l2:
+        w -= l2 * d
+
+    return w
+
+
+def _kkt(d, w):
+    """
+    The largest violation of the optimality conditions w <= 0 and
+    w = 0 where d > 0, in which an entry d_j > 0 only counts up to
+    d_j, the distance of a step that would clip it at zero.
+    """
+
+    if d.shape[0] == 0:
+        return 0
+
+    return np.max(np.abs(np.minimum(d, -w)))
+
+
+def _lipschitz(ZTZ):
+    """
+    The largest eigenvalue of ZTZ, the Lipschitz constant of the
+    gradient, with a margin for the accuracy of the Lanczos iterations
+    that estimate it for large n.
+    """
+
+    n = ZTZ.shape[0]
+
+    if n == 0:
+        return 0
+
+    if n <= 200:
+        A = ZTZ.toarray() if sparse.issparse(ZTZ) else np.asarray(ZTZ[np.arange(n)[:, None], np.arange(n)])
+        return max(np.linalg.eigvalsh(A)[-1], 0)
+
+    operator = LinearOperator(ZTZ.shape, matvec=lambda v: _matvec(ZTZ, np.ravel(v), np.empty(n, dtype=ZTZ.dtype)),
+                              dtype=ZTZ.dtype)
+
+    return 1.01 * max(eigsh(operator, k=1, which="LA", tol=1e-4, return_eigenvectors=False)[0], 0)
+
+
+def _output(ZTZ, ZTx, xTx, d, b, l2, iterations, converged, full_output):
+    """
+    The return values of the first order methods.
+    """
+
+    res = None
+
+    if xTx is not None:
+        # Calculate residual loss ||x - Zd|| from the Gram quantities
+        res = np.sqrt(max(xTx - 2 * d @ ZTx + d @ (ZTZ @ d), 0))
+
+    if full_output:
+        w = _dual(ZTZ, b, d, l2, np.empty_like(d))
+        return [d, res, {"P": np.flatnonzero(d > 0), "w": w, "iterations": iterations, "converged": converged}]
+
+    return [d, res]
@@ -1,22 +1,40 @@
+import warnings
+
 import numpy as np
+from scipy import sparse
+from scipy.linalg import cho_factor, cho_solve
+from scipy.sparse.linalg import LinearOperator
+from time import perf_counter
+
+from .backends import _resolve_backend, _fnnls_numba
+from .engines import CholeskyEngine
+from .gram import gram, _block, _matvec, _float_dtype, _penalize
+from .stats import _timed, _kkt_violation
 
 def fnnls(Z, x, P_initial = np.zeros(0, dtype=int),
          lstsq = lambda A, x: np.linalg.inv(A).dot(x),
-         epsilon=np.finfo(float).eps):
+         epsilon=None, engine=None, full_output=False, refine=0,
+         stats=None, callback=None, l1=0, l2=0, weights=None, upper=None,
+         backend="numpy", additions=1):
     """
     Implementation of the Fast Non-megative Least Squares Algorithm described
     in the paper "A fast non-negativity-constrained least squares algorithm"
     by Rasmus Bro and Sijmen De Jong.
 
-    This algorithm seeks to find min_d ||x - Zd|| subject to d >= 0
+    This algorithm seeks to find min_d ||x - Zd|| subject to d >= 0,
+    or with penalties, min_d ||x - Zd||^2 + l1*1^T*d + l2*||d||^2,
+    and optionally subject to the upper bounds d <= upper.
 
     Some of the comments, such as "B2", refer directly to the steps of
     the fnnls algorithm as presented in the paper by Bro et al.
 
     Parameters
     ----------
-    Z: NumPy array
-        Z is an m x n matrix.
+    Z: NumPy array, scipy.sparse matrix or LinearOperator
+        Z is an m x n matrix. A sparse Z is never densified,
+        see gram for how ZTZ is formed. A LinearOperator, such as
+        a Convolution, is only used through its products, and
+        only the blocks of ZTZ along the passive set are formed.
 
     x: Numpy array
         x is a m x 1 vector.
@@ -32,17 +50,126 @@ def fnnls(Z, x, P_initial = np.zeros(0, dtype=int),
         Must be of the form x = f(A,b).
 
     epsilon: float
-        By default, it is np.finfo(float).eps
-        the numerical tolerance
-        
+        By default, it is the machine epsilon of the floating point
+        type of Z and x, np.finfo(float).eps for float64 or integer
+        inputs, the numerical tolerance
+
+    engine: str or object, optional
+        By default, None, and every least squares problem along
+        the passive set is solved from scratch with lstsq.
+        If "cholesky", a Cholesky factorization of ZTZ[P][:,P]
+        is updated as indices enter and leave the passive set,
+        so that each iteration costs O(|P|^2) instead of O(|P|^3).
+        Any object with a method s = solve(ZTZ, P, ZTx[P]) can
+        also be given, such as a FactorCache shared between calls
+        on the same Z.
+
+    full_output: bool, optional
+        By default, False. If True, also return a dictionary with
+        the final passive set as an array of indices under "P",
+        which can be given as P_initial to warm start a related
+        problem, the dual vector ZTx - ZTZ*d under "w", and the
+        number of iterations of the outer loop under "iterations".
+
+    refine: int, optional
+        By default, 0. A number of steps of mixed precision iterative
+        refinement of d along the final passive set, for float32
+        inputs. Each step computes the residual of the normal
+        equations in float64 and solves for the correction with the
+        float32 factorization of ZTZ[P][:,P], recovering much of the
+        accuracy lost to a poorly conditioned ZTZ.
+
+    stats: SolverStats, optional
+        By default, None. A SolverStats to fill in with the
+        iteration counts, timings and exit reason of the call.
+
+    callback: function, optional
+        By default, None. A function called at the end of every
+        iteration of the outer loop as callback(iteration, d, P, w),
+        with the current iterate, passive set and dual vector, which
+        must not be modified. If it returns True, the loop stops.
+
+    l1: float, optional
+        By default, 0. The weight of the penalty l1*1^T*d, which
+        is the l1 norm of d since d >= 0, subtracted from ZTx
+        as l1/2 rather than added to the rows of Z.
+
+    l2: float, optional
+        By default, 0. The weight of the ridge penalty l2*||d||^2,
+        added to the diagonal of ZTZ rather than stacking
+        sqrt(l2)*I under Z.
+
+    weights: Numpy array, optional
+        By default, None. A vector of length m of nonnegative weights
+        of the observations, to solve min_d ||sqrt(W)(x - Zd)|| for W
+        the diagonal matrix of the weights. Z^T*W*Z and Z^T*W*x are
+        accumulated by blocks of rows, see gram, without forming a
+        scaled copy of Z.
+
+    upper: Numpy array, optional
+        By default, None. A vector of length n of upper bounds
+        0 <= d <= upper, which may be np.inf. The indices fixed at
+        their upper bound form a second set alongside the passive
+        set, returned under "U" with full_output.
+
+    backend: str, optional
+        By default, "numpy". If "numba", the whole active set loop
+        runs as a compiled kernel, which keeps the passive set as a
+        list of indices with a Cholesky factorization of its block of
+        ZTZ, and removes the Python overhead that dominates small
+        problems. lstsq and engine are then not used, and the least
+        squares time of stats is not measured. It requires numba and
+        a dense ZTZ, and does not support callback or upper. "auto"
+        uses it when it can, and the NumPy loop otherwise.
+
+    additions: int, optional
+        By default, 1, and the outer loop moves the single index of
+        largest w into the passive set, as in B2 and B3. If larger, up
+        to that many indices of largest w enter at once, which cuts the
+        number of iterations for solutions with many nonzeros. The
+        number of indices falls back to one after an iteration in
+        which the inner loop had to remove indices, and doubles after
+        the others. The indices only enter together if their columns
+        are linearly independent of each other and of the passive set,
+        so that its size never exceeds the rank of Z, and otherwise,
+        or if none of them can stay, the single index of largest w
+        enters instead. A step through a singular passive set block,
+        which raises the objective, is undone. The stall exit after
+        max_repetitions iterations without a change of the passive set
+        then only counts single indices, which are excluded until it
+        changes if their columns are dependent on the passive set or
+        they leave it in the iteration they entered it, and once a
+        passive set repeats, single indices enter by Bland's rule, the
+        smallest index with w above the tolerance. The loop stalls,
+        with a RuntimeWarning, after max_repetitions such single
+        indices in a row, if every index with w above the tolerance
+        is excluded, or if a passive set repeats under Bland's rule.
+        It is not supported with upper or backend="numba".
+
     Returns
     -------
     d: Numpy array
-        d is a nx1 vector
+        d is a nx1 vector, of the floating point type of Z and x
+    res: float
+        The residual ||x - Zd||, without the penalties, and
+        weighted as ||sqrt(W)(x - Zd)|| with weights
+    info: dict
+        Only returned if full_output is True.
     """
 
+    if stats is not None:
+        stats.reset()
+        start = perf_counter()
+
     # map Z, x, and P_initial to np arrays to standardize from any input
-    Z, x, P_initial = map(np.asarray_chkfinite, (Z, x, P_initial))
+    # a sparse Z is kept as is, checking only its stored entries
+    if sparse.issparse(Z):
+        np.asarray_chkfinite(Z.data)
+        x, P_initial = map(np.asarray_chkfinite, (x, P_initial))
+    elif isinstance(Z, LinearOperator):
+        x, P_initial = map(np.asarray_chkfinite, (x, P_initial))
+    else:
+        Z, x, P_initial = map(np.asarray_chkfinite, (Z, x, P_initial))
 
     m, n = Z.shape
 
@@ -53,20 +180,247 @@ def fnnls(Z, x, P_initial = np.zeros(0, dtype=int),
     if len(P_initial.shape) != 1:
         raise ValueError("Expected a one-dimensional array, but P_initial is of shape {}".format(P_initial.shape))
 
-    if not np.all((P_initial - P_initial.astype(int)) == 0):
-        raise ValueError("Expected only integer values, but P_initial has values {}".format(P_initial[(P_initial - P_initial.astype(int)) != 0]))
-    if np.any(P_initial >= n):
-        raise ValueError("Expected values between 0 and Z.shape[1], but P_initial has max value {}".format(np.max(P_initial)))
-    if np.any(P_initial < 0):
-        raise ValueError("Expected values between 0 and Z.shape[1], but P_initial has min value {}".format(np.min(P_initial)))
-    if P_initial.dtype != np.dtype('int64') and P_initial.dtype != np.dtype('int32') :
-        raise TypeError("Expected type int64 or int32, but P_initial is type {}".format(P_initial.dtype))
+    _check_P_initial(P_initial, n)
+
     if x.shape[0] != m:
         raise ValueError("Incompatable dimensions. The first dimension of Z should match the length of x, but Z is of shape {} and x is of shape {}".format(Z.shape, x.shape))
+    if refine and isinstance(Z, LinearOperator):
+        raise ValueError("Expected refine to be 0 for a LinearOperator Z, but refine is {}".format(refine))
 
     # Calculating ZTZ and ZTx in advance to improve the efficiency of calculations
-    ZTZ = Z.T.dot(Z)
-    ZTx = Z.T.dot(x)
+    ZTZ, ZTx = gram(Z, x, weights=weights)
+    ZTZ, ZTx = _penalize(ZTZ, ZTx, l1, l2)
+
+    if stats is not None:
+        stats.gram_time = perf_counter() - start
+
+    U = None
+
+    _check_additions(additions, upper)
+
+    backend = _resolve_backend(backend, ZTZ, engine, callback, upper, additions)
+
+    if upper is None:
+        d, P, w, iterations = _fnnls(ZTZ, ZTx, P_initial, lstsq, epsilon, engine,
+                                     stats=stats, callback=callback, backend=backend, additions=additions)
+    else:
+        upper = _check_upper(upper, n, ZTZ.dtype)
+        d, P, w, iterations, U = _fnnls_bounded(ZTZ, ZTx, upper, P_initial, lstsq, epsilon, engine,
+                                                stats=stats, callback=callback)
+
+    if refine:
+        # Refine along P, with the upper set moved to the right hand side
+        x_P = x if U is None or not U.any() else x - Z @ np.where(U, d, 0)
+        _refine(Z, x_P, ZTZ, d, P, refine, l1, l2, weights)
+        if upper is not None:
+            np.minimum(d, upper, out=d)
+        _dual(ZTZ, ZTx, d, w)
+
+    res = _residual(Z, x, d, weights)  #Calculate residual loss ||x - Zd||
+
+    if stats is not None:
+        stats.kkt_violation = _kkt_violation(P, w, U, upper)
+        stats.total_time = perf_counter() - start
+
+    if full_output:
+        return [d, res, _info(P, w, iterations, U)]
+
+    return [d, res]
+
+
+def fnnls_gram(ZTZ, ZTx, xTx=None, P_initial = np.zeros(0, dtype=int),
+         lstsq = lambda A, x: np.linalg.inv(A).dot(x),
+         epsilon=None, engine=None, full_output=False, stats=None, callback=None,
+         l1=0, l2=0, upper=None, backend="numpy", additions=1):
+    """
+    The Fast Non-negative Least Squares Algorithm run directly on the
+    precomputed quantities ZTZ = Z^T*Z and ZTx = Z^T*x, without Z.
+
+    The active set loop of fnnls only uses these quantities, so they
+    can be accumulated elsewhere, for example in a streaming pass over
+    the rows of Z, and the problem solved with O(n^2) memory instead
+    of O(mn).
+
+    Parameters
+    ----------
+    ZTZ: NumPy array or scipy.sparse matrix
+        ZTZ is an n x n matrix equal to Z.T * Z
+
+    ZTx: Numpy array
+        ZTx is an n x 1 vector equal to Z.T * x
+
+    xTx: float, optional
+        By default, None. The squared norm of x, x.T * x,
+        which is needed to compute the residual.
+
+    P_initial: Numpy array, dtype=int
+        By default, an empty array. An estimate for
+        the indices of the support of the solution.
+
+    lstsq: function
+        By default, the inverse of A multiplied by b.
+        Least squares function to use when calculating the
+        least squares solution min_x ||Ax - b||.
+        Must be of the form x = f(A,b).
+
+    epsilon: float
+        By default, it is the machine epsilon of the floating point
+        type of ZTZ and ZTx, the numerical tolerance
+
+    engine: str or object, optional
+        By default, None. See fnnls.
+
+    full_output: bool, optional
+        By default, False. See fnnls.
+
+    stats: SolverStats, optional
+        By default, None. See fnnls.
+
+    callback: function, optional
+        By default, None. See fnnls.
+
+    l1, l2: float, optional
+        By default, 0. See fnnls. ZTZ and ZTx are copied
+        rather than penalized in place.
+
+    upper: Numpy array, optional
+        By default, None. See fnnls.
+
+    backend: str, optional
+        By default, "numpy". See fnnls.
+
+    additions: int, optional
+        By default, 1. See fnnls.
+
+    Returns
+    -------
+    d: Numpy array
+        d is a nx1 vector
+    res: float or None
+        The residual ||x - Zd||, without the penalties, computed as
+        the square root of xTx - 2 d.ZTx + d.ZTZ.d, or None if xTx
+        is not given.
+    info: dict
+        Only returned if full_output is True.
+    """
+
+    if stats is not None:
+        stats.reset()
+        start = perf_counter()
+
+    if sparse.issparse(ZTZ):
+        np.asarray_chkfinite(ZTZ.data)
+        ZTx, P_initial = map(np.asarray_chkfinite, (ZTx, P_initial))
+    else:
+        ZTZ, ZTx, P_initial = map(np.asarray_chkfinite, (ZTZ, ZTx, P_initial))
+
+    if len(ZTZ.shape) != 2 or ZTZ.shape[0] != ZTZ.shape[1]:
+        raise ValueError("Expected a square two-dimensional array, but ZTZ is of shape {}".format(ZTZ.shape))
+    if len(ZTx.shape) != 1:
+        raise ValueError("Expected a one-dimensional array, but ZTx is of shape {}".format(ZTx.shape))
+    if len(P_initial.shape) != 1:
+        raise ValueError("Expected a one-dimensional array, but P_initial is of shape {}".format(P_initial.shape))
+
+    n = ZTZ.shape[0]
+
+    _check_P_initial(P_initial, n)
+
+    if ZTx.shape[0] != n:
+        raise ValueError("Incompatable dimensions. The length of ZTx should match the dimensions of ZTZ, but ZTZ is of shape {} and ZTx is of shape {}".format(ZTZ.shape, ZTx.shape))
+
+    dtype = _float_dtype(ZTZ.dtype, ZTx.dtype)
+    ZTZ, ZTx = ZTZ.astype(dtype, copy=False), ZTx.astype(dtype, copy=False)
+
+    # The penalties are applied to copies, the residual is computed
+    # from the quantities given
+    ZTZ_penalized, ZTx_penalized = ZTZ, ZTx
+
+    if l1 or l2:
+        ZTZ_penalized, ZTx_penalized = _penalize(ZTZ.copy(), ZTx.copy(), l1, l2)
+
+    U = None
+
+    _check_additions(additions, upper)
+
+    backend = _resolve_backend(backend, ZTZ, engine, callback, upper, additions)
+
+    if upper is None:
+        d, P, w, iterations = _fnnls(ZTZ_penalized, ZTx_penalized, P_initial, lstsq, epsilon, engine,
+                                     stats=stats, callback=callback, backend=backend, additions=additions)
+    else:
+        upper = _check_upper(upper, n, ZTZ.dtype)
+        d, P, w, iterations, U = _fnnls_bounded(ZTZ_penalized, ZTx_penalized, upper, P_initial, lstsq, epsilon, engine,
+                                                stats=stats, callback=callback)
+
+    res = None
+
+    if xTx is not None:
+        # Calculate residual loss ||x - Zd|| from the Gram quantities,
+        # clipping the round off that can make it slightly negative
+        res = np.sqrt(max(xTx - 2 * d @ ZTx + d @ (ZTZ @ d), 0))
+
+    if stats is not None:
+        stats.kkt_violation = _kkt_violation(P, w, U, upper)
+        stats.total_time = perf_counter() - start
+
+    if full_output:
+        return [d, res, _info(P, w, iterations, U)]
+
+    return [d, res]
+
+
+def _fnnls(ZTZ, ZTx, P_initial, lstsq, epsilon, engine, workspace=None,
+           stats=None, callback=None, backend="numpy", additions=1):
+    """
+    The active set loop of the Fast Non-negative Least Squares
+    Algorithm, shared by fnnls and fnnls_gram.
+
+    The iterates are updated in place in the arrays of workspace,
+    as created by _workspace, so that repeated solves of the same
+    size can reuse them. They are of the floating point type of ZTZ,
+    and if epsilon is None, it is the machine epsilon of that type.
+
+    If stats is given, the counters, the least squares timings and
+    the exit reason are accumulated in it, see SolverStats, and the
+    solves are only wrapped for timing in that case.
+
+    With backend="numba", as resolved by _resolve_backend, the loop
+    is run by the compiled kernel of _fnnls_numba instead.
+
+    With additions > 1, up to that many linearly independent indices
+    enter the passive set per iteration, and cycling is detected rather
+    than cut short by the max_repetitions stall exit, see fnnls.
+
+    Returns
+    -------
+    d: Numpy array
+        d is a nx1 vector, one of the arrays of workspace
+    P: Numpy array, dtype=bool
+        The final passive set, one of the arrays of workspace
+    w: Numpy array
+        The final dual vector ZTx - ZTZ*d, one of the arrays of workspace
+    iterations: int
+        The number of iterations of the outer loop
+    """
+
+    n = ZTZ.shape[0]
+
+    if epsilon is None:
+        epsilon = np.finfo(ZTZ.dtype).eps
+
+    if engine == "cholesky":
+        engine = CholeskyEngine(epsilon)
+
+    if stats is not None:
+        lstsq, engine = _timed(stats, lstsq, engine)
+
+    if workspace is None:
+        workspace = _workspace(n, ZTZ.dtype)
+
+    if backend == "numba":
+        return _fnnls_numba(ZTZ, ZTx, P_initial, epsilon, workspace, stats)
+
+    P, current_P, d, s, w = workspace
 
     # Declaring constants for tolerance and max repetitions
     tolerance = epsilon * n
@@ -76,72 +430,580 @@ def fnnls(Z, x, P_initial = np.zeros(0, dtype=int),
 
     # A1 + A2
     # P is a boolean array that represents the passive set
-    P = np.zeros(n, dtype=bool)
+    P[:] = False
     P[P_initial] = True
 
     # A3
     # Initialize d to zero vector
-    d = np.zeros(n)
+    d[:] = 0
 
     # A4
     # Set w = Z^T*x - (Z^T*Z)d
     # This is the most important distinction from standard nnls,
     # in which w = Z^T(x - Zd)
-    w = ZTx - (ZTZ) @ d
+    _dual(ZTZ, ZTx, d, w)
 
     # Initialize s
-    s = np.zeros(n)
+    s[:] = 0
 
     # Count of amount of consecutive times set P has remained unchanged
     no_update = 0
 
+    # With additions > 1, the number of indices entering per iteration,
+    # the indices excluded after leaving in the iteration they entered,
+    # the passive sets already seen, whether Bland's rule is used, and
+    # the iterate before the step, to undo it
+    k = additions
+    rejected = np.zeros(n, dtype=bool) if additions != 1 else None
+    seen = set()
+    bland = False
+
+    if additions != 1:
+        d_previous, w_previous = np.empty_like(d), np.empty_like(w)
+
+        # A singular passive set block undoes the step rather than raising
+        lstsq = _nan_on_singular(lstsq)
+
+    # Number of iterations of the outer and inner loops
+    iterations = 0
+    inner_iterations = 0
+
+    exit_reason = None
+
     # Extra loop in case a support is set to update s and d
     if P_initial.shape[0] != 0:
 
-        s[P] = lstsq((ZTZ)[P][:,P], (ZTx)[P])
-        d = s.clip(min=0)
+        s[P] = _solve_passive(ZTZ, ZTx, P, lstsq, engine)
+
+        # Drop the indices of the estimate where s is not positive until
+        # it is, so that d starts feasible and w is computed at d
+        while P.any() and s[P].min() <= tolerance:
+
+            P[s <= tolerance] = False
+            s[~P] = 0.
+
+            if P.any():
+                s[P] = _solve_passive(ZTZ, ZTx, P, lstsq, engine)
+
+        np.copyto(d, s)
+        _dual(ZTZ, ZTx, d, w)
 
     # B1
-    while (not np.all(P))  and np.max(w[~P]) > tolerance:
+    while (not P.all()) and w[~P].max() > tolerance:
+
+        if additions != 1:
+            entering = _entering(w, P | rejected, tolerance, 1 if bland else k, bland)
+
+            # Every index with w above the tolerance was rejected
+            if entering.shape[0] == 0:
+                exit_reason = "stalled"
+                break
+
+            # Indices dependent on each other or on the passive set would
+            # make its block singular, and the size of the passive set
+            # exceed the rank of Z. Of several, only the one of largest w
+            # then enters, with a threshold of sqrt(epsilon) allowing for
+            # the round off of ZTZ, which errs on the side of a single
+            # index move. A single one is rejected as if it could not
+            # stay, with the threshold of CholeskyEngine
+            if entering.shape[0] > 1 and not _independent(ZTZ, P, entering, np.sqrt(epsilon), engine):
+                entering = entering[[np.argmax(w[entering])]]
+                k = 1
+
+            if entering.shape[0] == 1 and not _independent(ZTZ, P, entering, epsilon * (np.count_nonzero(P) + 1), engine):
+                rejected[entering] = True
+                no_update += 1
+
+                if no_update >= max_repetitions:
+                    exit_reason = "stalled"
+                    break
+
+                continue
+
+            entered = entering
+            objective = _objective(d, ZTx, w)
+            np.copyto(d_previous, d)
+            np.copyto(w_previous, w)
+
+        iterations += 1
 
-        current_P = P.copy() # Make copy of passive set to check for change at end of loop
+        np.copyto(current_P, P) # Make copy of passive set to check for change at end of loop
 
         # B2 + B3
         # Move the element in active set with largest value
-        # of w into the passive set
-        P[np.argmax(w * ~P)] = True
+        # of w into the passive set, or the entering ones
+        if additions == 1:
+            P[np.argmax(w * ~P)] = True
+        else:
+            P[entering] = True
+
+        backtracked = False
 
         # B4
         # Set s to the least squares solution along the passive set
-        s[P] = lstsq((ZTZ)[P][:,P], (ZTx)[P])
+        s[P] = _solve_passive(ZTZ, ZTx, P, lstsq, engine)
+
+        # An entering index with s not positive would stop the step of
+        # fix_constraint at alpha = 0, as d is 0 there, and take all of
+        # the entering indices out with it, so it leaves first
+        while additions != 1 and entering.shape[0] and s[entering].min() <= tolerance:
+
+            P[entering[s[entering] <= tolerance]] = False
+            entering = entering[P[entering]]
+            backtracked = True
+
+            # With none of them left, the one of largest w enters alone,
+            # as with a single index
+            if entering.shape[0] == 0 and entered.shape[0] > 1:
+                entering = entered = entered[[np.argmax(w[entered])]]
+                P[entering] = True
+
+            # And if it cannot stay either, d is still the solution along P
+            if entering.shape[0] == 0:
+                np.copyto(s, d)
+            else:
+                s[~P] = 0.
+                s[P] = _solve_passive(ZTZ, ZTx, P, lstsq, engine)
 
         # C1
         # We loop until either the passive set is empty or every
         # element in s in the passive set is above the tolerance
-        while np.any(P) and np.min(s[P]) <= tolerance:
+        while P.any() and s[P].min() <= tolerance:
 
-            s, d, P = fix_constraint(ZTZ, ZTx, s, d, P, tolerance, lstsq)
+            s, d, P = fix_constraint(ZTZ, ZTx, s, d, P, tolerance, lstsq, engine)
+            inner_iterations += 1
+            backtracked = True
 
         # B5
-        d = s.copy()
+        np.copyto(d, s)
         # B6
-        w = ZTx - (ZTZ) @ d
+        _dual(ZTZ, ZTx, d, w)
+
+        if additions != 1:
+
+            # A step that raised the objective d.ZTZ.d - 2 d.ZTx beyond
+            # round off went through a singular passive set block, and
+            # is undone, as if the entering indices could not stay
+            if not _decreased(objective, _objective(d, ZTx, w), tolerance):
+                np.copyto(P, current_P)
+                np.copyto(d, d_previous)
+                np.copyto(w, w_previous)
+                backtracked = True
+
+            # Fall back to single index moves after a backtrack
+            k = 1 if backtracked else min(2 * k, additions)
+
+            # A single index which could not stay is excluded, and
+            # max_repetitions of them in a row are a stall, as without
+            # additions
+            if np.array_equal(current_P, P):
+                if entered.shape[0] == 1:
+                    rejected[entered] = True
+                    no_update += 1
+            else:
+                rejected[:] = False
+                no_update = 0
+
+                # A repeated passive set is a cycle, broken by Bland's
+                # rule, and a cycle with Bland's rule is left stalled.
+                # Only the passive sets seen under Bland's rule count
+                # towards its cycle
+                key = np.packbits(P).tobytes()
+
+                if key in seen:
+                    if bland:
+                        exit_reason = "stalled"
+                        break
+                    bland = True
+                    seen.clear()
+
+                seen.add(key)
 
         # Check if there has been a change to the passive set
-        if(np.all(current_P == P)):
+        elif(np.array_equal(current_P, P)):
             no_update += 1
         else:
             no_update = 0
 
         if no_update >= max_repetitions:
+            exit_reason = "stalled"
             break
 
-    res = np.linalg.norm(x - Z@d)  #Calculate residual loss ||x - Zd||
+        if callback is not None and callback(iterations, d, P, w):
+            exit_reason = "callback"
+            break
 
-    return [d, res]
+    if additions != 1 and exit_reason == "stalled":
+        warnings.warn("fnnls stalled with additions={} while the largest entry of w off the passive set, {}, "
+                      "is above the tolerance {}".format(additions, w[~P].max(), tolerance), RuntimeWarning)
+
+    if stats is not None:
+        stats.iterations += iterations
+        stats.inner_iterations += inner_iterations
+        stats.exit_reason = exit_reason or ("all_passive" if P.all() else "converged")
 
+    return d, P, w, iterations
 
-def fix_constraint(ZTZ, ZTx, s, d, P, tolerance, lstsq = lambda A, x: np.linalg.inv(A).dot(x)):
+
+def _fnnls_bounded(ZTZ, ZTx, upper, P_initial, lstsq, epsilon, engine, workspace=None,
+           stats=None, callback=None):
+    """
+    The active set loop of the Fast Non-negative Least Squares
+    Algorithm extended to the bounds 0 <= d <= upper, in the manner of
+    the bounded variable least squares algorithm of Stark and Parker.
+
+    Alongside the passive set P, the upper set U holds the indices
+    fixed at their upper bound, the others being fixed at 0. At each
+    iteration, the index whose bound is most violated by the dual
+    vector w, w > 0 at 0 or w < 0 at the upper bound, is freed into P,
+    and the inner loop, fix_constraint, steps back to the bounds and
+    moves the indices that reach them out of P.
+
+    Returns
+    -------
+    d, P, w, iterations:
+        See _fnnls.
+    U: Numpy array, dtype=bool
+        The final upper set.
+    """
+
+    n = ZTZ.shape[0]
+
+    if epsilon is None:
+        epsilon = np.finfo(ZTZ.dtype).eps
+
+    if engine == "cholesky":
+        engine = CholeskyEngine(epsilon)
+
+    if stats is not None:
+        lstsq, engine = _timed(stats, lstsq, engine)
+
+    if workspace is None:
+        workspace = _workspace(n, ZTZ.dtype)
+
+    P, current_P, d, s, w = workspace
+
+    U = np.zeros(n, dtype=bool)
+    current_U = np.zeros(n, dtype=bool)
+
+    tolerance = epsilon * n
+    max_repetitions = 5
+
+    # Indices with a zero upper bound are fixed at 0
+    free = upper > tolerance
+
+    P[:] = False
+    P[P_initial] = True
+    P &= free
+
+    d[:] = 0
+    s[:] = 0
+
+    no_update = 0
+
+    iterations = 0
+    inner_iterations = 0
+
+    exit_reason = None
+
+    # Move the indices of the estimate where s is out of bounds to
+    # the lower or upper set until it is not, so that d starts feasible
+    while P.any():
+
+        s[P] = _solve_passive(ZTZ, _bounded_rhs(ZTZ, ZTx, upper, U), P, lstsq, engine)
+
+        low, high = P & (s <= tolerance), P & (s >= upper - tolerance)
+
+        if not (low.any() or high.any()):
+            break
+
+        P[low | high] = False
+        U[high] = True
+        s[~P] = 0.
+        s[U] = upper[U]
+
+    np.copyto(d, s)
+    _dual(ZTZ, ZTx, d, w)
+
+    while True:
+
+        # The violation of the bounds by w, at 0 and at the upper bounds
+        violation = np.where(~P & ~U & free, w, 0) - np.where(U, w, 0)
+
+        if violation.max() <= tolerance:
+            break
+
+        iterations += 1
+
+        np.copyto(current_P, P)
+        np.copyto(current_U, U)
+
+        # Free the index with the largest violation
+        j = np.argmax(violation)
+        P[j] = True
+        U[j] = False
+
+        s[P] = _solve_passive(ZTZ, _bounded_rhs(ZTZ, ZTx, upper, U), P, lstsq, engine)
+        s[U] = upper[U]
+
+        # Step back to the bounds until s is within them along P
+        while P.any() and (s[P].min() <= tolerance or (s[P] - upper[P]).max() >= -tolerance):
+
+            s, d, P = fix_constraint(ZTZ, ZTx, s, d, P, tolerance, lstsq, engine, upper, U)
+            inner_iterations += 1
+
+        np.copyto(d, s)
+        _dual(ZTZ, ZTx, d, w)
+
+        if np.array_equal(current_P, P) and np.array_equal(current_U, U):
+            no_update += 1
+        else:
+            no_update = 0
+
+        if no_update >= max_repetitions:
+            exit_reason = "stalled"
+            break
+
+        if callback is not None and callback(iterations, d, P, w):
+            exit_reason = "callback"
+            break
+
+    if stats is not None:
+        stats.iterations += iterations
+        stats.inner_iterations += inner_iterations
+        stats.exit_reason = exit_reason or ("all_passive" if P.all() else "converged")
+
+    return d, P, w, iterations, U
+
+
+def _entering(w, excluded, tolerance, k, smallest=False):
+    """
+    The at most k indices outside of excluded with w above the
+    tolerance to move into the passive set, those of largest w,
+    or the smallest ones for Bland's rule.
+    """
+
+    candidates = np.flatnonzero(~excluded & (w > tolerance))
+
+    if smallest or candidates.shape[0] <= k:
+        return candidates[:k]
+
+    return candidates[np.argpartition(w[candidates], -k)[-k:]]
+
+
+def _independent(ZTZ, P, entering, threshold, engine):
+    """
+    Whether the columns of the entering indices are linearly
+    independent of each other and of the passive set P, from the
+    pivots of the Cholesky factorization of the Schur complement of
+    the passive set block, which must be above threshold times the
+    diagonal of ZTZ.
+    """
+
+    idx = np.flatnonzero(P)
+
+    S = _block(ZTZ, entering, entering)
+    diagonal = np.abs(np.diag(S))
+
+    if idx.shape[0]:
+        B = _block(ZTZ, idx, entering)
+
+        try:
+            if engine is None:
+                X = cho_solve(cho_factor(_block(ZTZ, idx, idx)), B)
+            else:
+                X = engine.solve(ZTZ, P, B)
+        except np.linalg.LinAlgError:
+            return False
+
+        S = S - B.T @ X
+
+    try:
+        L = np.linalg.cholesky(S)
+    except np.linalg.LinAlgError:
+        return False
+
+    return bool(np.all(np.diag(L) ** 2 > threshold * diagonal))
+
+
+def _objective(d, ZTx, w):
+    """
+    The objective d.ZTZ.d - 2 d.ZTx at d, from its dual vector
+    w = ZTx - ZTZ*d, and the scale of its round off.
+    """
+
+    return -d @ (ZTx + w), np.abs(d) @ (np.abs(ZTx) + np.abs(w))
+
+
+def _decreased(previous, current, tolerance):
+    """
+    Whether the objective, as returned by _objective, is finite
+    and has not increased by more than its round off.
+    """
+
+    return np.isfinite(current[0]) and current[0] <= previous[0] + tolerance * (previous[1] + current[1])
+
+
+def _nan_on_singular(lstsq):
+    """
+    Wrap lstsq to return NaNs rather than raise for a singular matrix.
+    """
+
+    def solve(A, b):
+        try:
+            return lstsq(A, b)
+        except np.linalg.LinAlgError:
+            return np.full(np.shape(b), np.nan)
+
+    return solve
+
+
+def _check_additions(additions, upper=None):
+    """
+    Validate the number of indices entering the passive set per
+    iteration, which must be 1 for the bounded loop.
+    """
+
+    if additions < 1:
+        raise ValueError("Expected a positive number of additions, but additions is {}".format(additions))
+    if upper is not None and additions != 1:
+        raise ValueError("Expected additions to be 1 with upper bounds, but additions is {}".format(additions))
+
+
+def _info(P, w, iterations, U=None):
+    """
+    Collect the final state of the active set loop returned
+    with full_output, copying it out of the workspace.
+    """
+
+    info = {"P": np.flatnonzero(P), "w": w.copy(), "iterations": iterations}
+
+    if U is not None:
+        info["U"] = np.flatnonzero(U)
+
+    return info
+
+
+def _workspace(n, dtype=float):
+    """
+    Allocate the arrays updated in place by the active set loop,
+    the passive set P, a copy of it, and the vectors d, s and w.
+    """
+
+    return (np.zeros(n, dtype=bool), np.zeros(n, dtype=bool),
+            np.zeros(n, dtype=dtype), np.zeros(n, dtype=dtype), np.zeros(n, dtype=dtype))
+
+
+def _refine(Z, x, ZTZ, d, P, steps, l1=0, l2=0, weights=None):
+    """
+    Refine d in place along the passive set P with steps of mixed
+    precision iterative refinement, computing the residuals in float64
+    and the corrections with the factorization of ZTZ[P][:,P] in the
+    floating point type of ZTZ, which includes the penalty l2 and
+    the weights.
+    """
+
+    idx = np.flatnonzero(P)
+
+    if idx.shape[0] == 0:
+        return
+
+    try:
+        factor = cho_factor(_block(ZTZ, idx, idx))
+    except np.linalg.LinAlgError:
+        return
+
+    x = np.asarray(x, dtype=np.float64)
+    Z_P = Z[:, idx]
+    if sparse.issparse(Z_P):
+        Z_P = Z_P.astype(np.float64)
+    else:
+        Z_P = np.asarray(Z_P, dtype=np.float64)
+
+    d_P = d[idx].astype(np.float64)
+
+    for _ in range(steps):
+
+        # Residual of the normal equations Z_P^T (x - Z_P d_P) in float64
+        r = x - Z_P @ d_P
+
+        if weights is not None:
+            r *= weights
+
+        r = Z_P.T @ r - l2 * d_P - l1 / 2
+
+        d_P += cho_solve(factor, r.astype(ZTZ.dtype)).astype(np.float64)
+
+    # Refinement cannot make coordinates negative by more than round off
+    d[idx] = d_P.clip(min=0)
+
+
+def _residual(Z, X, D, weights=None):
+    """
+    The residual ||x - Zd|| of a solution d, or of every column of
+    a matrix of solutions D, weighted by sqrt(W) if weights are given.
+    """
+
+    R = X - Z @ D
+
+    if weights is not None:
+        R *= np.sqrt(weights).reshape((-1,) + (1,) * (len(R.shape) - 1))
+
+    return np.linalg.norm(R, axis=0)
+
+
+def _dual(ZTZ, ZTx, d, w):
+    """
+    Set w = ZTx - ZTZ*d in place.
+    """
+
+    _matvec(ZTZ, d, w)
+    np.subtract(ZTx, w, out=w)
+
+
+def _check_upper(upper, n, dtype):
+    """
+    Validate a vector of n nonnegative upper bounds, which may be
+    infinite, and cast it to the floating point type of the solution.
+    """
+
+    upper = np.asarray(upper, dtype=dtype)
+
+    if upper.shape != (n,):
+        raise ValueError("Incompatable dimensions. Expected an upper bound for each of the {} columns of Z, but upper is of shape {}".format(n, upper.shape))
+    if np.any(np.isnan(upper)):
+        raise ValueError("Expected upper bounds that are not NaN, but upper has NaN values")
+    if np.any(upper < 0):
+        raise ValueError("Expected nonnegative upper bounds, but upper has min value {}".format(np.min(upper)))
+
+    return upper
+
+
+def _check_P_initial(P_initial, n):
+    """
+    Validate an estimate of the support given as an array of indices.
+
+    Parameters
+    ----------
+    P_initial: Numpy array, dtype=int
+        The indices of the estimated support.
+
+    n: int
+        The number of columns of Z.
+    """
+
+    if not np.all((P_initial - P_initial.astype(int)) == 0):
+        raise ValueError("Expected only integer values, but P_initial has values {}".format(P_initial[(P_initial - P_initial.astype(int)) != 0]))
+    if np.any(P_initial >= n):
+        raise ValueError("Expected values between 0 and Z.shape[1], but P_initial has max value {}".format(np.max(P_initial)))
+    if np.any(P_initial < 0):
+        raise ValueError("Expected values between 0 and Z.shape[1], but P_initial has min value {}".format(np.min(P_initial)))
+    if P_initial.dtype != np.dtype('int64') and P_initial.dtype != np.dtype('int32') :
+        raise TypeError("Expected type int64 or int32, but P_initial is type {}".format(P_initial.dtype))
+
+
+def fix_constraint(ZTZ, ZTx, s, d, P, tolerance, lstsq = lambda A, x: np.linalg.inv(A).dot(x), engine=None,
+                   upper=None, U=None):
     """
     The inner loop of the Fast Non-megative Least Squares Algorithm described
     in the paper "A fast non-negativity-constrained least squares algorithm"
@@ -183,6 +1045,18 @@ def fix_constraint(ZTZ, ZTx, s, d, P, tolerance, lstsq = lambda A, x: np.linalg.
         least squares solution min_x ||Ax - b||.
         Must be of the form x = f(A,b).
 
+    engine: object, optional
+        By default, None. An object with a method
+        s = solve(ZTZ, P, ZTx[P]) to use in place of lstsq.
+
+    upper: Numpy array, optional
+        By default, None. Upper bounds of the solution, in which
+        case U must also be given, and s is also kept below them.
+
+    U: Numpy array, dtype=bool, optional
+        By default, None. The upper set, which contains the indices
+        fixed at their upper bound, updated in place.
+
     Returns
     -------
     s: Numpy array
@@ -198,19 +1072,42 @@ def fix_constraint(ZTZ, ZTx, s, d, P, tolerance, lstsq = lambda A, x: np.linalg.
     # find largest alpha such that d + alpha(s-d)
     # is close to s but non-negative
     q = P * (s <= tolerance)
-    alpha = np.nanmin(d[q] / (d[q] - s[q]))
+
+    if upper is None:
+        alpha = np.nanmin(d[q] / (d[q] - s[q]))
+    else:
+        # The step also stops where s crosses the upper bounds
+        r = P * (s >= upper - tolerance)
+        alpha = np.nanmin(np.concatenate([d[q] / (d[q] - s[q]), (upper[r] - d[r]) / (s[r] - d[r])]))
 
     # C3
     # Set d as close to s as possible while maintaining non-negativity
-    d = d + alpha * (s-d)
+    # The update is done in place, like the ones of s and P
+    d += alpha * (s-d)
 
     # C4
     # Move elements with d less than tolerance to active set
     P[d <= tolerance] = False
 
+    if upper is not None:
+        # and elements with d above their upper bound to the upper set
+        U[P & (d >= upper - tolerance)] = True
+        P[U] = False
+
+        # C5
+        # Set s to the least squares solution along the passive set,
+        # with the elements of the upper set at their bound
+        s[P] = _solve_passive(ZTZ, _bounded_rhs(ZTZ, ZTx, upper, U), P, lstsq, engine)
+
+        # C6
+        s[~P] = 0.
+        s[U] = upper[U]
+
+        return s, d, P
+
     # C5
     # Set s to the least squares solution along the passive set
-    s[P] = lstsq((ZTZ)[P][:,P], (ZTx)[P])
+    s[P] = _solve_passive(ZTZ, ZTx, P, lstsq, engine)
 
     # C6
     # Set values of s in active set to 0.
@@ -218,9 +1115,42 @@ def fix_constraint(ZTZ, ZTx, s, d, P, tolerance, lstsq = lambda A, x: np.linalg.
 
     return s, d, P
 
-def RK(A,b,k=100, random_state=None):
+def _bounded_rhs(ZTZ, ZTx, upper, U):
+    """
+    The right hand side ZTx - ZTZ[:,U]*upper[U] of the least squares
+    problem along the passive set, with the upper set at its bounds.
+    """
+
+    if not U.any():
+        return ZTx
+
+    # A product with the bounds set to zero off U is faster than
+    # extracting the columns of U
+    return ZTx - ZTZ @ np.where(U, upper, 0)
+
+
+def _solve_passive(ZTZ, ZTx, P, lstsq, engine):
+    """
+    Solve the least squares problem along the passive set P,
+    either with the function lstsq or with an engine.
+    """
+
+    if engine is None:
+        idx = np.flatnonzero(P)
+        return lstsq(_block(ZTZ, idx, idx), ZTx[idx])
+
+    return engine.solve(ZTZ, P, (ZTx)[P])
+
+def RK(A,b,k=100, random_state=None, sampling="uniform", nonnegative=False, x0=None):
     """
-    Function that runs k iterations of randomized Kaczmarz iterations (with uniform sampling).
+    Function that runs k iterations of randomized Kaczmarz iterations.
+
+    The squared norms of the rows of A are computed once, and the rows
+    are drawn in batches from a np.random.Generator, either uniformly
+    or with probability proportional to their squared norm. With
+    nonnegative=True, every iterate is projected onto x >= 0, which
+    gives a fast approximate solution of the nonnegative least squares
+    problem, for example to warm start fnnls.
 
     Parameters
     ----------
@@ -230,8 +1160,15 @@ def RK(A,b,k=100, random_state=None):
         The measurement vector (size m x 1).
     k : int_, optional
         Number of iterations (default is 100).
-    random_state: int, optional
-        Random state for NumPy random sampling
+    random_state: int or np.random.Generator, optional
+        Seed or generator for NumPy random sampling
+    sampling: str, optional
+        Either "uniform" (default) or "norm", to sample the rows
+        with probability proportional to their squared norm.
+    nonnegative: bool, optional
+        Whether to project the iterates onto x >= 0 (default is False).
+    x0: NumPy array, optional
+        The initial iterate (default is the zero vector).
 
     Returns
     -------
@@ -239,27 +1176,40 @@ def RK(A,b,k=100, random_state=None):
         The approximate solution
     """
 
-    if random_state != None:
-        np.random.seed(random_state)
+    A, b = np.asarray(A), np.asarray(b)
 
     m, n = np.shape(A)
-    x = np.zeros([n])
+    x = np.zeros([n]) if x0 is None else np.array(x0, dtype=float)
+
+    # Squared norms of the rows, computed once
+    norms = np.einsum('ij,ij->i', A, A)
 
     # At each iteration, we examine the indices at a subset of the indices,
     # and update x accordingly
-    for i in range(k):
+    for ind in _sample(norms, k, sampling, random_state):
 
-        ind = np.random.choice(range(m))
         # Here we calculate the randomized kaczmarz step:
         #     x = x + A^T * (b - Ax) / || A ||^2
         # where A is replaced with the a single row of A, A[ind].
-        x = x + np.transpose(A[ind,:])*(b[ind] - A[ind,:] @ x)/(np.linalg.norm(A[ind,:])**2)
+        a = A[ind]
+        x += a * ((b[ind] - a @ x) / norms[ind])
+
+        if nonnegative:
+            np.maximum(x, 0, out=x)
 
     return x
 
-def RGS(A,b,k=100, random_state=None):
+def RGS(A,b,k=100, random_state=None, sampling="uniform", nonnegative=False, x0=None):
     """
-    Function that runs k iterations of randomized Gauss-Seidel iterations (with uniform sampling).
+    Function that runs k iterations of randomized Gauss-Seidel iterations.
+
+    The squared norms of the columns of A are computed once, the
+    columns are drawn in batches from a np.random.Generator, either
+    uniformly or with probability proportional to their squared norm,
+    and the residual b - Ax is updated along with x, so that each
+    iteration costs O(m) instead of O(mn). With nonnegative=True, the
+    coordinates are kept nonnegative, which is projected coordinate
+    descent for the nonnegative least squares problem.
 
     Parameters
     ----------
@@ -269,8 +1219,15 @@ def RGS(A,b,k=100, random_state=None):
         The measurement vector (size m x 1).
     k : int_, optional
         Number of iterations (default is 100).
-    random_state: int, optional
-        Random state for NumPy random sampling
+    random_state: int or np.random.Generator, optional
+        Seed or generator for NumPy random sampling
+    sampling: str, optional
+        Either "uniform" (default) or "norm", to sample the columns
+        with probability proportional to their squared norm.
+    nonnegative: bool, optional
+        Whether to keep the iterates in x >= 0 (default is False).
+    x0: NumPy array, optional
+        The initial iterate (default is the zero vector).
 
     Returns
     -------
@@ -278,20 +1235,56 @@ def RGS(A,b,k=100, random_state=None):
         The approximate solution
     """
 
-    if random_state != None:
-        np.random.seed(random_state)
+    # Columns are contiguous in Fortran order
+    A, b = np.asfortranarray(A), np.asarray(b)
 
     m, n = np.shape(A)
-    x = np.zeros([n])
+    x = np.zeros([n]) if x0 is None else np.array(x0, dtype=float)
+
+    # Squared norms of the columns, computed once
+    norms = np.einsum('ij,ij->j', A, A)
+
+    # The residual b - Ax, updated along with x
+    r = b - A @ x
 
     # At each iteration, we examine the indices at a subset of the indices,
     # and update x accordingly
-    for i in range(k):
+    for ind in _sample(norms, k, sampling, random_state):
 
-        ind = np.random.choice(range(n))
         # Here we calculate the randomized gauss-seidel step:
         #     x_ind = x_ind + A_ind^T * (b - Ax) / || A ||^2
-        # Where A_ind is the ind row of A
-        x[ind] = x[ind] + (np.transpose(A[:,ind]) @ (b - A @ x)/(np.linalg.norm(A[:,ind])**2))
+        # Where A_ind is the ind column of A
+        a = A[:,ind]
+        step = (a @ r) / norms[ind]
+
+        if nonnegative:
+            step = max(step, -x[ind])
+
+        x[ind] += step
+        r -= step * a
 
     return x
+
+def _sample(norms, k, sampling, random_state, batch_size=4096):
+    """
+    Generate k random indices of rows or columns with nonzero norms,
+    drawn in batches of batch_size from a np.random.Generator.
+    """
+
+    if sampling not in ("uniform", "norm"):
+        raise ValueError("Expected sampling to be \"uniform\" or \"norm\", but it is {}".format(sampling))
+
+    rng = np.random.default_rng(random_state)
+
+    # Rows or columns of zeros can never change x
+    candidates = np.flatnonzero(norms > 0)
+
+    if candidates.shape[0] == 0:
+        return
+
+    p = None
+    if sampling == "norm":
+        p = norms[candidates] / np.sum(norms[candidates])
+
+    for start in range(0, k, batch_size):
+        yield from candidates[rng.choice(candidates.shape[0], size=min(batch_size, k - start), p=p)]
@@ -0,0 +1,221 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import LinearOperator
+
+from .operators import _operator_gram, _LinearGram
+
+
+def gram(Z, X, density=0.25, weights=None, chunk_size=8192):
+    """
+    Compute the Gram quantities ZTZ = Z^T*Z and ZTX = Z^T*X used by
+    the Fast Non-negative Least Squares Algorithm.
+
+    Z may be a NumPy array or a scipy.sparse matrix. A sparse Z is
+    never densified: both products are sparse products, and ZTZ is
+    kept sparse unless its fraction of nonzero entries is above
+    density, in which case a dense array is faster to work with.
+
+    Z may also be a scipy.sparse.linalg.LinearOperator, such as a
+    Convolution, in which case ZTZ is an operator that only forms the
+    blocks of Z^T*Z it is indexed with, see Convolution.
+
+    The products keep the floating point type of Z and X, so that
+    float32 inputs give float32 Gram quantities, while integer
+    inputs give float64 ones.
+
+    With weights, the weighted quantities Z^T*W*Z and Z^T*W*X, for
+    W the diagonal matrix of the weights, are accumulated over blocks
+    of chunk_size rows, so that only a block of rows of sqrt(W)*Z is
+    ever formed rather than a scaled copy of the whole of Z.
+
+    Parameters
+    ----------
+    Z: NumPy array, scipy.sparse matrix or LinearOperator
+        Z is an m x n matrix.
+
+    X: Numpy array
+        X is a m x 1 vector or an m x k matrix.
+
+    density: float, optional
+        By default, 0.25. The fraction of nonzero entries of
+        a sparse ZTZ above which it is made dense.
+
+    weights: NumPy array, optional
+        By default, None. A vector of length m of nonnegative
+        weights of the rows of Z and X.
+
+    chunk_size: int, optional
+        By default, 8192. The number of rows per block
+        when weights are given.
+
+    Returns
+    -------
+    ZTZ: NumPy array, scipy.sparse matrix or operator
+        ZTZ is an n x n matrix equal to Z.T * Z, an operator
+        indexed like an array for a LinearOperator Z
+    ZTX: NumPy array
+        ZTX is an n x 1 vector or an n x k matrix equal to Z.T * X
+    """
+
+    dtype = _float_dtype(Z.dtype, X.dtype)
+
+    if isinstance(Z, LinearOperator):
+        if weights is not None:
+            raise ValueError("Expected no weights for a LinearOperator Z, but weights were given")
+        return _operator_gram(Z, X)
+
+    if weights is not None:
+        return _weighted_gram(Z, X, weights, dtype, density, chunk_size)
+
+    if not sparse.issparse(Z):
+        Z = Z.astype(dtype, copy=False)
+        return Z.T.dot(Z), Z.T.dot(X).astype(dtype, copy=False)
+
+    n = Z.shape[1]
+
+    Z = Z.astype(dtype, copy=False)
+    ZTZ = sparse.csr_matrix(Z.T @ Z)
+    ZTX = np.asarray(Z.T @ X).astype(dtype, copy=False)
+
+    if ZTZ.nnz > density * n * n:
+        ZTZ = ZTZ.toarray()
+
+    return ZTZ, ZTX
+
+
+def _weighted_gram(Z, X, weights, dtype, density, chunk_size):
+    """
+    Accumulate Z^T*W*Z and Z^T*W*X over blocks of rows, as the
+    products of the blocks of sqrt(W)*Z with themselves.
+    """
+
+    weights = _check_weights(weights, Z.shape[0])
+
+    m, n = Z.shape
+
+    root = np.sqrt(weights).astype(dtype, copy=False)
+    Z = Z.astype(dtype, copy=False)
+
+    ZTZ = sparse.csr_matrix((n, n), dtype=dtype) if sparse.issparse(Z) else np.zeros((n, n), dtype=dtype)
+    ZTX = np.zeros((n,) + X.shape[1:], dtype=dtype)
+
+    for start in range(0, m, chunk_size):
+
+        stop = min(start + chunk_size, m)
+        r = root[start:stop]
+
+        # A block of rows of sqrt(W)*Z, and of sqrt(W)*X
+        if sparse.issparse(Z):
+            Z_block = sparse.csr_matrix(sparse.diags(r) @ Z[start:stop])
+        else:
+            Z_block = Z[start:stop] * r[:, None]
+
+        X_block = X[start:stop] * (r if len(X.shape) == 1 else r[:, None])
+
+        ZTZ += Z_block.T @ Z_block
+        ZTX += np.asarray(Z_block.T @ X_block).astype(dtype, copy=False)
+
+    if sparse.issparse(ZTZ) and ZTZ.nnz > density * n * n:
+        ZTZ = ZTZ.toarray()
+
+    return ZTZ, ZTX
+
+
+def _check_weights(weights, m):
+    """
+    Validate a vector of m nonnegative weights.
+    """
+
+    weights = np.asarray_chkfinite(weights)
+
+    if weights.shape != (m,):
+        raise ValueError("Incompatable dimensions. Expected a weight for each of the {} rows of Z, but weights is of shape {}".format(m, weights.shape))
+    if np.any(weights < 0):
+        raise ValueError("Expected nonnegative weights, but weights has min value {}".format(np.min(weights)))
+
+    return weights
+
+
+def _penalize(ZTZ, ZTX, l1=0, l2=0):
+    """
+    Add the penalties l1*1^T*d and l2*||d||^2 to the objective
+    ||x - Zd||^2 of the Gram quantities, by adding l2 to the diagonal
+    of ZTZ and subtracting l1/2 from ZTX, in place for a dense ZTZ.
+
+    Parameters
+    ----------
+    ZTZ: NumPy array or scipy.sparse matrix
+        ZTZ is an n x n matrix equal to Z.T * Z
+
+    ZTX: NumPy array
+        ZTX is an n x 1 vector or an n x k matrix equal to Z.T * X
+
+    l1, l2: float, optional
+        By default, 0. The weights of the penalties.
+
+    Returns
+    -------
+    ZTZ: NumPy array or scipy.sparse matrix
+        The penalized ZTZ, a new matrix if ZTZ is sparse.
+    ZTX: NumPy array
+        The penalized ZTX.
+    """
+
+    if l1 < 0 or l2 < 0:
+        raise ValueError("Expected nonnegative penalties, but l1 is {} and l2 is {}".format(l1, l2))
+
+    if l2:
+        if isinstance(ZTZ, _LinearGram):
+            ZTZ.shift += l2
+        elif sparse.issparse(ZTZ):
+            ZTZ = sparse.csr_matrix(ZTZ + l2 * sparse.identity(ZTZ.shape[0], dtype=ZTZ.dtype))
+        else:
+            ZTZ[np.diag_indices_from(ZTZ)] += l2
+
+    if l1:
+        ZTX -= l1 / 2
+
+    return ZTZ, ZTX
+
+
+def _float_dtype(*dtypes):
+    """
+    The floating point type to compute with for inputs of the given
+    types, float32 if they are all float32 or smaller, and float64 if
+    any of them is float64 or an integer type.
+    """
+
+    dtype = np.result_type(*dtypes)
+
+    if not np.issubdtype(dtype, np.floating):
+        return np.dtype(float)
+
+    return np.result_type(dtype, np.float32)
+
+
+def _block(ZTZ, rows, cols):
+    """
+    Extract the dense block ZTZ[rows][:,cols] with a single copy,
+    for ZTZ either a NumPy array or a scipy.sparse matrix.
+    """
+
+    B = ZTZ[np.asarray(rows, dtype=int)[:,None], cols]
+
+    if sparse.issparse(B):
+        B = B.toarray()
+
+    return B
+
+
+def _matvec(ZTZ, d, out):
+    """
+    Set out = ZTZ*d in place, for ZTZ either a NumPy array,
+    a scipy.sparse matrix or the Gram operator of a LinearOperator.
+    """
+
+    if isinstance(ZTZ, np.ndarray):
+        np.dot(ZTZ, d, out=out)
+    else:
+        out[:] = ZTZ @ d
+
+    return out
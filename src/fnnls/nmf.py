@@ -0,0 +1,174 @@
+from time import perf_counter
+
+import numpy as np
+
+from .batch import _fnnls_batch
+from .engines import CholeskyEngine, FactorCache
+from .gram import gram, _float_dtype
+
+
+def nmf(X, rank, W_initial=None, H_initial=None, max_iter=200, tol=1e-4,
+        random_state=None, lstsq = lambda A, x: np.linalg.inv(A).dot(x),
+        epsilon=None, engine=None, callback=None, full_output=False):
+    """
+    Nonnegative matrix factorization X ~ WH, with W >= 0 and H >= 0,
+    by alternating nonnegative least squares.
+
+    Each iteration solves min_H ||X - WH|| subject to H >= 0 and then
+    min_W ||X^T - H^T W^T|| subject to W >= 0, each half step with
+    the batched algorithm of fnnls_batch on all columns at once, so
+    that only the small rank x rank Gram matrices WTW and HHT are
+    factorized. Every column is warm started from its passive set at
+    the previous iteration, which, as the factors settle, leaves only
+    a few iterations of the active set loop per half step.
+
+    The iterations stop when the relative decrease of the objective
+    ||X - WH|| falls below tol, after max_iter iterations, or when
+    callback returns True.
+
+    Parameters
+    ----------
+    X: Numpy array
+        X is an m x k matrix with nonnegative entries.
+
+    rank: int
+        The number of columns of W and rows of H.
+
+    W_initial: Numpy array, optional
+        By default, None, and W starts from a random nonnegative
+        matrix scaled to X. The initial m x rank matrix W.
+
+    H_initial: Numpy array, optional
+        By default, None. An initial rank x k matrix H, whose
+        support is used to warm start the first half step.
+
+    max_iter: int, optional
+        By default, 200. The maximum number of iterations.
+
+    tol: float, optional
+        By default, 1e-4. The relative decrease of the objective
+        below which the iterations stop.
+
+    random_state: int or np.random.Generator, optional
+        Seed or generator for the random initial W.
+
+    lstsq: function
+        By default, the inverse of A multiplied by b.
+        Least squares function to use when calculating the
+        least squares solution min_x ||Ax - B||, where B
+        has one column per right hand side.
+        Must be of the form x = f(A,B).
+
+    epsilon: float
+        By default, it is the machine epsilon of the floating point
+        type of X, the numerical tolerance
+
+    engine: object, optional
+        By default, None. See fnnls_batch. The Gram matrices change
+        at every half step, so the engine must not keep factorizations
+        between calls, which excludes "cholesky", CholeskyEngine
+        and FactorCache.
+
+    callback: function, optional
+        By default, None. A function called at the end of every
+        iteration as callback(iteration, W, H, objective). If it
+        returns True, the iterations stop.
+
+    full_output: bool, optional
+        By default, False. If True, also return a dictionary with
+        the objective ||X - WH|| after every iteration under
+        "objective", the time of every iteration in seconds under
+        "times", the number of iterations under "iterations", the
+        reason the iterations stopped, "converged", "max_iter" or
+        "callback", under "exit_reason", and the final passive sets
+        of W^T and H under "P_W" and "P_H".
+
+    Returns
+    -------
+    W: Numpy array
+        W is an m x rank matrix
+    H: Numpy array
+        H is a rank x k matrix
+    info: dict
+        Only returned if full_output is True.
+    """
+
+    X = np.asarray_chkfinite(X)
+
+    if len(X.shape) != 2:
+        raise ValueError("Expected a two-dimensional array, but X is of shape {}".format(X.shape))
+    if np.any(X < 0):
+        raise ValueError("Expected nonnegative entries, but X has min value {}".format(np.min(X)))
+    if rank < 1:
+        raise ValueError("Expected a positive rank, but rank is {}".format(rank))
+
+    m, k = X.shape
+
+    dtype = _float_dtype(X.dtype)
+    X = X.astype(dtype, copy=False)
+
+    if engine == "cholesky" or isinstance(engine, (CholeskyEngine, FactorCache)):
+        raise ValueError("The \"cholesky\" engine, a CholeskyEngine and a FactorCache keep the factorizations of a single Gram matrix, but those of nmf change at every half step")
+
+    if W_initial is None:
+        rng = np.random.default_rng(random_state)
+        W = np.sqrt(X.mean() / rank) * rng.random((m, rank)).astype(dtype)
+    else:
+        W = np.array(W_initial, dtype=dtype)
+
+        if W.shape != (m, rank):
+            raise ValueError("Incompatable dimensions. Expected W_initial of shape {}, but W_initial is of shape {}".format((m, rank), W.shape))
+        if np.any(W < 0):
+            raise ValueError("Expected nonnegative entries, but W_initial has min value {}".format(np.min(W)))
+
+    # Passive sets of the columns of H and of W^T, warm starting the half steps
+    P_H = np.zeros((rank, k), dtype=bool)
+    P_W = W.T > 0
+
+    if H_initial is not None:
+        H_initial = np.asarray_chkfinite(H_initial)
+
+        if H_initial.shape != (rank, k):
+            raise ValueError("Incompatable dimensions. Expected H_initial of shape {}, but H_initial is of shape {}".format((rank, k), H_initial.shape))
+
+        P_H = H_initial > 0
+
+    XTX = np.sum(X * X)
+
+    objective = []
+    times = []
+    exit_reason = "max_iter"
+
+    for iteration in range(1, max_iter + 1):
+
+        start = perf_counter()
+
+        # min_H ||X - WH|| subject to H >= 0
+        WTW, WTX = gram(W, X)
+        H, P_H, _, _ = _fnnls_batch(WTW, WTX, P_H, lstsq, epsilon, engine)
+
+        # min_W ||X^T - H^T W^T|| subject to W >= 0
+        HHT, HXT = gram(H.T, X.T)
+        WT, P_W, _, _ = _fnnls_batch(HHT, HXT, P_W, lstsq, epsilon, engine)
+        W = WT.T
+
+        # ||X - WH||^2 = ||X||^2 - 2 <W, XH^T> + <W^T W, HH^T>, from the
+        # products of the last half step, which is accurate to about
+        # sqrt(epsilon) * ||X|| when the fit is nearly exact
+        objective.append(np.sqrt(max(XTX - 2 * np.sum(WT * HXT) + np.sum((WT @ W) * HHT), 0)))
+        times.append(perf_counter() - start)
+
+        if callback is not None and callback(iteration, W, H, objective[-1]):
+            exit_reason = "callback"
+            break
+
+        if iteration > 1 and objective[-2] - objective[-1] <= tol * objective[-2]:
+            exit_reason = "converged"
+            break
+
+    if full_output:
+        return [W, H, {"objective": np.array(objective), "times": np.array(times),
+                       "iterations": len(objective), "exit_reason": exit_reason,
+                       "P_W": P_W, "P_H": P_H}]
+
+    return [W, H]
@@ -0,0 +1,312 @@
+from collections import deque
+
+import numpy as np
+
+from .fnnls import fnnls_gram
+from .engines import CholeskyEngine, FactorCache
+
+
+class OnlineNNLS():
+    """
+    A nonnegative least squares solver for observations arriving one
+    row of Z and one entry of x at a time, refit over the most recent
+    ones on demand.
+
+    Rather than forming Z^T*Z from the whole window at every refit, at
+    a cost of O(Wn^2) for a window of W observations, ZTZ, ZTx and xTx
+    are kept up to date with a rank-one update for every observation
+    that arrives and a rank-one downdate for every observation that
+    leaves the window, at a cost of O(n^2) each. Every solve is warm
+    started from the passive set of the previous one, which changes
+    little between consecutive windows.
+
+    The downdates subtract from sums accumulated over many updates,
+    so the Gram quantities are recomputed from the window every
+    window downdates, which bounds the rounding errors they build up
+    at an amortized cost of O(n^2) per observation.
+
+    Parameters
+    ----------
+    n: int
+        The number of columns of Z.
+
+    window: int, optional
+        By default, None, and every observation is kept. The number
+        of most recent observations to fit, older ones are removed.
+
+    forgetting: float, optional
+        By default, 1. A factor 0 < forgetting <= 1 by which the
+        weight of every observation is multiplied when a new one
+        arrives, so that an observation k arrivals old has weight
+        forgetting^k, as in recursive least squares.
+
+    lstsq: function
+        By default, the inverse of A multiplied by b.
+        Least squares function to use when calculating the
+        least squares solution min_x ||Ax - b||.
+        Must be of the form x = f(A,b).
+
+    epsilon: float
+        By default, np.finfo(float).eps, the numerical tolerance
+
+    engine: str or object, optional
+        By default, None. See fnnls. ZTZ changes between solves, so
+        a CholeskyEngine is reset and a FactorCache cleared before
+        every solve.
+
+    l1, l2: float, optional
+        By default, 0. The weights of the penalties of every
+        solve, see fnnls.
+
+    backend: str, optional
+        By default, "numpy". See fnnls.
+
+    Attributes
+    ----------
+    ZTZ: Numpy array
+        The n x n matrix Z^T*W*Z of the observations of the window,
+        for W the diagonal matrix of their weights.
+
+    ZTx: Numpy array
+        The vector Z^T*W*x.
+
+    xTx: float
+        The weighted sum of squares x^T*W*x.
+
+    count: int
+        The number of observations in the window.
+
+    P: Numpy array
+        The indices of the passive set of the last solve, the
+        warm start of the next one.
+    """
+
+    def __init__(self, n, window=None, forgetting=1.,
+                 lstsq = lambda A, x: np.linalg.inv(A).dot(x),
+                 epsilon=None, engine=None, l1=0, l2=0, backend="numpy"):
+
+        if n < 1:
+            raise ValueError("Expected a positive number of columns, but n is {}".format(n))
+        if window is not None and window < 1:
+            raise ValueError("Expected a positive window, but window is {}".format(window))
+        if not 0 < forgetting <= 1:
+            raise ValueError("Expected 0 < forgetting <= 1, but forgetting is {}".format(forgetting))
+
+        self.n = n
+        self.window = window
+        self.forgetting = forgetting
+        self.lstsq = lstsq
+        self.epsilon = epsilon
+        self.engine = engine
+        self.l1 = l1
+        self.l2 = l2
+        self.backend = backend
+
+        # The Gram quantities are accumulated in double precision, as
+        # the rounding errors of long sums grow with their length
+        self.ZTZ = np.zeros((n, n))
+        self.ZTx = np.zeros(n)
+        self.xTx = 0.
+        self.count = 0
+        self.P = np.zeros(0, dtype=int)
+
+        # The rows of the window, needed to remove them when they expire
+        self._rows = deque()
+        self._downdates = 0
+
+    def add(self, z, x):
+        """
+        Add an observation, a row z of Z and an entry x of x, or a
+        block of observations, with a rank-one update of the Gram
+        quantities for each.
+
+        Observations beyond the window are removed, oldest first.
+
+        Parameters
+        ----------
+        z: Numpy array
+            z is a vector of length n, or a b x n matrix
+            of b observations, from oldest to newest.
+
+        x: float or Numpy array
+            x is a scalar, or a vector of length b.
+        """
+
+        Z_block, x_block = self._check(z, x)
+
+        b = Z_block.shape[0]
+
+        # Age the previous observations by b arrivals, the rows of the
+        # block are then weighted from forgetting^(b-1) down to 1
+        weights = None
+
+        if self.forgetting != 1:
+            decay = self.forgetting ** b
+            self.ZTZ *= decay
+            self.ZTx *= decay
+            self.xTx *= decay
+            weights = self.forgetting ** np.arange(b - 1, -1, -1)
+
+        self._update(Z_block, x_block, weights)
+        self.count += b
+
+        if self.window is None:
+            return
+
+        self._rows.extend(zip(Z_block.copy(), x_block.copy()))
+
+        expired = len(self._rows) - self.window
+
+        if expired > 0:
+
+            # The oldest rows expire, the i-th of them with
+            # window + expired - 1 - i newer observations
+            rows = [self._rows.popleft() for _ in range(expired)]
+
+            weights = None
+
+            if self.forgetting != 1:
+                weights = self.forgetting ** np.arange(self.window + expired - 1, self.window - 1, -1)
+
+            self._update(np.array([row[0] for row in rows]), np.array([row[1] for row in rows]), weights, -1)
+            self.count -= expired
+            self._downdates += expired
+
+            if self._downdates >= self.window:
+                self.refresh()
+
+    def remove(self, z, x):
+        """
+        Remove an observation, or a block of observations, added
+        earlier, with a rank-one downdate of the Gram quantities
+        for each.
+
+        Only available without a window, which removes its own
+        observations, and without forgetting, since the weight
+        of the observation would not be known.
+
+        Parameters
+        ----------
+        z: Numpy array
+            z is a vector of length n, or a b x n matrix.
+
+        x: float or Numpy array
+            x is a scalar, or a vector of length b.
+        """
+
+        if self.window is not None or self.forgetting != 1:
+            raise ValueError("Observations can only be removed explicitly without a window or forgetting")
+
+        Z_block, x_block = self._check(z, x)
+
+        if Z_block.shape[0] > self.count:
+            raise ValueError("Expected at most {} observations to remove, but {} were given".format(self.count, Z_block.shape[0]))
+
+        self._update(Z_block, x_block, None, -1)
+        self.count -= Z_block.shape[0]
+
+    def refresh(self):
+        """
+        Recompute the Gram quantities from the observations of the
+        window, discarding the rounding errors built up by the
+        downdates. Called automatically every window downdates.
+        """
+
+        self._downdates = 0
+
+        if self.window is None:
+            return
+
+        self.ZTZ[:] = 0
+        self.ZTx[:] = 0
+        self.xTx = 0.
+
+        if self._rows:
+            Z_window = np.array([row[0] for row in self._rows])
+            x_window = np.array([row[1] for row in self._rows])
+
+            weights = None
+
+            if self.forgetting != 1:
+                weights = self.forgetting ** np.arange(len(self._rows) - 1, -1, -1)
+
+            self._update(Z_window, x_window, weights)
+
+    def solve(self, full_output=False, stats=None, callback=None):
+        """
+        Solve min_d ||sqrt(W)(x - Zd)|| subject to d >= 0 over the
+        observations of the window, warm started from the passive
+        set of the previous solve.
+
+        Parameters
+        ----------
+        full_output: bool, optional
+            By default, False. See fnnls.
+
+        stats: SolverStats, optional
+            By default, None. See fnnls, gram_time is 0 since
+            the Gram quantities are already formed.
+
+        callback: function, optional
+            By default, None. See fnnls.
+
+        Returns
+        -------
+        d: Numpy array
+            d is a nx1 vector
+        res: float
+            The residual ||sqrt(W)(x - Zd)||, without the penalties,
+            computed from the Gram quantities
+        info: dict
+            Only returned if full_output is True.
+        """
+
+        if isinstance(self.engine, CholeskyEngine):
+            self.engine.reset(self.n, self.ZTZ.dtype)
+        elif isinstance(self.engine, FactorCache):
+            self.engine.clear()
+
+        d, res, info = fnnls_gram(self.ZTZ, self.ZTx, self.xTx, self.P, self.lstsq, self.epsilon, self.engine,
+                                  full_output=True, stats=stats, callback=callback, l1=self.l1, l2=self.l2,
+                                  backend=self.backend)
+
+        self.P = info["P"]
+
+        if full_output:
+            return [d, res, info]
+
+        return [d, res]
+
+    def _update(self, Z_block, x_block, weights=None, sign=1):
+        """
+        Add the rows of Z_block and entries of x_block, with weights,
+        to the Gram quantities, or subtract them if sign is -1.
+        """
+
+        WZ = Z_block if weights is None else weights[:, None] * Z_block
+        Wx = x_block if weights is None else weights * x_block
+
+        if sign < 0:
+            WZ, Wx = -WZ, -Wx
+
+        self.ZTZ += WZ.T.dot(Z_block)
+        self.ZTx += WZ.T.dot(x_block)
+        self.xTx += Wx.dot(x_block)
+
+    def _check(self, z, x):
+        """
+        Validate an observation or a block of observations, returned
+        as a b x n matrix and a vector of length b.
+        """
+
+        z, x = np.asarray_chkfinite(z, dtype=float), np.asarray_chkfinite(x, dtype=float)
+
+        if len(z.shape) == 1:
+            z, x = z[None, :], x.reshape(-1)
+
+        if len(z.shape) != 2 or z.shape[1] != self.n:
+            raise ValueError("Incompatable dimensions. Expected a row of length {} or a matrix of {} columns, but z is of shape {}".format(self.n, self.n, z.shape))
+        if x.shape != (z.shape[0],):
+            raise ValueError("Incompatable dimensions. Expected an entry of x for each of the {} rows of z, but x is of shape {}".format(z.shape[0], x.shape))
+
+        return z, x
@@ -0,0 +1,258 @@
+import numpy as np
+from scipy import fft
+from scipy.sparse.linalg import LinearOperator
+
+
+class Convolution(LinearOperator):
+    """
+    The matrix Z of the convolution of a vector d of length n with a
+    kernel, Zd = np.convolve(d, kernel, mode), as a LinearOperator,
+    for nonnegative deconvolution without forming Z.
+
+    The products Zd and Z^T*y are convolutions, computed with FFTs for
+    long kernels and signals. ZTZ is never formed: its entries are the
+    autocorrelation of the kernel, ZTZ[i,j] = r[|i-j|] for the "full"
+    mode, in which ZTZ is Toeplitz, less a correction from the rows cut
+    off at the ends for the "same" and "valid" modes. fnnls then only
+    forms the blocks of ZTZ along the passive set, with O(n) memory.
+
+    Parameters
+    ----------
+    kernel: Numpy array
+        The kernel, a vector of length L.
+
+    n: int
+        The length of d, the number of columns of Z.
+
+    mode: str, optional
+        By default, "full". One of "full", "same" or "valid", as for
+        np.convolve, giving m = n + L - 1, max(n, L) or n - L + 1 rows.
+    """
+
+    def __init__(self, kernel, n, mode="full"):
+
+        kernel = np.asarray_chkfinite(kernel)
+
+        if len(kernel.shape) != 1 or kernel.shape[0] == 0:
+            raise ValueError("Expected a non-empty one-dimensional array, but kernel is of shape {}".format(kernel.shape))
+        if mode not in ("full", "same", "valid"):
+            raise ValueError("Expected mode to be \"full\", \"same\" or \"valid\", but mode is {}".format(mode))
+
+        L = kernel.shape[0]
+
+        # The rows of the full convolution kept by the mode
+        if mode == "full":
+            m, offset = n + L - 1, 0
+        elif mode == "same":
+            m, offset = max(n, L), (min(n, L) - 1) // 2
+        else:
+            m, offset = max(n, L) - min(n, L) + 1, min(n, L) - 1
+
+        if mode != "full" and L > n:
+            raise ValueError("Expected a kernel no longer than n for mode \"{}\", but kernel is of length {} and n is {}".format(mode, L, n))
+
+        # Integer kernels give float64 products, float32 ones are kept
+        dtype = np.result_type(kernel.dtype, np.float32)
+
+        super().__init__(dtype=dtype, shape=(m, n))
+
+        self.kernel = kernel.astype(dtype, copy=False)
+        self.mode = mode
+        self.offset = offset
+
+    def _matvec(self, d):
+
+        full = _convolve(np.ravel(d), self.kernel)
+
+        return full[self.offset:self.offset + self.shape[0]]
+
+    def _rmatvec(self, y):
+
+        m, n = self.shape
+        L = self.kernel.shape[0]
+
+        # Z^T*y, the correlation of y, padded back into the rows of
+        # the full convolution, with the kernel
+        padded = np.zeros(n + L - 1, dtype=np.result_type(self.dtype, y.dtype))
+        padded[self.offset:self.offset + m] = np.ravel(y)
+
+        # The "valid" part of the correlation
+        return _convolve(padded, self.kernel[::-1])[L - 1:n + L - 1]
+
+    def gram(self):
+        """
+        The Gram matrix Z^T*Z as an operator, whose entries are computed
+        from the autocorrelation of the kernel.
+        """
+
+        return _ConvolutionGram(self)
+
+
+def _operator_gram(Z, X):
+    """
+    The Gram quantities of a LinearOperator Z, ZTZ as an operator
+    which forms only the blocks that are indexed, and ZTX.
+    """
+
+    ZTZ = Z.gram() if isinstance(Z, Convolution) else _OperatorGram(Z)
+    ZTX = Z.rmatvec(X) if len(X.shape) == 1 else Z.rmatmat(X)
+
+    return ZTZ, np.asarray(ZTX, dtype=ZTZ.dtype)
+
+
+class _LinearGram():
+    """
+    The Gram matrix Z^T*Z + shift*I of a LinearOperator Z, with the
+    products and the indexing used by the active set loop, ZTZ @ d,
+    ZTZ[rows[:,None], cols] and ZTZ[i, j], without forming it.
+
+    shift is the penalty l2, added to the diagonal by _penalize.
+    """
+
+    def __init__(self, Z):
+
+        self.Z = Z
+        self.shape = (Z.shape[1], Z.shape[1])
+        self.dtype = np.dtype(np.result_type(Z.dtype, np.float32))
+        self.shift = 0
+
+    def __matmul__(self, d):
+
+        return self.Z.rmatvec(self.Z.matvec(d)) + self.shift * d
+
+    def __getitem__(self, key):
+
+        rows, cols = np.asarray(key[0]), np.asarray(key[1])
+
+        B = self._block(rows.ravel(), cols.ravel())
+        B[rows.ravel()[:, None] == cols.ravel()] += self.shift
+
+        # A scalar for ZTZ[i, j], and a block for ZTZ[rows[:,None], cols]
+        if rows.ndim == 0 and cols.ndim == 0:
+            return B[0, 0]
+
+        return B
+
+
+class _ConvolutionGram(_LinearGram):
+    """
+    The Gram matrix of a Convolution, whose entries come from the
+    autocorrelation r of the kernel, r[k] = sum_t kernel[t]*kernel[t+k].
+
+    For the "same" and "valid" modes, the rows of the full convolution
+    that are cut off are subtracted again. Each of them only meets the
+    first or the last L - 1 columns, so they are kept as two small
+    dense matrices.
+    """
+
+    def __init__(self, Z):
+
+        super().__init__(Z)
+
+        kernel = Z.kernel
+        L = kernel.shape[0]
+        m, n = Z.shape
+
+        self._r = np.correlate(kernel, kernel, mode="full")[L - 1:]
+
+        # Rows cut off before and after the kept rows of the full
+        # convolution, Z_full[t, j] = kernel[t - j]
+        top = np.arange(Z.offset)
+        bottom = np.arange(Z.offset + m, n + L - 1)
+
+        self._top = self._rows(top, 0, min(n, Z.offset))
+        self._bottom_start = max(0, Z.offset + m - L + 1)
+        self._bottom = self._rows(bottom, self._bottom_start, n)
+
+    def _rows(self, t, start, stop):
+        """
+        The rows t of the full convolution matrix, restricted to
+        the columns from start to stop.
+        """
+
+        lag = t[:, None] - np.arange(start, stop)[None, :]
+        inside = (lag >= 0) & (lag < self.Z.kernel.shape[0])
+
+        return np.where(inside, self.Z.kernel[np.clip(lag, 0, self.Z.kernel.shape[0] - 1)], 0)
+
+    def _block(self, rows, cols):
+
+        L = self._r.shape[0]
+
+        lag = np.abs(rows[:, None] - cols[None, :])
+        B = np.where(lag < L, self._r[np.minimum(lag, L - 1)], 0).astype(self.dtype)
+
+        B -= _correction(self._top, rows, cols, 0)
+        B -= _correction(self._bottom, rows, cols, self._bottom_start)
+
+        return B
+
+
+class _OperatorGram(_LinearGram):
+    """
+    The Gram matrix of a general LinearOperator, whose columns
+    Z^T*Z*e_j are computed with a product by Z and one by Z^T when
+    first indexed, and kept for the next blocks they are part of.
+    """
+
+    def __init__(self, Z):
+
+        super().__init__(Z)
+
+        self._columns = {}
+
+    def _column(self, j):
+
+        if j not in self._columns:
+            e = np.zeros(self.shape[0], dtype=self.dtype)
+            e[j] = 1
+            self._columns[j] = np.asarray(self.Z.rmatvec(self.Z.matvec(e)), dtype=self.dtype).ravel()
+
+        return self._columns[j]
+
+    def _block(self, rows, cols):
+
+        B = np.empty((rows.shape[0], cols.shape[0]), dtype=self.dtype)
+
+        for c, j in enumerate(cols):
+            B[:, c] = self._column(j)[rows]
+
+        return B
+
+
+def _convolve(a, b):
+    """
+    The full convolution of a and b, directly for short kernels
+    and with FFTs otherwise.
+    """
+
+    if min(a.shape[0], b.shape[0]) <= 64:
+        return np.convolve(a, b)
+
+    size = a.shape[0] + b.shape[0] - 1
+    fast = fft.next_fast_len(size, real=True)
+
+    full = fft.irfft(fft.rfft(a, fast) * fft.rfft(b, fast), fast)[:size]
+
+    return full.astype(np.result_type(a.dtype, b.dtype), copy=False)
+
+
+def _correction(E, rows, cols, start):
+    """
+    The block E[:, rows - start]^T * E[:, cols - start] of the rows E
+    of a convolution matrix, which cover the columns from start on,
+    with zero outside of them.
+    """
+
+    B = np.zeros((rows.shape[0], cols.shape[0]), dtype=E.dtype)
+
+    if E.size == 0:
+        return B
+
+    r = (rows >= start) & (rows < start + E.shape[1])
+    c = (cols >= start) & (cols < start + E.shape[1])
+
+    if r.any() and c.any():
+        B[np.ix_(r, c)] = E[:, rows[r] - start].T @ E[:, cols[c] - start]
+
+    return B
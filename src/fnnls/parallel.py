@@ -0,0 +1,225 @@
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+from scipy import sparse
+
+from .batch import _check, _fnnls_batch
+from .fnnls import _residual
+from .gram import gram, _penalize, _float_dtype, _check_weights
+
+
+# Environment variables read by the common BLAS libraries at load time
+_BLAS_THREADS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                 "BLIS_NUM_THREADS", "VECLIB_MAXIMUM_THREADS")
+
+# State of a worker process, set by _init_worker
+_worker = {}
+
+
+def _inverse(A, x):
+    """
+    The inverse of A multiplied by x, the default lstsq, defined at
+    module level so that it can be sent to the workers.
+    """
+
+    return np.linalg.inv(A).dot(x)
+
+
+def fnnls_parallel(Z, X, n_jobs=None, chunk_size=None, blas_threads=1,
+         P_initial = np.zeros(0, dtype=int), lstsq = _inverse,
+         epsilon=None, engine=None, l1=0, l2=0, weights=None):
+    """
+    Solve many nonnegative least squares problems that share the
+    same matrix Z, min_D ||X - ZD|| subject to D >= 0, on a pool of
+    worker processes.
+
+    ZTZ and ZTX are computed once and placed in shared memory, along
+    with the output D, so that nothing but the column ranges is sent to
+    the workers. Each worker solves its chunks of columns with the
+    algorithm of fnnls_batch and writes them directly into D. The BLAS
+    libraries of the workers are limited to blas_threads threads each,
+    so that n_jobs workers do not oversubscribe the cores.
+
+    Requires Python 3.8 or later.
+
+    Parameters
+    ----------
+    Z: NumPy array or scipy.sparse matrix
+        Z is an m x n matrix.
+
+    X: Numpy array
+        X is an m x k matrix, each column is a right hand side.
+
+    n_jobs: int, optional
+        By default, the number of CPUs. The number of worker processes.
+
+    chunk_size: int, optional
+        By default, enough columns for each worker to get
+        about four chunks. The number of columns per task.
+
+    blas_threads: int, optional
+        By default, 1. The number of BLAS threads of each worker.
+
+    P_initial: Numpy array, dtype=int
+        By default, an empty array. An estimate for the indices
+        of the support of the solution, shared by every column.
+
+    lstsq: function
+        By default, the inverse of A multiplied by b.
+        Least squares function to use when calculating the
+        least squares solution min_x ||Ax - B||, where B
+        has one column per right hand side.
+        Must be of the form x = f(A,B), and defined at module
+        level, so that it can be sent to the workers.
+
+    epsilon: float
+        By default, it is the machine epsilon of the floating point
+        type of Z and X, the numerical tolerance
+
+    engine: str, optional
+        By default, None. See fnnls. Only engines given by name
+        can be used, since each worker creates its own.
+
+    l1, l2: float, optional
+        By default, 0. The weights of the penalties, see fnnls.
+
+    weights: Numpy array, optional
+        By default, None. A vector of length m of nonnegative
+        weights of the observations, shared by every column,
+        see fnnls.
+
+    Returns
+    -------
+    D: Numpy array
+        D is an n x k matrix
+    res: Numpy array
+        res is a vector of length k with the residual
+        ||x - Zd|| of every column
+    """
+
+    Z, X, P_initial = _check(Z, X, P_initial)
+
+    if engine is not None and not isinstance(engine, str):
+        raise TypeError("Expected the name of an engine, but engine is of type {}".format(type(engine)))
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+
+    if weights is not None:
+        weights = _check_weights(weights, Z.shape[0])
+
+    dtype = _float_dtype(Z.dtype, X.dtype)
+
+    ZTZ, ZTX = gram(Z, X, weights=weights)
+    ZTZ, ZTX = _penalize(ZTZ, ZTX, l1, l2)
+
+    if sparse.issparse(ZTZ):
+        ZTZ = ZTZ.toarray()
+
+    ZTZ, ZTX = ZTZ.astype(dtype, copy=False), ZTX.astype(dtype, copy=False)
+
+    n, k = ZTX.shape
+
+    chunk_size = chunk_size or max(1, -(-k // (4 * n_jobs)))
+    chunks = [(start, min(start + chunk_size, k)) for start in range(0, k, chunk_size)]
+
+    blocks = []
+
+    try:
+        # Place the inputs and the output in shared memory
+        shared = {}
+        for name, array in (("ZTZ", ZTZ), ("ZTX", ZTX), ("D", None)):
+
+            shape = ZTX.shape if array is None else array.shape
+            block = shared_memory.SharedMemory(create=True, size=max(1, dtype.itemsize * int(np.prod(shape))))
+            blocks.append(block)
+
+            if array is not None:
+                np.ndarray(shape, dtype=dtype, buffer=block.buf)[:] = array
+
+            shared[name] = (block.name, shape, dtype)
+
+        with _blas_environment(blas_threads):
+            pool = multiprocessing.Pool(n_jobs, initializer=_init_worker,
+                                        initargs=(shared, P_initial, lstsq, epsilon, engine, blas_threads))
+
+        with pool:
+            pool.map(_solve_chunk, chunks)
+
+        D = np.ndarray(ZTX.shape, dtype=dtype, buffer=blocks[2].buf).copy()
+
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    res = _residual(Z, X, D, weights)  #Calculate residual loss ||x - Zd|| per column
+
+    return [D, res]
+
+
+class _blas_environment():
+    """
+    Context manager setting the number of BLAS threads in the
+    environment, which worker processes started inside it inherit.
+    """
+
+    def __init__(self, threads):
+
+        self.threads = str(threads)
+
+    def __enter__(self):
+
+        self.saved = {name: os.environ.get(name) for name in _BLAS_THREADS}
+
+        for name in _BLAS_THREADS:
+            os.environ[name] = self.threads
+
+    def __exit__(self, *args):
+
+        for name, value in self.saved.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
+
+
+def _init_worker(shared, P_initial, lstsq, epsilon, engine, blas_threads):
+    """
+    Attach a worker process to the shared arrays and limit its BLAS
+    threads, which the environment alone does not do for processes
+    that are forked after BLAS has been loaded.
+    """
+
+    try:
+        from threadpoolctl import threadpool_limits
+        _worker["limits"] = threadpool_limits(blas_threads, user_api="blas")
+    except ImportError:
+        pass
+
+    for name, (block_name, shape, dtype) in shared.items():
+
+        block = shared_memory.SharedMemory(name=block_name)
+
+        _worker[name + "_block"] = block
+        _worker[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    _worker["P_initial"] = P_initial
+    _worker["lstsq"] = lstsq
+    _worker["epsilon"] = epsilon
+    _worker["engine"] = engine
+
+
+def _solve_chunk(chunk):
+    """
+    Solve the columns start to stop of ZTX and write them into D.
+    """
+
+    start, stop = chunk
+
+    D, P, W, iterations = _fnnls_batch(_worker["ZTZ"], _worker["ZTX"][:, start:stop],
+                                       _worker["P_initial"], _worker["lstsq"],
+                                       _worker["epsilon"], _worker["engine"])
+
+    _worker["D"][:, start:stop] = D
@@ -0,0 +1,153 @@
+import numpy as np
+from scipy import sparse
+
+from .fnnls import _fnnls, _workspace, _residual
+from .batch import _check
+from .engines import CholeskyEngine, FactorCache
+from .gram import gram, _penalize
+
+
+def fnnls_path(Z, x, lambdas, penalty="l1", P_initial = np.zeros(0, dtype=int),
+         lstsq = lambda A, x: np.linalg.inv(A).dot(x),
+         epsilon=None, engine=None, full_output=False, l1=0, l2=0, weights=None):
+    """
+    Solve the penalized nonnegative least squares problem for every
+    value of a grid of penalties, min_d ||x - Zd||^2 + lambda*1^T*d or
+    min_d ||x - Zd||^2 + lambda*||d||^2 subject to d >= 0, giving the
+    regularization path of the solution.
+
+    ZTZ and ZTx are formed once, and each problem is warm started from
+    the final passive set of the previous one. Given in decreasing
+    order, the supports of consecutive solutions grow slowly, and each
+    solve only needs a few iterations. With the l1 penalty, only ZTx
+    changes along the path, so the factorization of an engine such as
+    "cholesky" is also carried from one solve to the next. With the l2
+    penalty, the diagonal of ZTZ changes, so a CholeskyEngine is reset
+    and a FactorCache cleared before every solve.
+
+    Parameters
+    ----------
+    Z: NumPy array or scipy.sparse matrix
+        Z is an m x n matrix.
+
+    x: Numpy array
+        x is a m x 1 vector.
+
+    lambdas: Numpy array
+        The nonnegative weights of the penalty, preferably in
+        decreasing order.
+
+    penalty: str, optional
+        By default, "l1". Either "l1" or "l2", the penalty
+        weighted by lambdas.
+
+    P_initial: Numpy array, dtype=int
+        By default, an empty array. An estimate for the indices
+        of the support of the solution for the first lambda.
+
+    lstsq: function
+        By default, the inverse of A multiplied by b.
+        Least squares function to use when calculating the
+        least squares solution min_x ||Ax - b||.
+        Must be of the form x = f(A,b).
+
+    epsilon: float
+        By default, it is the machine epsilon of the floating point
+        type of Z and x, the numerical tolerance
+
+    engine: str or object, optional
+        By default, None. See fnnls.
+
+    full_output: bool, optional
+        By default, False. If True, also return a dictionary with
+        the final passive sets as an n_lambdas x n boolean matrix
+        under "P", and the number of iterations of the outer loop
+        for every lambda under "iterations".
+
+    l1, l2: float, optional
+        By default, 0. Fixed weights of the penalties added for
+        every lambda, such as l2 for an elastic net path in l1.
+
+    weights: Numpy array, optional
+        By default, None. A vector of length m of nonnegative
+        weights of the observations, see fnnls.
+
+    Returns
+    -------
+    D: Numpy array
+        D is an n_lambdas x n matrix, the solution for every lambda
+    res: Numpy array
+        res is a vector of length n_lambdas with the residual
+        ||x - Zd||, without the penalties, for every lambda
+    info: dict
+        Only returned if full_output is True.
+    """
+
+    lambdas = np.asarray_chkfinite(lambdas)
+    x = np.asarray_chkfinite(x)
+
+    if len(lambdas.shape) != 1:
+        raise ValueError("Expected a one-dimensional array, but lambdas is of shape {}".format(lambdas.shape))
+    if np.any(lambdas < 0):
+        raise ValueError("Expected nonnegative penalties, but lambdas has min value {}".format(np.min(lambdas)))
+    if penalty not in ("l1", "l2"):
+        raise ValueError("Expected penalty to be \"l1\" or \"l2\", but penalty is {}".format(penalty))
+    if len(x.shape) != 1:
+        raise ValueError("Expected a one-dimensional array, but x is of shape {}".format(x.shape))
+
+    Z, X, P_initial = _check(Z, x[:, None], P_initial)
+
+    n = Z.shape[1]
+
+    ZTZ, ZTX = gram(Z, X, weights=weights)
+    ZTZ, ZTX = _penalize(ZTZ, ZTX, l1, l2)
+    ZTx = ZTX[:, 0]
+
+    if epsilon is None:
+        epsilon = np.finfo(ZTZ.dtype).eps
+
+    if engine == "cholesky":
+        engine = CholeskyEngine(epsilon)
+
+    D = np.zeros((lambdas.shape[0], n), dtype=ZTZ.dtype)
+    P_path = np.zeros((lambdas.shape[0], n), dtype=bool)
+    iterations = np.zeros(lambdas.shape[0], dtype=int)
+
+    # The workspace and the engine are shared by the whole path
+    workspace = _workspace(n, ZTZ.dtype)
+
+    ZTZ_lambda, ZTx_lambda = ZTZ, ZTx.copy()
+
+    # The diagonal without the penalty, a dense ZTZ is penalized in
+    # place by setting its diagonal rather than copied for every lambda
+    diagonal = ZTZ.diagonal().copy()
+
+    for i, lambda_ in enumerate(lambdas):
+
+        if penalty == "l1":
+            np.subtract(ZTx, lambda_ / 2, out=ZTx_lambda)
+        else:
+            if sparse.issparse(ZTZ):
+                ZTZ_lambda, _ = _penalize(ZTZ, ZTx_lambda, l2=lambda_)
+            else:
+                ZTZ[np.diag_indices(n)] = diagonal + lambda_
+
+            if isinstance(engine, CholeskyEngine):
+                engine.reset(n, ZTZ.dtype)
+            elif isinstance(engine, FactorCache):
+                engine.clear()
+
+        d, P, w, iterations[i] = _fnnls(ZTZ_lambda, ZTx_lambda, P_initial, lstsq, epsilon, engine, workspace)
+
+        D[i] = d
+        P_path[i] = P
+
+        # Warm start the next problem from this support
+        P_initial = np.flatnonzero(P)
+
+    res = _residual(Z, X, D.T, weights)  #Calculate residual loss ||x - Zd|| per lambda
+
+    if full_output:
+        return [D, res, {"P": P_path, "iterations": iterations}]
+
+    return [D, res]
@@ -0,0 +1,359 @@
+import numpy as np
+from scipy import sparse
+
+from .fnnls import fnnls
+from .batch import _check
+from .gram import _float_dtype, _check_weights
+
+
+def fnnls_screened(Z, x, P_initial = np.zeros(0, dtype=int),
+         lstsq = lambda A, x: np.linalg.inv(A).dot(x),
+         epsilon=None, engine=None, full_output=False, l1=0, l2=0, weights=None,
+         aggressive=False, working_size=None):
+    """
+    Solve min_d ||x - Zd|| subject to d >= 0, or its penalized form
+    as in fnnls, for a wide Z whose solution uses few of its columns,
+    without forming the n x n matrix ZTZ.
+
+    A first problem is solved on a working set of the working_size
+    columns most correlated with x, together with P_initial. Its
+    solution is a feasible point, from which the safe rules of screen
+    discard every column that is provably zero at the solution. While
+    more than twice as many columns are left as are in the working
+    set, the working set is grown by the working_size columns that most
+    violate the optimality conditions w <= 0, and the problem solved
+    and screened again from the better solution. In the default safe
+    mode, the problem is then solved on all of the remaining columns,
+    and only the Gram matrix of those is formed.
+
+    If aggressive is True, the working set is only ever grown by the
+    columns violating the optimality conditions, until none of the
+    columns left after screening violates them. This is a heuristic,
+    whose working sets are not safe, but the final check makes its
+    solution the same as in the safe mode, and it forms smaller Gram
+    matrices when the screening stays loose.
+
+    Parameters
+    ----------
+    Z: NumPy array or scipy.sparse matrix
+        Z is an m x n matrix.
+
+    x: Numpy array
+        x is a m x 1 vector.
+
+    P_initial: Numpy array, dtype=int
+        By default, an empty array. An estimate for the indices
+        of the support of the solution, always in the first
+        working set.
+
+    lstsq: function
+        By default, the inverse of A multiplied by b.
+        Least squares function to use when calculating the
+        least squares solution min_x ||Ax - b||.
+        Must be of the form x = f(A,b).
+
+    epsilon: float
+        By default, it is the machine epsilon of the floating point
+        type of Z and x, the numerical tolerance
+
+    engine: str or object, optional
+        By default, None. See fnnls. Every solve is on different
+        columns of Z, so an engine object must not keep
+        factorizations between calls, which excludes FactorCache.
+
+    full_output: bool, optional
+        By default, False. If True, also return a dictionary with
+        the final passive set under "P", the dual vector under "w",
+        the total number of iterations of the outer loop under
+        "iterations", as in fnnls, the boolean mask of the columns
+        left after screening under "kept", and the number of
+        solves under "solves".
+
+    l1, l2: float, optional
+        By default, 0. The weights of the penalties, see fnnls.
+
+    weights: Numpy array, optional
+        By default, None. A vector of length m of nonnegative
+        weights of the observations, see fnnls.
+
+    aggressive: bool, optional
+        By default, False. If True, only grow the working set by
+        the columns violating the optimality conditions, rather than
+        solving on all of the columns left after screening.
+
+    working_size: int, optional
+        By default, the largest of 100 and twice the length of
+        P_initial, at most n. The number of columns added to the
+        first working set, and to every working set if aggressive.
+
+    Returns
+    -------
+    d: Numpy array
+        d is a nx1 vector
+    res: float
+        The residual ||x - Zd||, without the penalties, and
+        weighted as ||sqrt(W)(x - Zd)|| with weights
+    info: dict
+        Only returned if full_output is True.
+    """
+
+    x = np.asarray_chkfinite(x)
+
+    if len(x.shape) != 1:
+        raise ValueError("Expected a one-dimensional array, but x is of shape {}".format(x.shape))
+
+    Z, _, P_initial = _check(Z, x[:, None], P_initial)
+
+    m, n = Z.shape
+
+    if weights is not None:
+        weights = _check_weights(weights, m)
+    if l1 < 0 or l2 < 0:
+        raise ValueError("Expected nonnegative penalties, but l1 is {} and l2 is {}".format(l1, l2))
+
+    dtype = _float_dtype(Z.dtype, x.dtype)
+
+    if epsilon is None:
+        epsilon = np.finfo(dtype).eps
+
+    if working_size is None:
+        working_size = max(100, 2 * P_initial.shape[0])
+    working_size = min(working_size, n)
+
+    if working_size < 1:
+        raise ValueError("Expected a positive working_size, but working_size is {}".format(working_size))
+
+    tolerance = epsilon * n
+    norms = _column_norms(Z, weights, l2)
+
+    d = np.zeros(n, dtype=dtype)
+    kept = np.ones(n, dtype=bool)
+
+    # The first working set, P_initial and the columns most correlated with x
+    r, g = _correlations(Z, x, d, weights, l2)
+    working = np.zeros(n, dtype=bool)
+    working[P_initial] = True
+    working[_largest(g, ~working & (g > l1 / 2 + tolerance), working_size)] = True
+
+    iterations = 0
+    solves = 0
+
+    while True:
+
+        index = np.flatnonzero(working)
+
+        # With no column correlated with x, d = 0 is the solution
+        if index.shape[0]:
+            d_working, _, info = fnnls(Z[:, index], x, np.flatnonzero(d[index] > 0), lstsq, epsilon, engine,
+                                       full_output=True, l1=l1, l2=l2, weights=weights)
+
+            d[:] = 0
+            d[index] = d_working
+            iterations += info["iterations"]
+            solves += 1
+
+            r, g = _correlations(Z, x, d, weights, l2)
+
+        kept &= ~_screen(x, d, r, g, norms, Z, l1, l2, weights)
+
+        violating = kept & ~working & (g > l1 / 2 + tolerance)
+
+        if not violating.any():
+            break
+
+        # Solve on every column left once the screening is tight enough
+        if aggressive or np.sum(kept | working) > 2 * np.sum(working):
+            working[_largest(g, violating, working_size)] = True
+        else:
+            working = kept | working
+
+    w = g - l1 / 2
+
+    res = np.linalg.norm(r if weights is None else np.sqrt(weights) * r)  #Calculate residual loss ||x - Zd||
+
+    if full_output:
+        return [d, res, {"P": np.flatnonzero(d > 0), "w": w, "iterations": iterations,
+                         "kept": kept, "solves": solves}]
+
+    return [d, res]
+
+
+def screen(Z, x, d=None, l1=0, l2=0, weights=None):
+    """
+    The gap safe screening rules of the nonnegative least squares
+    problem min_d ||x - Zd||^2 + l1*1^T*d + l2*||d||^2 subject to
+    d >= 0, which find columns of Z that are zero at every solution.
+
+    From any feasible d, a point of the dual problem, whose optimum
+    is the residual at the solution, is built from the residual
+    x - Zd, and the duality gap between the two bounds the distance
+    to that optimum. A column j is discarded if z_j^T*theta < l1/2
+    for every theta of that ball, so that the optimality conditions
+    force d_j = 0. The closer d is to the solution, the smaller the
+    ball and the more columns are discarded.
+
+    Without penalties, the dual point needs a direction u with
+    Z^T*u > 0, which is the vector of ones when the columns of Z
+    have positive sums, as for a nonnegative Z. Otherwise, no
+    column can be safely discarded, and every column is kept.
+
+    Parameters
+    ----------
+    Z: NumPy array or scipy.sparse matrix
+        Z is an m x n matrix.
+
+    x: Numpy array
+        x is a m x 1 vector.
+
+    d: Numpy array, optional
+        By default, zero. A nonnegative vector of length n.
+
+    l1, l2: float, optional
+        By default, 0. The weights of the penalties, see fnnls.
+
+    weights: Numpy array, optional
+        By default, None. A vector of length m of nonnegative
+        weights of the observations, see fnnls.
+
+    Returns
+    -------
+    kept: Numpy array
+        A boolean vector of length n, False for the columns which
+        are zero at every solution.
+    """
+
+    x = np.asarray_chkfinite(x)
+
+    if len(x.shape) != 1:
+        raise ValueError("Expected a one-dimensional array, but x is of shape {}".format(x.shape))
+
+    Z, _, _ = _check(Z, x[:, None], np.zeros(0, dtype=int))
+
+    m, n = Z.shape
+
+    if weights is not None:
+        weights = _check_weights(weights, m)
+    if l1 < 0 or l2 < 0:
+        raise ValueError("Expected nonnegative penalties, but l1 is {} and l2 is {}".format(l1, l2))
+
+    if d is None:
+        d = np.zeros(n, dtype=_float_dtype(Z.dtype, x.dtype))
+    else:
+        d = np.asarray_chkfinite(d)
+
+        if d.shape != (n,):
+            raise ValueError("Incompatable dimensions. Expected d of shape {}, but d is of shape {}".format((n,), d.shape))
+        if np.any(d < 0):
+            raise ValueError("Expected nonnegative entries, but d has min value {}".format(np.min(d)))
+
+    r, g = _correlations(Z, x, d, weights, l2)
+
+    return ~_screen(x, d, r, g, _column_norms(Z, weights, l2), Z, l1, l2, weights)
+
+
+def _screen(x, d, r, g, norms, Z, l1, l2, weights):
+    """
+    The columns discarded by the gap safe rules at d, with residual
+    r = x - Zd and g = Z^T*W*r - l2*d.
+
+    The problem is written as min_d 1/2*||y - Ad||^2 + l1/2*1^T*d
+    subject to d >= 0, for A = [sqrt(W)*Z; sqrt(l2)*I] and
+    y = [sqrt(W)*x; 0], whose dual is max 1/2*||y||^2 - 1/2*||y - theta||^2
+    subject to A^T*theta <= l1/2. The residual y - Ad is moved into
+    the dual feasible set either along a direction u with A^T*u > 0,
+    [sqrt(W)*1; 0] when the columns of Z^T*W have positive sums and
+    [0; 1] when l2 > 0, or by scaling it when l1 > 0. A column is
+    discarded if it passes the test of any of these dual points, as
+    each of their balls contains the optimum.
+    """
+
+    threshold = l1 / 2
+
+    sqrt_weights = 1 if weights is None else np.sqrt(weights)
+
+    Zd = x - r
+
+    # Primal objective 1/2*||y - Ad||^2 + l1/2*1^T*d
+    primal = (np.sum((sqrt_weights * r) ** 2) + l2 * np.dot(d, d)) / 2 + threshold * np.sum(d)
+    yTy = np.sum((sqrt_weights * x) ** 2)
+
+    # The gap is computed to about epsilon*||y||^2, so the radius is only
+    # accurate to about sqrt(epsilon)*||y||
+    slack = np.sqrt(np.finfo(g.dtype).eps * yTy)
+
+    # A^T*theta and 1/2*||y - theta||^2 for every dual point
+    candidates = []
+
+    c = Z.T @ (np.ones_like(x) if weights is None else weights)
+    c = np.asarray(c).ravel()
+
+    if np.all(c > 0):
+        t = max(0, np.max((g - threshold) / c))
+        candidates.append((g - t * c, (np.sum((sqrt_weights * (Zd + t)) ** 2) + l2 * np.dot(d, d)) / 2))
+
+    if l2 > 0:
+        t = max(0, np.max(g - threshold) / np.sqrt(l2))
+        candidates.append((g - t * np.sqrt(l2), (np.sum((sqrt_weights * Zd) ** 2) + np.sum((np.sqrt(l2) * d + t) ** 2)) / 2))
+
+    if l1 > 0:
+        s = min(1, threshold / np.max(g)) if np.max(g) > 0 else 1
+        candidates.append((s * g, (np.sum((sqrt_weights * (x - s * r)) ** 2) + s ** 2 * l2 * np.dot(d, d)) / 2))
+
+    screened = np.zeros(d.shape[0], dtype=bool)
+
+    for ATtheta, distance in candidates:
+
+        gap = primal - (yTy / 2 - distance)
+        radius = np.sqrt(2 * max(gap, 0)) + slack
+
+        screened |= ATtheta + radius * norms < threshold
+
+    return screened
+
+
+def _correlations(Z, x, d, weights, l2):
+    """
+    The residual r = x - Zd and the vector g = Z^T*W*r - l2*d, which
+    is the dual vector ZTx - ZTZ*d of the problem before l1 is
+    subtracted.
+    """
+
+    support = np.flatnonzero(d)
+
+    r = x - Z[:, support] @ d[support]
+    g = Z.T @ (r if weights is None else weights * r)
+    g = np.asarray(g).ravel().astype(d.dtype, copy=False)
+
+    if l2:
+        g -= l2 * d
+
+    return r, g
+
+
+def _column_norms(Z, weights, l2):
+    """
+    The norms of the columns of A = [sqrt(W)*Z; sqrt(l2)*I].
+    """
+
+    if sparse.issparse(Z):
+        squares = Z.multiply(Z)
+        norms = np.asarray(squares.sum(axis=0) if weights is None else squares.T @ weights).ravel()
+    elif weights is None:
+        norms = np.einsum("ij,ij->j", Z, Z)
+    else:
+        norms = np.einsum("i,ij,ij->j", weights, Z, Z)
+
+    return np.sqrt(norms + l2)
+
+
+def _largest(g, mask, k):
+    """
+    The indices of the at most k largest entries of g within mask.
+    """
+
+    index = np.flatnonzero(mask)
+
+    if index.shape[0] > k:
+        index = index[np.argpartition(g[index], -k)[-k:]]
+
+    return index
@@ -0,0 +1,342 @@
+import numpy as np
+from scipy import fft, sparse
+
+from .fnnls import fnnls, fnnls_gram
+from .batch import _check
+from .gram import _float_dtype, _check_weights
+from .screening import _largest
+
+
+# The number of entries of Z transformed at once by method "srht"
+_SRHT_BLOCK = 2 ** 20
+
+
+def fnnls_sketched(Z, x, P_initial = np.zeros(0, dtype=int),
+         lstsq = lambda A, x: np.linalg.inv(A).dot(x),
+         epsilon=None, engine=None, full_output=False, l1=0, l2=0, weights=None,
+         sketch_size=None, method="countsketch", exact=True, random_state=None):
+    """
+    Solve min_d ||x - Zd|| subject to d >= 0, or its penalized form
+    as in fnnls, for a very tall m x n matrix Z, m >> n, without
+    forming ZTZ from all of its m rows.
+
+    The rows of [Z | x] are first reduced to sketch_size rows by a
+    random projection S, and fnnls is run on the sketched problem
+    min_d ||Sx - SZd||, at a cost independent of m once the sketch is
+    formed. Its solution is close to the solution of the original
+    problem, the residual growing by a factor of about
+    1 + sqrt(n / sketch_size).
+
+    If exact is True, the sketched solution is then refined into the
+    solution of the original problem. fnnls_gram is run on the Gram
+    matrix of a working set of columns, the passive set P of the
+    sketched problem and the columns closest to entering it, warm
+    started from P, and the dual vector of the original problem
+    computed with a single pass over Z. The columns violating its
+    optimality conditions are added to the working set, and the problem
+    solved again, until none does. Only the Gram matrix of the working
+    set W is kept, at a cost of m|W|^2 rather than mn^2, which pays off
+    when the solution uses a small part of the columns. It is extended
+    from column slices of Z, which stay sparse for a sparse Z, or from
+    blocks of rows of a dense Z, so that the columns of W are never
+    copied as a whole, and the residual is taken as x - Zd.
+
+    Parameters
+    ----------
+    Z: NumPy array or scipy.sparse matrix
+        Z is an m x n matrix.
+
+    x: Numpy array
+        x is a m x 1 vector.
+
+    P_initial: Numpy array, dtype=int
+        By default, an empty array. An estimate for the indices
+        of the support of the solution, the warm start of the
+        sketched problem.
+
+    lstsq: function
+        By default, the inverse of A multiplied by b.
+        Least squares function to use when calculating the
+        least squares solution min_x ||Ax - b||.
+        Must be of the form x = f(A,b).
+
+    epsilon: float
+        By default, it is the machine epsilon of the floating point
+        type of Z and x, the numerical tolerance
+
+    engine: str or object, optional
+        By default, None. See fnnls. The sketched problem and the
+        refinement are on different matrices, so an engine object
+        must not keep factorizations between calls, which excludes
+        FactorCache.
+
+    full_output: bool, optional
+        By default, False. If True, also return a dictionary with
+        the final passive set under "P", the dual vector under "w",
+        the number of iterations of the outer loop under
+        "iterations", as in fnnls, of the original problem if exact
+        is True and of the sketched one otherwise, the number of
+        iterations on the sketched problem under "sketch_iterations",
+        the number of rows of the sketch under "sketch_size" and the
+        number of solves on the original problem under "solves".
+
+    l1, l2: float, optional
+        By default, 0. The weights of the penalties, see fnnls.
+
+    weights: Numpy array, optional
+        By default, None. A vector of length m of nonnegative
+        weights of the observations, see fnnls.
+
+    sketch_size: int, optional
+        By default, 4n, at most m. The number of rows of the sketch.
+
+    method: str, optional
+        By default, "countsketch". The random projection, one of
+
+        "countsketch": every row of [Z | x] is added, with a random
+            sign, to one row of the sketch chosen at random, in a
+            single pass over the nonzero entries of Z.
+
+        "srht": a subsampled randomized trigonometric transform, the
+            rows are given random signs, mixed by an orthonormal
+            discrete cosine transform and sketch_size of them kept
+            at random. The DCT takes the place of the Hadamard
+            transform, without padding m to a power of 2. It needs a
+            dense Z, and O(mn log m) time, but gives a better sketch
+            than countsketch for the same sketch_size. Z is
+            transformed a block of columns at a time, keeping only
+            the rows of the sketch, so that the scratch memory is
+            that of a few columns of Z rather than of Z.
+
+    exact: bool, optional
+        By default, True. If False, return the solution of the
+        sketched problem, and the passive set and dual vector
+        of the sketched problem.
+
+    random_state: int or np.random.Generator, optional
+        By default, None. The seed of the random projection.
+
+    Returns
+    -------
+    d: Numpy array
+        d is a nx1 vector
+    res: float
+        The residual ||x - Zd|| of the original problem, without the
+        penalties, and weighted as ||sqrt(W)(x - Zd)|| with weights
+    info: dict
+        Only returned if full_output is True.
+    """
+
+    x = np.asarray_chkfinite(x)
+
+    if len(x.shape) != 1:
+        raise ValueError("Expected a one-dimensional array, but x is of shape {}".format(x.shape))
+
+    Z, _, P_initial = _check(Z, x[:, None], P_initial)
+
+    m, n = Z.shape
+
+    if weights is not None:
+        weights = _check_weights(weights, m)
+
+    if sketch_size is None:
+        sketch_size = min(4 * n, m)
+
+    if sketch_size < 1:
+        raise ValueError("Expected a positive sketch_size, but sketch_size is {}".format(sketch_size))
+
+    dtype = _float_dtype(Z.dtype, x.dtype)
+
+    if epsilon is None:
+        epsilon = np.finfo(dtype).eps
+
+    SZ, Sx = sketch(Z, x, sketch_size, method, weights, random_state)
+
+    d, _, info = fnnls(SZ, Sx, P_initial, lstsq, epsilon, engine, full_output=True, l1=l1, l2=l2)
+
+    sketch_iterations = info["iterations"]
+    solves = 0
+
+    if exact:
+
+        # The Gram matrix of the working set, extended as columns enter it
+        index = np.zeros(0, dtype=int)
+        ZTZ_W, ZTx_W = np.zeros((0, 0), dtype=dtype), np.zeros(0, dtype=dtype)
+
+        # The first working set is the passive set of the sketch, with
+        # the columns closest to entering it, which saves passes over Z
+        # for those that do
+        entering = info["P"]
+        inactive = np.ones(n, dtype=bool)
+        inactive[entering] = False
+        entering = np.concatenate([entering, _largest(info["w"], inactive, max(10, entering.shape[0] // 4))])
+
+        tolerance = epsilon * n
+        iterations = 0
+
+        # Column slices of a sparse Z are taken in CSC
+        Z_columns = Z.tocsc() if sparse.issparse(Z) else Z
+
+        while True:
+
+            if entering.shape[0]:
+                ZTZ_W, ZTx_W = _extend(ZTZ_W, ZTx_W, Z_columns, x, index, entering, weights)
+                index = np.concatenate([index, entering])
+
+            # Warm started from the previous solution
+            if index.shape[0]:
+                d_working, _, info = fnnls_gram(ZTZ_W, ZTx_W, None, np.flatnonzero(d[index] > 0),
+                                                lstsq, epsilon, engine, full_output=True, l1=l1, l2=l2)
+                d[:] = 0
+                d[index] = d_working
+                iterations += info["iterations"]
+                solves += 1
+
+            # The dual vector of the original problem, in two passes over Z
+            r = x - Z @ d
+            g = np.asarray((r if weights is None else weights * r) @ Z).ravel() - l2 * d
+
+            violating = g > l1 / 2 + tolerance
+            violating[index] = False
+
+            if not violating.any():
+                break
+
+            # The columns that most violate the optimality conditions,
+            # as many of them only do until the first have entered
+            entering = _largest(g, violating, max(10, index.shape[0] // 4))
+
+        info = {"P": np.flatnonzero(d > 0), "w": g - l1 / 2, "iterations": iterations}
+
+    else:
+        r = x - Z @ d
+
+    res = np.linalg.norm(r if weights is None else np.sqrt(weights) * r)  #Calculate residual loss ||x - Zd||
+
+    if full_output:
+        info.update(sketch_iterations=sketch_iterations, sketch_size=sketch_size, solves=solves)
+        return [d, res, info]
+
+    return [d, res]
+
+
+def sketch(Z, x, sketch_size, method="countsketch", weights=None, random_state=None):
+    """
+    A random projection S of the rows of [Z | x] down to sketch_size
+    rows, with ||S(x - Zd)|| close to ||x - Zd|| for every d, see
+    fnnls_sketched.
+
+    Parameters
+    ----------
+    Z: NumPy array or scipy.sparse matrix
+        Z is an m x n matrix, dense for method "srht".
+
+    x: Numpy array
+        x is a m x 1 vector.
+
+    sketch_size: int
+        The number of rows of the sketch.
+
+    method: str, optional
+        By default, "countsketch". One of "countsketch" or "srht".
+
+    weights: Numpy array, optional
+        By default, None. A vector of length m of nonnegative
+        weights of the observations, applied as sqrt(W) before S.
+
+    random_state: int or np.random.Generator, optional
+        By default, None. The seed of the random projection.
+
+    Returns
+    -------
+    SZ: NumPy array
+        SZ is a sketch_size x n matrix
+    Sx: NumPy array
+        Sx is a vector of length sketch_size
+    """
+
+    if method not in ("countsketch", "srht"):
+        raise ValueError("Expected method to be \"countsketch\" or \"srht\", but method is {}".format(method))
+    if method == "srht" and sparse.issparse(Z):
+        raise ValueError("Expected a dense Z for method \"srht\", but Z is a scipy.sparse matrix")
+
+    rng = np.random.default_rng(random_state)
+    m = Z.shape[0]
+    dtype = _float_dtype(Z.dtype, x.dtype)
+
+    signs = rng.choice(np.array([-1, 1], dtype=dtype), size=m)
+
+    if weights is not None:
+        signs *= np.sqrt(weights).astype(dtype)
+
+    if method == "countsketch":
+
+        # S has a single nonzero entry, a random sign, in every column
+        S = sparse.csr_matrix((signs, (rng.integers(sketch_size, size=m), np.arange(m))), shape=(sketch_size, m))
+        SZ = S @ Z
+
+        if sparse.issparse(SZ):
+            SZ = SZ.toarray()
+
+        return np.asarray(SZ, dtype=dtype), S @ x.astype(dtype, copy=False)
+
+    # The DCT is orthonormal, so the kept rows are scaled by sqrt(m/k)
+    rows = rng.choice(m, size=min(sketch_size, m), replace=False)
+    scale = np.sqrt(m / rows.shape[0])
+
+    SZ = np.empty((rows.shape[0], Z.shape[1]), dtype=dtype)
+    columns = max(1, _SRHT_BLOCK // max(m, 1))
+
+    for start in range(0, Z.shape[1], columns):
+        SZ[:, start:start + columns] = fft.dct(signs[:, None] * Z[:, start:start + columns], norm="ortho", axis=0)[rows]
+
+    SZ *= scale
+    Sx = fft.dct(signs * x, norm="ortho")[rows]
+
+    return SZ, (scale * Sx).astype(dtype, copy=False)
+
+
+def _extend(ZTZ, ZTx, Z, x, index, entering, weights=None, chunk_size=8192):
+    """
+    Extend the Gram quantities ZTZ and ZTx of the columns index of Z
+    with the columns entering, from a sparse column slice of a sparse
+    Z, or over blocks of chunk_size rows of a dense Z.
+    """
+
+    k, b = index.shape[0], entering.shape[0]
+    columns = np.concatenate([index, entering])
+
+    if sparse.issparse(Z):
+        blocks = [(slice(None), Z[:, columns])]
+    else:
+        blocks = ((slice(start, start + chunk_size), Z[start:start + chunk_size, columns])
+                  for start in range(0, Z.shape[0], chunk_size))
+
+    cross = np.zeros((k + b, b), dtype=ZTZ.dtype)
+    ZTx_entering = np.zeros(b, dtype=ZTx.dtype)
+
+    for rows, A in blocks:
+
+        B = A[:, k:]
+
+        if weights is not None:
+            B = sparse.diags(weights[rows]) @ B if sparse.issparse(B) else weights[rows, None] * B
+
+        cross += _dense(A.T @ B)
+        ZTx_entering += np.asarray(B.T @ x[rows]).ravel()
+
+    extended = np.empty((k + b, k + b), dtype=ZTZ.dtype)
+    extended[:k, :k] = ZTZ
+    extended[:, k:] = cross
+    extended[k:, :k] = cross[:k].T
+
+    return extended, np.concatenate([ZTx, ZTx_entering])
+
+
+def _dense(A):
+    """
+    A as a NumPy array, for A either a NumPy array or a
+    scipy.sparse matrix.
+    """
+
+    return A.toarray() if sparse.issparse(A) else A
@@ -0,0 +1,233 @@
+from time import perf_counter
+
+import numpy as np
+
+from .fnnls import _fnnls, _workspace, _info, _residual, _check_P_initial
+from .batch import _fnnls_batch
+from .backends import _resolve_backend
+from .engines import CholeskyEngine
+from .gram import gram, _float_dtype, _penalize, _check_weights
+from .stats import _kkt_violation
+
+
+class NNLSSolver():
+    """
+    A nonnegative least squares solver bound to a fixed matrix Z, for
+    solving min_d ||x - Zd|| subject to d >= 0 for many vectors x.
+
+    Z is validated and ZTZ is computed once, at construction, and the
+    arrays used by the active set loop are allocated once and reused
+    by every call to solve, so that each solve only costs the product
+    Z^T*x and the iterations of the Fast Non-negative Least Squares
+    Algorithm.
+
+    Parameters
+    ----------
+    Z: NumPy array
+        Z is an m x n matrix.
+
+    lstsq: function
+        By default, the inverse of A multiplied by b.
+        Least squares function to use when calculating the
+        least squares solution min_x ||Ax - b||.
+        Must be of the form x = f(A,b).
+
+    epsilon: float
+        By default, it is the machine epsilon of the floating
+        point type of Z, the numerical tolerance
+
+    engine: str or object, optional
+        By default, None. See fnnls. With "cholesky", the
+        factorization is kept between calls to solve, so that
+        problems with similar supports only update it.
+
+    l1, l2: float, optional
+        By default, 0. The weights of the penalties l1*1^T*d and
+        l2*||d||^2 of every solve, see fnnls. l2 is added to the
+        diagonal of ZTZ once, at construction.
+
+    weights: Numpy array, optional
+        By default, None. A vector of length m of nonnegative weights
+        of the observations shared by every solve, see fnnls. Z^T*W*Z
+        is formed once, at construction, by blocks of rows.
+
+    backend: str, optional
+        By default, "numpy". See fnnls. With "numba", the compiled
+        loop removes most of the overhead of each solve, which
+        dominates for small n.
+    """
+
+    def __init__(self, Z, lstsq = lambda A, x: np.linalg.inv(A).dot(x),
+                 epsilon=None, engine=None, l1=0, l2=0, weights=None, backend="numpy"):
+
+        Z = np.asarray_chkfinite(Z)
+
+        # Z is stored as floats so that the products can be written
+        # directly into the workspaces, float32 is kept as is
+        dtype = _float_dtype(Z.dtype)
+        Z = Z.astype(dtype, copy=False)
+
+        if epsilon is None:
+            epsilon = np.finfo(dtype).eps
+
+        if len(Z.shape) != 2:
+            raise ValueError("Expected a two-dimensional array, but Z is of shape {}".format(Z.shape))
+
+        m, n = Z.shape
+
+        if engine == "cholesky":
+            engine = CholeskyEngine(epsilon)
+
+        if weights is not None:
+            weights = _check_weights(weights, m).astype(dtype)
+            ZTZ, _ = gram(Z, np.zeros((m, 0), dtype=dtype), weights=weights)
+        else:
+            ZTZ = Z.T.dot(Z)
+
+        self.Z = Z
+        self.ZTZ, _ = _penalize(ZTZ, np.zeros(0, dtype=dtype), 0, l2)
+        self.weights = weights
+        self.l1 = l1
+        self.lstsq = lstsq
+        self.epsilon = epsilon
+        self.engine = engine
+        self.backend = _resolve_backend(backend, self.ZTZ, engine)
+
+        # Workspaces for Z^T*x, for Z*d and for the active set loop
+        self._ZTx = np.zeros(n, dtype=dtype)
+        self._Zd = np.zeros(m, dtype=dtype)
+        self._workspace = _workspace(n, dtype)
+
+    def solve(self, x, P_initial = np.zeros(0, dtype=int), full_output=False,
+              stats=None, callback=None):
+        """
+        Solve min_d ||x - Zd|| subject to d >= 0.
+
+        Parameters
+        ----------
+        x: Numpy array
+            x is a m x 1 vector.
+
+        P_initial: Numpy array, dtype=int
+            By default, an empty array. An estimate for
+            the indices of the support of the solution.
+
+        full_output: bool, optional
+            By default, False. See fnnls.
+
+        stats: SolverStats, optional
+            By default, None. See fnnls, gram_time is the
+            time of the product Z^T*x.
+
+        callback: function, optional
+            By default, None. See fnnls.
+
+        Returns
+        -------
+        d: Numpy array
+            d is a nx1 vector
+        res: float
+            The residual ||x - Zd||
+        info: dict
+            Only returned if full_output is True.
+        """
+
+        if stats is not None:
+            stats.reset()
+            start = perf_counter()
+
+        x, P_initial = self._check(x, P_initial, 1)
+
+        x = x.astype(self.Z.dtype, copy=False)
+
+        if self.weights is not None:
+            np.dot(self.Z.T, self.weights * x, out=self._ZTx)
+        else:
+            np.dot(self.Z.T, x, out=self._ZTx)
+
+        _penalize(self.ZTZ, self._ZTx, self.l1)
+
+        if stats is not None:
+            stats.gram_time = perf_counter() - start
+
+        backend = self.backend if callback is None else _resolve_backend(self.backend, self.ZTZ, self.engine, callback)
+
+        d, P, w, iterations = _fnnls(self.ZTZ, self._ZTx, P_initial, self.lstsq, self.epsilon, self.engine, self._workspace,
+                                     stats, callback, backend)
+
+        # Calculate residual loss ||x - Zd|| in the workspace
+        np.dot(self.Z, d, out=self._Zd)
+        np.subtract(x, self._Zd, out=self._Zd)
+
+        if self.weights is not None:
+            self._Zd *= np.sqrt(self.weights)
+
+        res = np.linalg.norm(self._Zd)
+
+        if stats is not None:
+            stats.kkt_violation = _kkt_violation(P, w)
+            stats.total_time = perf_counter() - start
+
+        # d lives in the workspace and is overwritten by the next solve
+        if full_output:
+            return [d.copy(), res, _info(P, w, iterations)]
+
+        return [d.copy(), res]
+
+    def solve_many(self, X, P_initial = np.zeros(0, dtype=int)):
+        """
+        Solve min_D ||X - ZD|| subject to D >= 0 column by column,
+        as done by fnnls_batch.
+
+        Parameters
+        ----------
+        X: Numpy array
+            X is an m x k matrix, each column is a right hand side.
+
+        P_initial: Numpy array, dtype=int
+            By default, an empty array. An estimate for the indices
+            of the support of the solution, shared by every column.
+
+        Returns
+        -------
+        D: Numpy array
+            D is an n x k matrix
+        res: Numpy array
+            res is a vector of length k with the residual
+            ||x - Zd|| of every column
+        """
+
+        X, P_initial = self._check(X, P_initial, 2)
+
+        X = X.astype(self.Z.dtype, copy=False)
+
+        if self.weights is not None:
+            ZTX = self.Z.T.dot(self.weights[:, None] * X)
+        else:
+            ZTX = self.Z.T.dot(X)
+        _penalize(self.ZTZ, ZTX, self.l1)
+
+        D, P, W, iterations = _fnnls_batch(self.ZTZ, ZTX, P_initial, self.lstsq, self.epsilon, self.engine)
+
+        res = _residual(self.Z, X, D, self.weights)
+
+        return [D, res]
+
+    def _check(self, x, P_initial, ndim):
+        """
+        Validate a right hand side with ndim dimensions
+        and an estimate of the support.
+        """
+
+        x, P_initial = map(np.asarray_chkfinite, (x, P_initial))
+
+        if len(x.shape) != ndim:
+            raise ValueError("Expected a {}-dimensional array, but x is of shape {}".format(ndim, x.shape))
+        if len(P_initial.shape) != 1:
+            raise ValueError("Expected a one-dimensional array, but P_initial is of shape {}".format(P_initial.shape))
+        if x.shape[0] != self.Z.shape[0]:
+            raise ValueError("Incompatable dimensions. The first dimension of Z should match the first dimension of x, but Z is of shape {} and x is of shape {}".format(self.Z.shape, x.shape))
+
+        _check_P_initial(P_initial, self.Z.shape[1])
+
+        return x, P_initial
@@ -0,0 +1,153 @@
+from time import perf_counter
+
+import numpy as np
+
+
+class SolverStats():
+    """
+    Counters and timings of a call to fnnls, filled in when given
+    as its stats argument.
+
+    Collecting them is opt-in: without a stats object, the active set
+    loop runs without any timing. A stats object is reset at the start
+    of every call it is given to, and can be reused across calls.
+
+    Attributes
+    ----------
+    iterations: int
+        The number of iterations of the outer loop, B1 to B6.
+
+    inner_iterations: int
+        The number of iterations of the inner loop, the calls
+        to fix_constraint.
+
+    lstsq_calls: int
+        The number of least squares problems solved along the
+        passive set, with lstsq or with the engine.
+
+    lstsq_time: float
+        The total time spent in those solves, in seconds.
+
+    gram_time: float
+        The time spent forming ZTZ and ZTx, in seconds, 0 when
+        they are given, as in fnnls_gram.
+
+    total_time: float
+        The time of the whole call, in seconds.
+
+    exit_reason: str
+        Why the outer loop stopped, one of "converged", when
+        w <= tolerance on the active set, "all_passive", when the
+        active set is empty, "stalled", when the passive set was
+        unchanged for max_repetitions iterations, or "callback",
+        when the callback asked to stop.
+
+    kkt_violation: float
+        The largest violation of the optimality conditions at the
+        solution, max(w) over the active set and max(|w|) over the
+        passive set, where w = ZTx - ZTZ*d, and max(-w) over the
+        indices at their upper bound for a bounded problem.
+    """
+
+    def __init__(self):
+
+        self.reset()
+
+    def reset(self):
+        """
+        Set every counter and timing back to zero.
+        """
+
+        self.iterations = 0
+        self.inner_iterations = 0
+        self.lstsq_calls = 0
+        self.lstsq_time = 0.
+        self.gram_time = 0.
+        self.total_time = 0.
+        self.exit_reason = None
+        self.kkt_violation = None
+
+    def as_dict(self):
+        """
+        Return the counters and timings as a dictionary.
+        """
+
+        return {"iterations": self.iterations,
+                "inner_iterations": self.inner_iterations,
+                "lstsq_calls": self.lstsq_calls,
+                "lstsq_time": self.lstsq_time,
+                "gram_time": self.gram_time,
+                "total_time": self.total_time,
+                "exit_reason": self.exit_reason,
+                "kkt_violation": self.kkt_violation}
+
+    def __repr__(self):
+
+        return "SolverStats({})".format(", ".join("{}={!r}".format(*item) for item in self.as_dict().items()))
+
+
+def _timed(stats, lstsq, engine):
+    """
+    Wrap lstsq and engine so that every least squares solve
+    along the passive set is counted and timed in stats.
+    """
+
+    if engine is not None:
+        return lstsq, _TimedEngine(stats, engine)
+
+    def timed_lstsq(A, b):
+
+        start = perf_counter()
+        s = lstsq(A, b)
+        stats.lstsq_time += perf_counter() - start
+        stats.lstsq_calls += 1
+
+        return s
+
+    return timed_lstsq, engine
+
+
+class _TimedEngine():
+    """
+    An engine counting and timing the solves of another one.
+    """
+
+    def __init__(self, stats, engine):
+
+        self.stats = stats
+        self.engine = engine
+
+    def solve(self, ZTZ, P, b):
+
+        start = perf_counter()
+        s = self.engine.solve(ZTZ, P, b)
+        self.stats.lstsq_time += perf_counter() - start
+        self.stats.lstsq_calls += 1
+
+        return s
+
+
+def _kkt_violation(P, w, U=None, upper=None):
+    """
+    The largest violation of the optimality conditions, w <= 0 on
+    the active set, w = 0 on the passive set, and w >= 0 on the
+    upper set U of a bounded problem, where the indices with a zero
+    upper bound have no condition.
+    """
+
+    violation = 0.
+
+    A = ~P
+
+    if U is not None:
+        A = A & ~U & (upper > 0)
+        U = U & (upper > 0)
+
+    if A.any():
+        violation = max(violation, float(w[A].max()))
+    if P.any():
+        violation = max(violation, float(np.abs(w[P]).max()))
+    if U is not None and U.any():
+        violation = max(violation, float(-w[U].min()))
+
+    return violation
@@ -0,0 +1,206 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import numpy as np
+from scipy.linalg.blas import dsyrk
+
+from .fnnls import fnnls_gram
+
+
+def fnnls_chunked(Z, x=None, chunk_size=65536, prefetch=True,
+         P_initial = np.zeros(0, dtype=int),
+         lstsq = lambda A, x: np.linalg.inv(A).dot(x),
+         epsilon=None, engine=None, full_output=False, stats=None, callback=None,
+         l1=0, l2=0):
+    """
+    Solve min_d ||x - Zd|| subject to d >= 0 for a tall Z that is read
+    by blocks of rows, such as a np.memmap or an HDF5 dataset, rather
+    than held in memory.
+
+    ZTZ, ZTx and xTx are accumulated in a single sequential pass over
+    the blocks, see accumulate_gram, and the problem is then solved
+    with fnnls_gram, so that only one or two blocks and the n x n
+    Gram matrix are ever held in memory.
+
+    Parameters
+    ----------
+    Z: array_like or iterable
+        Either an m x n matrix supporting slicing of its rows, in which
+        case x must be given, or an iterable of (Z_block, x_block)
+        pairs of row blocks of Z and x, in which case x must be None.
+
+    x: array_like, optional
+        x is a m x 1 vector supporting slicing.
+
+    chunk_size: int, optional
+        By default, 65536. The number of rows per block when
+        Z and x are sliced.
+
+    prefetch: bool, optional
+        By default, True. Read the next block in a background
+        thread while the products of the current one are computed.
+
+    P_initial, lstsq, epsilon, engine, full_output, stats, callback, l1, l2:
+        See fnnls. The gram_time of stats is the time of the
+        pass over the blocks.
+
+    Returns
+    -------
+    d: Numpy array
+        d is a nx1 vector
+    res: float
+        The residual ||x - Zd||
+    info: dict
+        Only returned if full_output is True.
+    """
+
+    if x is None:
+        blocks = Z
+    else:
+        blocks = iter_blocks(Z, x, chunk_size)
+
+    start = perf_counter()
+
+    ZTZ, ZTx, xTx = accumulate_gram(blocks, prefetch)
+
+    gram_time = perf_counter() - start
+
+    output = fnnls_gram(ZTZ, ZTx, xTx, P_initial, lstsq, epsilon, engine, full_output, stats, callback, l1, l2)
+
+    if stats is not None:
+        stats.gram_time = gram_time
+        stats.total_time += gram_time
+
+    return output
+
+
+def iter_blocks(Z, x, chunk_size=65536):
+    """
+    Iterate over the row blocks of Z and x, reading each one into
+    memory.
+
+    Parameters
+    ----------
+    Z: array_like
+        Z is an m x n matrix supporting slicing of its rows,
+        such as a NumPy array, a np.memmap or an HDF5 dataset.
+
+    x: array_like
+        x is a m x 1 vector supporting slicing.
+
+    chunk_size: int, optional
+        By default, 65536. The number of rows per block.
+
+    Yields
+    ------
+    Z_block: Numpy array
+        A chunk_size x n block of rows of Z, the last one
+        may be shorter.
+    x_block: Numpy array
+        The corresponding entries of x.
+    """
+
+    m = Z.shape[0]
+
+    if len(x) != m:
+        raise ValueError("Incompatable dimensions. The first dimension of Z should match the length of x, but Z is of shape {} and x is of length {}".format(Z.shape, len(x)))
+
+    for start in range(0, m, chunk_size):
+
+        # np.array forces the read of a memmap slice here, rather than
+        # when the products are computed
+        yield np.array(Z[start:start+chunk_size]), np.array(x[start:start+chunk_size])
+
+
+def accumulate_gram(blocks, prefetch=False):
+    """
+    Accumulate ZTZ = Z^T*Z, ZTx = Z^T*x and xTx = x^T*x from row
+    blocks of Z and x in a single pass, with O(n^2) memory.
+
+    Since ZTZ is symmetric, only its upper triangle is accumulated,
+    with the BLAS routine syrk, which halves the cost of the pass.
+    The sums are accumulated in double precision, since the rounding
+    errors of long sums grow with the number of rows.
+
+    Parameters
+    ----------
+    blocks: iterable
+        An iterable of (Z_block, x_block) pairs, where Z_block is
+        a b x n matrix and x_block a vector of length b.
+
+    prefetch: bool, optional
+        By default, False. Fetch the next block in a background
+        thread while the products of the current one are computed.
+
+    Returns
+    -------
+    ZTZ: NumPy array
+        ZTZ is an n x n matrix equal to Z.T * Z
+    ZTx: Numpy array
+        ZTx is an n x 1 vector equal to Z.T * x
+    xTx: float
+        The squared norm of x
+    """
+
+    if prefetch:
+        blocks = _prefetch(blocks)
+
+    ZTZ = None
+
+    for Z_block, x_block in blocks:
+
+        Z_block, x_block = map(np.asarray_chkfinite, (Z_block, x_block))
+
+        if len(Z_block.shape) != 2:
+            raise ValueError("Expected a two-dimensional array, but a block of Z is of shape {}".format(Z_block.shape))
+        if len(x_block.shape) != 1 or x_block.shape[0] != Z_block.shape[0]:
+            raise ValueError("Incompatable dimensions. The first dimension of each block of Z should match the length of the block of x, but a block of Z is of shape {} and the block of x is of shape {}".format(Z_block.shape, x_block.shape))
+
+        if ZTZ is None:
+            n = Z_block.shape[1]
+            ZTZ = np.zeros((n, n), order='F')
+            ZTx = np.zeros(n)
+            xTx = 0.
+
+        if Z_block.shape[1] != n:
+            raise ValueError("Expected every block of Z to have {} columns, but a block of Z is of shape {}".format(n, Z_block.shape))
+
+        Z_block = Z_block.astype(float, copy=False)
+
+        # Upper triangle of ZTZ += Z_block^T * Z_block, the transpose of
+        # a C ordered block is Fortran ordered so BLAS reads it in place
+        ZTZ = dsyrk(1.0, Z_block.T, beta=1.0, c=ZTZ, trans=0, overwrite_c=True)
+        ZTx += Z_block.T.dot(x_block)
+        xTx += x_block.dot(x_block)
+
+    if ZTZ is None:
+        raise ValueError("Expected at least one block of rows, but none were given")
+
+    # Fill in the lower triangle
+    ZTZ = np.triu(ZTZ) + np.triu(ZTZ, 1).T
+
+    return ZTZ, ZTx, xTx
+
+
+def _prefetch(blocks):
+    """
+    Iterate over blocks, fetching the next item in a background
+    thread while the current one is being used.
+    """
+
+    iterator = iter(blocks)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+
+        future = pool.submit(next, iterator, None)
+
+        while True:
+
+            block = future.result()
+
+            if block is None:
+                return
+
+            future = pool.submit(next, iterator, None)
+
+            yield block
@@ -0,0 +1,509 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Benchmarks of fnnls against scipy.optimize.nnls.
+
+Every case is a family of generated problems of one kind, tall, wide
+or square, ill-conditioned, with a sparse solution or with many right
+hand sides, solved by each solver after warm-up runs. The times of the
+repetitions, the peak memory of one run and the residuals are written
+to a JSON file, and two such files can be compared to catch
+performance regressions.
+
+    python benchmark.py run -o results.json
+    python benchmark.py run -o results.json --quick
+    python benchmark.py compare old.json new.json --threshold 1.2
+    python benchmark.py calibrate -o calibration.json
+
+Nothing is downloaded, and matplotlib is not needed, see
+generate_figure.py to plot a results file.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+from scipy import optimize, sparse
+
+import fnnls as _fnnls
+from fnnls import fnnls, fnnls_batch, solve
+from fnnls.dispatch import _METHODS
+
+
+def tall(n, rng):
+    """
+    A uniform 10n x n matrix and a uniform right hand side.
+    """
+
+    return rng.random((10 * n, n)), rng.random(10 * n)
+
+
+def square(n, rng):
+    """
+    A Gaussian n x n matrix and right hand side.
+    """
+
+    return rng.standard_normal((n, n)), rng.standard_normal(n)
+
+
+def wide(n, rng):
+    """
+    A uniform n/2 x n matrix and a uniform right hand side.
+    """
+
+    return rng.random((n // 2, n)), rng.random(n // 2)
+
+
+def ill_conditioned(n, rng, condition=1e6):
+    """
+    A 10n x n matrix with singular values spaced logarithmically
+    between 1 and 1/condition, and a Gaussian right hand side.
+    """
+
+    U, _ = np.linalg.qr(rng.standard_normal((10 * n, n)))
+    V, _ = np.linalg.qr(rng.standard_normal((n, n)))
+
+    Z = (U * np.logspace(0, -np.log10(condition), n)) @ V.T
+
+    return Z, rng.standard_normal(10 * n)
+
+
+def sparse_solution(n, rng, support=0.1, noise=0.01):
+    """
+    A uniform 10n x n matrix and a right hand side Zd + noise, for a
+    nonnegative d with a fraction support of nonzero entries.
+    """
+
+    Z = rng.random((10 * n, n))
+
+    d = np.zeros(n)
+    idx = rng.choice(n, max(1, int(support * n)), replace=False)
+    d[idx] = rng.random(idx.shape[0])
+
+    return Z, Z @ d + noise * rng.standard_normal(10 * n)
+
+
+def batched(n, rng, k=100):
+    """
+    A uniform 10n x n matrix and k uniform right hand sides.
+    """
+
+    return rng.random((10 * n, n)), rng.random((10 * n, k))
+
+
+# Kinds of problems, with a generator and whether it has many right hand sides
+PROBLEMS = {
+    "tall": (tall, False),
+    "square": (square, False),
+    "wide": (wide, False),
+    "ill_conditioned": (ill_conditioned, False),
+    "sparse_solution": (sparse_solution, False),
+    "batched": (batched, True),
+}
+
+
+def _scipy_batch(Z, X):
+
+    D = np.zeros((Z.shape[1], X.shape[1]))
+    res = np.zeros(X.shape[1])
+
+    for i in range(X.shape[1]):
+        D[:, i], res[i] = optimize.nnls(Z, X[:, i])
+
+    return [D, res]
+
+
+def _fnnls_loop(Z, X):
+
+    D = np.zeros((Z.shape[1], X.shape[1]))
+    res = np.zeros(X.shape[1])
+
+    for i in range(X.shape[1]):
+        D[:, i], res[i] = fnnls(Z, X[:, i])
+
+    return [D, res]
+
+
+# Solvers of single right hand sides and of many, called as solver(Z, x)
+SOLVERS = {
+    "scipy.optimize.nnls": optimize.nnls,
+    "fnnls": fnnls,
+    "fnnls_cholesky": lambda Z, x: fnnls(Z, x, engine="cholesky"),
+    "solve": solve,
+}
+
+BATCH_SOLVERS = {
+    "scipy.optimize.nnls": _scipy_batch,
+    "fnnls": _fnnls_loop,
+    "fnnls_batch": fnnls_batch,
+    "fnnls_batch_cholesky": lambda Z, X: fnnls_batch(Z, X, engine="cholesky"),
+}
+
+SIZES = [20, 50, 100, 200, 400]
+QUICK_SIZES = [20, 50]
+
+CALIBRATION_SIZES = [100, 300, 1000]
+CALIBRATION_SUPPORTS = [0.05, 0.3, 0.9]
+
+
+def measure(solver, Z, x, repeat=5, warmup=1):
+    """
+    Time solver(Z, x) and measure its peak memory.
+
+    Parameters
+    ----------
+    solver: function
+        A function returning [d, res].
+
+    Z, x: Numpy array
+        The problem.
+
+    repeat: int, optional
+        By default, 5. The number of timed runs.
+
+    warmup: int, optional
+        By default, 1. The number of runs before the timed ones.
+
+    Returns
+    -------
+    result: dict
+        The times of the runs in seconds, their minimum and median,
+        the peak memory of a run in bytes, traced separately so that
+        tracing does not slow the timed runs, and the solution.
+    """
+
+    for _ in range(warmup):
+        solver(Z, x)
+
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        d, res = solver(Z, x)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    solver(Z, x)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"times": times, "min": min(times), "median": float(np.median(times)),
+            "peak_bytes": peak, "d": d, "res": res}
+
+
+def run(problems=None, sizes=SIZES, repeat=5, warmup=1, seed=0, verbose=True):
+    """
+    Run every solver on every kind of problem and size.
+
+    Parameters
+    ----------
+    problems: list, optional
+        By default, every kind of PROBLEMS.
+
+    sizes: list, optional
+        By default, SIZES. The numbers of columns n of Z.
+
+    repeat, warmup: int, optional
+        See measure.
+
+    seed: int, optional
+        By default, 0. The seed of the generated problems.
+
+    verbose: bool, optional
+        By default, True. Print each result as it is measured.
+
+    Returns
+    -------
+    results: dict
+        The environment and the list of results, which can be
+        written to a JSON file.
+    """
+
+    results = []
+
+    for problem in problems or PROBLEMS:
+
+        generator, many = PROBLEMS[problem]
+        solvers = BATCH_SOLVERS if many else SOLVERS
+
+        for n in sizes:
+
+            Z, x = generator(n, np.random.default_rng([seed, n]))
+            reference = None
+
+            for name, solver in solvers.items():
+
+                result = {"problem": problem, "n": n, "shape": list(Z.shape), "solver": name}
+
+                try:
+                    measured = measure(solver, Z, x, repeat, warmup)
+                except (np.linalg.LinAlgError, RuntimeError) as error:
+                    result["error"] = str(error)
+                    results.append(result)
+                    continue
+
+                d = measured.pop("d")
+                result.update(measured)
+                result["res"] = float(np.sum(measured["res"]))
+
+                # Relative difference to the solution of the first solver
+                if reference is None:
+                    reference = d
+                result["diff"] = float(np.linalg.norm(d - reference) / max(np.linalg.norm(reference), 1e-300))
+
+                results.append(result)
+
+                if verbose:
+                    print("{:16} n={:<5} {:22} median {:.3e}s  peak {:>10} B  diff {:.1e}".format(
+                        problem, n, name, result["median"], result["peak_bytes"], result["diff"]))
+
+    return {"environment": environment(), "repeat": repeat, "warmup": warmup, "seed": seed,
+            "results": results}
+
+
+def calibration_problem(n, rng, support, nonnegative=True, is_sparse=False, density=0.05):
+    """
+    A 2n x n matrix, uniform if nonnegative and Gaussian otherwise,
+    with a fraction density of nonzero entries if is_sparse, and a
+    right hand side Zd + noise for a nonnegative d with a fraction
+    support of nonzero entries.
+    """
+
+    m = 2 * n
+    values = rng.random if nonnegative else rng.standard_normal
+
+    if is_sparse:
+        Z = sparse.random(m, n, density=density, format="csc", random_state=rng, data_rvs=values)
+    else:
+        Z = values((m, n))
+
+    d = np.zeros(n)
+    idx = rng.choice(n, max(1, int(support * n)), replace=False)
+    d[idx] = rng.random(idx.shape[0])
+
+    return Z, Z @ d + 0.01 * rng.standard_normal(m)
+
+
+def calibrate(sizes=CALIBRATION_SIZES, supports=CALIBRATION_SUPPORTS, repeat=3, warmup=1, seed=0, verbose=True):
+    """
+    Time solve with every method on problems of every kind, size and
+    support, for the calibration table of the method "auto".
+
+    Parameters
+    ----------
+    sizes: list, optional
+        By default, CALIBRATION_SIZES. The numbers of columns n of Z.
+
+    supports: list, optional
+        By default, CALIBRATION_SUPPORTS. The fractions of nonzero
+        entries of the d generating the right hand sides.
+
+    repeat: int, optional
+        By default, 3. The number of timed runs.
+
+    warmup: int, optional
+        By default, 1. The number of runs before the timed ones.
+
+    seed: int, optional
+        By default, 0. The seed of the generated problems.
+
+    verbose: bool, optional
+        By default, True. Print each result as it is measured.
+
+    Returns
+    -------
+    results: dict
+        The environment, the list of results, and the table, a list
+        of entries (nonnegative, sparse, n, support, method) of the
+        fastest method for every problem, by the fraction of nonzero
+        entries of its solution.
+    """
+
+    results = []
+    table = []
+
+    for nonnegative in [True, False]:
+        for is_sparse in [False, True]:
+            for n in sizes:
+                for support in supports:
+
+                    Z, x = calibration_problem(n, np.random.default_rng([seed, n, int(100 * support)]), support,
+                                               nonnegative, is_sparse)
+                    times = {}
+                    solutions = {}
+
+                    for method in _METHODS:
+
+                        for _ in range(warmup):
+                            solve(Z, x, method=method)
+
+                        runs = []
+
+                        # Without the traced run of measure, too slow for the largest problems
+                        for _ in range(repeat):
+                            start = time.perf_counter()
+                            d, res = solve(Z, x, method=method)
+                            runs.append(time.perf_counter() - start)
+
+                        times[method] = float(np.median(runs))
+                        solutions[method] = d
+
+                        results.append({"nonnegative": nonnegative, "sparse": is_sparse, "n": n,
+                                        "support": support, "method": method, "times": runs,
+                                        "median": times[method], "res": float(res)})
+
+                    # The table is by the support of the solution, which solve
+                    # estimates, rather than the support of the generating d,
+                    # taken from the solution of the fastest method
+                    fastest = min(times, key=times.get)
+                    solution_support = round(float(np.count_nonzero(solutions[fastest])) / n, 2)
+                    table.append((nonnegative, is_sparse, n, solution_support, fastest))
+
+                    if verbose:
+                        print("nonnegative={!s:5} sparse={!s:5} n={:<5} support={:<4} {}  fastest {}".format(
+                            nonnegative, is_sparse, n, solution_support,
+                            "  ".join("{} {:.3e}s".format(method, times[method]) for method in _METHODS), fastest))
+
+    return {"environment": environment(), "repeat": repeat, "warmup": warmup, "seed": seed,
+            "results": results, "table": table}
+
+
+def environment():
+    """
+    The versions and platform the benchmarks were run on.
+    """
+
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "machine": platform.machine(), "numpy": np.__version__,
+            "scipy": scipy.__version__, "fnnls": _fnnls.__version__}
+
+
+def compare(old, new, threshold=1.2):
+    """
+    Compare the median times of two results of run.
+
+    Parameters
+    ----------
+    old, new: dict
+        Results of run, as read from their JSON files.
+
+    threshold: float, optional
+        By default, 1.2. The ratio of the new median time to the old
+        one above which a result is a regression.
+
+    Returns
+    -------
+    rows: list
+        For every result in both, a tuple (problem, n, solver,
+        old median, new median, ratio), with None times for
+        results that failed.
+    regressions: list
+        The rows with a ratio above threshold.
+    """
+
+    key = lambda result: (result["problem"], result["n"], result["solver"])
+    before = {key(result): result for result in old["results"]}
+
+    rows = []
+    regressions = []
+
+    for result in new["results"]:
+
+        if key(result) not in before:
+            continue
+
+        old_time = before[key(result)].get("median")
+        new_time = result.get("median")
+
+        ratio = new_time / old_time if old_time and new_time else None
+
+        row = key(result) + (old_time, new_time, ratio)
+        rows.append(row)
+
+        if ratio is not None and ratio > threshold:
+            regressions.append(row)
+
+    return rows, regressions
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Benchmarks of fnnls against scipy.optimize.nnls.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    parser_run = commands.add_parser("run", help="run the benchmarks and write the results")
+    parser_run.add_argument("-o", "--output", default="benchmark.json", help="JSON file to write")
+    parser_run.add_argument("--problems", nargs="+", choices=list(PROBLEMS), help="kinds of problems to run")
+    parser_run.add_argument("--sizes", nargs="+", type=int, help="numbers of columns of Z")
+    parser_run.add_argument("--quick", action="store_true", help="only run small sizes")
+    parser_run.add_argument("--repeat", type=int, default=5, help="number of timed runs")
+    parser_run.add_argument("--warmup", type=int, default=1, help="number of runs before the timed ones")
+    parser_run.add_argument("--seed", type=int, default=0)
+
+    parser_compare = commands.add_parser("compare", help="compare two results files")
+    parser_compare.add_argument("old")
+    parser_compare.add_argument("new")
+    parser_compare.add_argument("--threshold", type=float, default=1.2,
+                                help="ratio of median times above which a result is a regression")
+
+    parser_calibrate = commands.add_parser("calibrate", help="time the methods of solve for its calibration table")
+    parser_calibrate.add_argument("-o", "--output", default="calibration.json", help="JSON file to write")
+    parser_calibrate.add_argument("--sizes", nargs="+", type=int, help="numbers of columns of Z")
+    parser_calibrate.add_argument("--supports", nargs="+", type=float, help="fractions of nonzero entries of the solutions")
+    parser_calibrate.add_argument("--repeat", type=int, default=3, help="number of timed runs")
+    parser_calibrate.add_argument("--warmup", type=int, default=1, help="number of runs before the timed ones")
+    parser_calibrate.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+
+        sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+        results = run(args.problems, sizes, args.repeat, args.warmup, args.seed)
+
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+
+        return 0
+
+    if args.command == "calibrate":
+
+        results = calibrate(args.sizes or CALIBRATION_SIZES, args.supports or CALIBRATION_SUPPORTS,
+                            args.repeat, args.warmup, args.seed)
+
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+
+        # The entries of the table, to paste into fnnls/dispatch.py
+        for entry in results["table"]:
+            print("    {!r},".format(entry))
+
+        return 0
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    rows, regressions = compare(old, new, args.threshold)
+
+    for problem, n, solver, old_time, new_time, ratio in rows:
+        print("{:16} n={:<5} {:22} {:>10} {:>10} {}".format(
+            problem, n, solver,
+            "failed" if old_time is None else "{:.3e}".format(old_time),
+            "failed" if new_time is None else "{:.3e}".format(new_time),
+            "" if ratio is None else "x{:.2f}{}".format(ratio, "  REGRESSION" if ratio > args.threshold else "")))
+
+    print("{} regressions out of {} results".format(len(regressions), len(rows)))
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
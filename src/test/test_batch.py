@@ -0,0 +1,137 @@
+import pytest
+import numpy as np
+
+from fnnls.fnnls import fnnls
+from fnnls.batch import fnnls_batch, fnnls_sequence
+from fnnls.engines import FactorCache
+
+
+def test_batch_matches_fnnls():
+    """
+    Run fnnls_batch on random data and ensure that
+    every column matches the solution of fnnls
+    """
+
+    epsilon = 0.00001
+    np.random.seed(1)
+
+    Z = np.abs(np.random.rand(20,8))
+    X = np.abs(np.random.rand(20,30))
+
+    D, res = fnnls_batch(Z, X)
+
+    for j in range(X.shape[1]):
+
+        d, r = fnnls(Z, X[:,j])
+
+        assert(np.max(np.abs(D[:,j] - d)) < epsilon)
+        assert(np.abs(res[j] - r) < epsilon)
+
+def test_batch_repeated_columns():
+    """
+    Run fnnls_batch on the example from the paper by
+    Bro and Jung repeated over several columns, so that
+    all columns share the same passive sets
+    """
+
+    epsilon = 0.00001
+
+    Z = np.asarray([
+                    [73, 71, 52],
+                    [87, 74, 46],
+                    [72,  2,  7],
+                    [80, 89, 71]
+                    ])
+    x = np.asarray([49, 67, 68, 20])
+
+    D, res = fnnls_batch(Z, np.column_stack([x, x, 2*x]))
+
+    expected_d = np.asarray([0.64953844,0,0])
+
+    assert(np.max(np.abs(D[:,0] - expected_d)) < epsilon)
+    assert(np.max(np.abs(D[:,1] - expected_d)) < epsilon)
+    assert(np.max(np.abs(D[:,2] - 2*expected_d)) < epsilon)
+
+def test_batch_dimensions():
+    """
+    Ensure fnnls_batch rejects a one-dimensional X
+    """
+
+    with pytest.raises(ValueError):
+        fnnls_batch(np.ones((4,3)), np.ones(4))
+
+def test_batch_factor_cache():
+    """
+    Run fnnls_batch with a FactorCache and ensure it
+    matches the default least squares solver
+    """
+
+    epsilon = 0.00001
+    np.random.seed(1)
+
+    Z = np.abs(np.random.rand(20,8))
+    X = np.abs(np.random.rand(20,30))
+
+    D, res = fnnls_batch(Z, X)
+    D_cache, res_cache = fnnls_batch(Z, X, engine=FactorCache())
+
+    assert(np.max(np.abs(D - D_cache)) < epsilon)
+
+def test_sequence():
+    """
+    Run fnnls_sequence on slowly changing right hand sides
+    and ensure it matches fnnls on every column while
+    needing fewer iterations than cold starts
+    """
+
+    epsilon = 0.00001
+    np.random.seed(1)
+
+    Z = np.abs(np.random.rand(60,30))
+    d = np.abs(np.random.rand(30)) * (np.random.rand(30) < 0.3)
+    X = np.column_stack([Z.dot(d * (1 + 0.01*j)) + 0.01*np.random.randn(60) for j in range(10)])
+
+    for engine in [None, "cholesky"]:
+
+        D, res, info = fnnls_sequence(Z, X, engine=engine, full_output=True)
+
+        cold_iterations = 0
+
+        for j in range(X.shape[1]):
+
+            d_j, r_j, info_j = fnnls(Z, X[:,j], full_output=True)
+            cold_iterations += info_j["iterations"]
+
+            assert(np.max(np.abs(D[:,j] - d_j)) < epsilon)
+
+        assert(np.sum(info["iterations"]) < cold_iterations)
+
+def test_batch_weights():
+    """
+    Ensure the weighted batch matches fnnls_batch
+    on the rows of Z and X scaled by sqrt(W)
+    """
+
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    Z = np.abs(np.random.rand(200, 20))
+    X = np.random.rand(200, 10)
+    weights = np.random.rand(200)
+
+    root = np.sqrt(weights)[:, None]
+
+    D, res = fnnls_batch(Z * root, X * root)
+
+    for solver in [fnnls_batch, fnnls_sequence]:
+
+        D_weighted, res_weighted = solver(Z, X, weights=weights)
+
+        assert(np.max(np.abs(D - D_weighted)) < epsilon)
+        assert(np.max(np.abs(res - res_weighted)) < epsilon)
+
+    d, r = fnnls(Z, X[:, 0], weights=weights)
+
+    assert(np.max(np.abs(D[:, 0] - d)) < epsilon)
+    assert(np.abs(res[0] - r) < epsilon)
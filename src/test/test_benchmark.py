@@ -0,0 +1,41 @@
+import json
+
+import pytest
+import numpy as np
+
+from test.benchmark import run, compare, calibrate
+
+
+def test_benchmark():
+    """
+    Run the benchmarks on small problems, ensure every solver finds
+    the same solution and that the results compare with themselves
+    without regressions, and calibrate every method of solve
+    """
+    epsilon = 0.00001
+
+    results = run(problems=["tall", "batched"], sizes=[10], repeat=2, warmup=0, verbose=False)
+    results = json.loads(json.dumps(results))
+
+    assert(len(results["results"]) == 8)
+
+    for result in results["results"]:
+        assert(len(result["times"]) == 2)
+        assert(result["peak_bytes"] > 0)
+        assert(result["diff"] < epsilon)
+
+    rows, regressions = compare(results, results)
+
+    assert(len(rows) == 8)
+    assert(len(regressions) == 0)
+
+    results = calibrate(sizes=[10], supports=[0.5], repeat=1, warmup=0, verbose=False)
+    results = json.loads(json.dumps(results))
+
+    assert(len(results["results"]) == 12)
+    assert(len(results["table"]) == 4)
+
+    for nonnegative, is_sparse, n, support, method in results["table"]:
+        assert(n == 10)
+        assert(0 <= support <= 1)
+        assert(method in ["fnnls", "apg", "cd"])
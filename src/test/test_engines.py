@@ -0,0 +1,82 @@
+import pytest
+import numpy as np
+
+from fnnls.fnnls import fnnls
+from fnnls.engines import CholeskyEngine, FactorCache
+
+
+def test_cholesky_updates():
+    """
+    Add and remove indices from the passive set of a
+    CholeskyEngine and ensure every solve matches a
+    direct solve of ZTZ[P][:,P]
+    """
+
+    epsilon = 0.00001
+    np.random.seed(1)
+
+    Z = np.random.randn(30,10)
+    ZTZ = Z.T.dot(Z)
+    ZTx = Z.T.dot(np.random.randn(30))
+
+    engine = CholeskyEngine()
+
+    for support in [[0, 3, 5], [0, 3, 5, 7, 9], [3, 7, 9], [1, 2, 3, 9], [1]]:
+
+        P = np.zeros(10, dtype=bool)
+        P[support] = True
+
+        s = engine.solve(ZTZ, P, ZTx[P])
+        expected_s = np.linalg.solve(ZTZ[P][:,P], ZTx[P])
+
+        assert(np.max(np.abs(s - expected_s)) < epsilon)
+
+def test_factor_cache():
+    """
+    Solve the same problems twice with a shared FactorCache
+    and ensure the second pass only hits the cache and that
+    the solutions match the ones of fnnls
+    """
+
+    epsilon = 0.00001
+    np.random.seed(1)
+
+    Z = np.random.randn(30,10)
+    X = np.random.randn(30,4)
+
+    cache = FactorCache()
+
+    for j in range(X.shape[1]):
+        d, res = fnnls(Z, X[:,j], engine=cache)
+        assert(np.max(np.abs(d - fnnls(Z, X[:,j])[0])) < epsilon)
+
+    misses = cache.misses
+
+    for j in range(X.shape[1]):
+        fnnls(Z, X[:,j], engine=cache)
+
+    assert(cache.misses == misses)
+    assert(cache.hits > 0)
+
+def test_factor_cache_eviction():
+    """
+    Ensure a FactorCache never keeps more than maxsize
+    factorizations
+    """
+
+    np.random.seed(1)
+
+    Z = np.random.randn(30,10)
+    ZTZ = Z.T.dot(Z)
+
+    cache = FactorCache(maxsize=2)
+
+    for support in [[0], [1], [2], [0, 1]]:
+
+        P = np.zeros(10, dtype=bool)
+        P[support] = True
+
+        cache.solve(ZTZ, P, np.ones(len(support)))
+
+    assert(len(cache) == 2)
+    assert(cache.misses == 4)
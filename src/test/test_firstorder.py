@@ -0,0 +1,117 @@
+import pytest
+import numpy as np
+from scipy import sparse
+
+from fnnls.fnnls import fnnls, fnnls_gram
+from fnnls.firstorder import apg_gram, cd_gram
+from fnnls.dispatch import solve
+from fnnls.gram import gram
+
+
+def test_firstorder():
+    """
+    Ensure apg_gram and cd_gram converge to the solution of fnnls_gram,
+    with penalties and for a sparse ZTZ, and that solve gives the
+    solution of fnnls with every method, with and without polish,
+    and with fnnls for a small n
+    """
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    Z = np.random.randn(200, 50)
+    x = Z.dot(np.random.rand(50) * (np.random.rand(50) < 0.5)) + 0.1 * np.random.randn(200)
+    weights = np.random.rand(200) + 0.5
+
+    ZTZ, ZTx = gram(Z, x)
+    xTx = x.dot(x)
+
+    for l1, l2 in [(0, 0), (1, 0.5)]:
+
+        d, res = fnnls_gram(ZTZ, ZTx, xTx, l1=l1, l2=l2)
+
+        for first_order in [apg_gram, cd_gram]:
+
+            for A in [ZTZ, sparse.csr_matrix(ZTZ)]:
+
+                d_first_order, res_first_order, info = first_order(A, ZTx, xTx, tol=1e-10, l1=l1, l2=l2,
+                                                                   full_output=True)
+
+                assert(info["converged"])
+                assert(np.max(np.abs(d - d_first_order)) < epsilon)
+                assert(np.abs(res - res_first_order) < epsilon)
+
+    for method in ["auto", "fnnls", "apg", "cd"]:
+
+        for polish in [True, False]:
+
+            d, res = fnnls(Z, x, weights=weights)
+            d_solve, res_solve, info = solve(Z, x, method=method, polish=polish, tol=1e-10, weights=weights,
+                                             full_output=True)
+
+            assert(np.max(np.abs(d - d_solve)) < epsilon)
+            assert(np.abs(res - res_solve) < epsilon)
+            assert(info["method"] in ["fnnls", "apg", "cd"])
+
+    # Below the smallest n of the calibration table, fnnls is taken
+    # without estimating the support with apg_gram
+    d, res = fnnls(Z[:, :20], x)
+    d_solve, res_solve, info = solve(Z[:, :20], x, full_output=True)
+
+    assert(np.max(np.abs(d - d_solve)) < epsilon)
+    assert(info["method"] == "fnnls")
+    assert("first_order_iterations" not in info)
+
+    # Polished from a rough first order solution, fnnls finds the exact one
+    d, res = fnnls(Z, x)
+    d_solve, res_solve = solve(Z, x, method="cd", tol=0.1)
+
+    assert(np.max(np.abs(d - d_solve)) < epsilon)
+
+    with pytest.raises(ValueError):
+        solve(Z, x, method="newton")
+
+    with pytest.raises(ValueError):
+        apg_gram(ZTZ, ZTx[:10])
+
+    with pytest.raises(ValueError):
+        cd_gram(ZTZ, ZTx, tol=0)
+
+
+def test_solve_auto_fnnls_cold():
+    """
+    Ensure that when method "auto" selects fnnls after estimating the
+    support, fnnls starts from an empty passive set, since the passive
+    set of the estimate is larger than the support and starting from
+    it costs more, by the cubes of the sizes of the solves
+    """
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    Z = np.random.rand(300, 100)
+    x = Z.dot(np.random.rand(100) * (np.random.rand(100) < 0.3)) - 10 * np.random.rand(300)
+
+    def counting(cost):
+        def lstsq(A, b):
+            cost.append(A.shape[0] ** 3)
+            return np.linalg.inv(A).dot(b)
+        return lstsq
+
+    auto, cold, warm = [], [], []
+
+    d, res = fnnls(Z, x, lstsq=counting(cold))
+    d_solve, res_solve, info = solve(Z, x, lstsq=counting(auto), full_output=True)
+
+    assert(info["method"] == "fnnls")
+    assert("first_order_iterations" not in info)
+    assert(np.max(np.abs(d - d_solve)) < epsilon)
+    assert(sum(auto) == sum(cold))
+
+    # The warm start from the passive set of the estimate
+    ZTZ, ZTx = gram(Z, x)
+    _, _, estimate = apg_gram(ZTZ, ZTx, max_iterations=20, full_output=True)
+    fnnls(Z, x, estimate["P"], lstsq=counting(warm))
+
+    assert(estimate["P"].shape[0] > info["P"].shape[0])
+    assert(sum(warm) > sum(cold))
@@ -1,7 +1,12 @@
+import warnings
+
 import pytest
 import numpy as np
+from scipy import sparse
 
 from fnnls.fnnls import fnnls
+from fnnls.fnnls import fnnls_gram
+from fnnls.fnnls import RK, RGS
 
 
 def test_basic():
@@ -47,7 +52,286 @@ def test_gaussian():
 
     assert(np.max(np.abs(d - expected_d)) < epsilon)
 
+def test_cholesky_engine():
+    """
+    Run the fnnls implementation with the incremental
+    Cholesky engine on random gaussian data and ensure
+    it matches the default least squares solver
+    """
+    epsilon = 0.00001
+    np.random.seed(1)
+
+    Z = np.random.randn(50,20)
+    x = np.random.randn(50)
+
+    d, res = fnnls(Z,x)
+    d_chol, res_chol = fnnls(Z,x,engine="cholesky")
+
+    assert(np.max(np.abs(d - d_chol)) < epsilon)
+    assert(np.abs(res - res_chol) < epsilon)
+
+def test_gram():
+    """
+    Run fnnls_gram on the Gram quantities of random
+    gaussian data and ensure the solution and residual
+    match the ones of fnnls
+    """
+    epsilon = 0.00001
+    np.random.seed(1)
+
+    Z = np.random.randn(50,20)
+    x = np.random.randn(50)
+
+    d, res = fnnls(Z,x)
+    d_gram, res_gram = fnnls_gram(Z.T.dot(Z), Z.T.dot(x), x.dot(x))
+
+    assert(np.max(np.abs(d - d_gram)) < epsilon)
+    assert(np.abs(res - res_gram) < epsilon)
+
+    d_gram, res_gram = fnnls_gram(Z.T.dot(Z), Z.T.dot(x))
+
+    assert(np.max(np.abs(d - d_gram)) < epsilon)
+    assert(res_gram is None)
+
+def test_full_output():
+    """
+    Ensure the passive set returned with full_output warm
+    starts the same problem without any iteration
+    """
+    epsilon = 0.00001
+    np.random.seed(1)
+
+    Z = np.random.randn(50,20)
+    x = np.random.randn(50)
+
+    d, res, info = fnnls(Z, x, full_output=True)
+
+    assert(np.array_equal(info["P"], np.nonzero(d)[0]))
+    assert(np.max(info["w"]) < epsilon)
+    assert(info["iterations"] >= len(info["P"]))
 
+    d_warm, res_warm, info_warm = fnnls(Z, x, P_initial=info["P"], full_output=True)
 
+    assert(np.max(np.abs(d - d_warm)) < epsilon)
+    assert(info_warm["iterations"] == 0)
+
+def test_sparse():
+    """
+    Run the fnnls implementation on a scipy.sparse
+    matrix and ensure it matches the dense solution
+    """
+    epsilon = 0.00001
+
+    Z = sparse.random(1000, 40, density=0.01, format='csr', random_state=1)
+    x = np.random.RandomState(1).rand(1000)
+
+    d, res = fnnls(Z, x)
+    d_dense, res_dense = fnnls(Z.toarray(), x)
+
+    assert(np.max(np.abs(d - d_dense)) < epsilon)
+    assert(np.abs(res - res_dense) < epsilon)
+
+def test_float32():
+    """
+    Ensure float32 inputs give a float32 solution close to
+    the float64 one, and that refinement makes it closer
+    """
+    np.random.seed(1)
+
+    Z = np.abs(np.random.rand(200,40))
+    x = np.random.rand(200)
+
+    d, res = fnnls(Z, x)
+
+    for engine in [None, "cholesky"]:
+
+        d_single, res_single = fnnls(Z.astype(np.float32), x.astype(np.float32), engine=engine)
+        d_refined, res_refined = fnnls(Z.astype(np.float32), x.astype(np.float32), engine=engine, refine=2)
+
+        assert(d_single.dtype == np.float32)
+        assert(d_refined.dtype == np.float32)
+        assert(np.max(np.abs(d_single - d)) < 0.001)
+        assert(np.max(np.abs(d_refined - d)) <= np.max(np.abs(d_single - d)))
+
+def test_penalties():
+    """
+    Ensure the l2 penalty matches stacking sqrt(l2)*I under Z, and
+    that the penalties match on Z and on the Gram matrix
+    """
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    Z = np.abs(np.random.rand(100,30))
+    x = np.random.rand(100)
+
+    l1, l2 = 0.3, 2.
+
+    d, res = fnnls(Z, x, l2=l2)
+    d_stacked, res_stacked = fnnls(np.vstack([Z, np.sqrt(l2) * np.eye(30)]), np.concatenate([x, np.zeros(30)]))
+
+    assert(np.max(np.abs(d - d_stacked)) < epsilon)
+    assert(np.abs(res - np.linalg.norm(x - Z.dot(d))) < epsilon)
+
+    ZTZ, ZTx = Z.T.dot(Z), Z.T.dot(x)
+
+    d, res = fnnls(Z, x, l1=l1, l2=l2)
+    d_gram, res_gram = fnnls_gram(ZTZ, ZTx, x.dot(x), l1=l1, l2=l2)
+
+    assert(np.max(np.abs(d - d_gram)) < epsilon)
+    assert(np.abs(res - res_gram) < epsilon)
+    assert(np.array_equal(ZTZ, Z.T.dot(Z)))
+
+    with pytest.raises(ValueError):
+        fnnls(Z, x, l1=-1)
+
+def test_upper_bounds():
+    """
+    Ensure the bounded solution matches scipy.optimize.lsq_linear,
+    with finite and infinite upper bounds, and that infinite upper
+    bounds give the solution of fnnls
+    """
+    from scipy.optimize import lsq_linear
 
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    Z = np.random.randn(100,20)
+    x = 3 * np.random.randn(100)
+
+    upper = 0.5 * np.random.rand(20)
+    upper[:5] = np.inf
+
+    for engine in [None, "cholesky"]:
+
+        d, res, info = fnnls(Z, x, upper=upper, engine=engine, full_output=True)
+        d_ref = lsq_linear(Z, x, bounds=(0, upper), method='bvls', tol=1e-12).x
+
+        assert(np.max(np.abs(d - d_ref)) < epsilon)
+        assert(np.all(d[info["U"]] == upper[info["U"]]))
+
+    d, res = fnnls(Z, x)
+    d_inf, res_inf = fnnls(Z, x, upper=np.full(20, np.inf))
+
+    assert(np.max(np.abs(d - d_inf)) < epsilon)
+
+    with pytest.raises(ValueError):
+        fnnls(Z, x, upper=-upper)
+
+def test_additions():
+    """
+    Ensure moving several indices into the passive set per
+    iteration finds the same solution in fewer iterations
+    """
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    Z = np.random.rand(300, 150)
+    x = Z.dot(np.random.rand(150) * (np.random.rand(150) < 0.6)) + 0.01 * np.random.randn(300)
+
+    d, res, info = fnnls(Z, x, full_output=True)
+
+    for additions in [4, 150]:
+        for engine in [None, "cholesky"]:
+
+            d_additions, res_additions, info_additions = fnnls(Z, x, engine=engine, additions=additions, full_output=True)
+
+            assert(np.max(np.abs(d - d_additions)) < epsilon)
+            assert(np.array_equal(info["P"], info_additions["P"]))
+            assert(info_additions["iterations"] < info["iterations"])
+
+    with pytest.raises(ValueError):
+        fnnls(Z, x, additions=4, upper=np.ones(150))
+
+def test_additions_wide():
+    """
+    Ensure moving several indices into the passive set per iteration
+    finds the solution of single index moves for wide Z, and with two
+    equal columns, without the passive set outgrowing the rank of Z
+    """
+    epsilon = 0.00001
+
+    # The seed of np.random.seed(1) makes the single index loop cycle
+    np.random.seed(0)
+
+    for trial in range(4):
+
+        Z = np.random.randn(23, 48)
+        x = np.random.randn(23)
+
+        if trial % 2:
+            Z[:, 7] = Z[:, 3]
+
+        d, res = fnnls(Z, x)
+
+        for additions in [2, 8, 64]:
+            for engine in [None, "cholesky"]:
+
+                # w may stall at round off above the tolerance, with a warning
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", RuntimeWarning)
+                    d_additions, res_additions, info = fnnls(Z, x, engine=engine, additions=additions, full_output=True)
+
+                assert(np.abs(res - res_additions) < epsilon)
+                assert(np.max(info["w"]) < epsilon)
+                assert(info["P"].shape[0] <= 23)
+
+def test_numba_backend():
+    """
+    Ensure the compiled loop finds the same solution, passive
+    set and number of iterations as the NumPy one
+    """
+    pytest.importorskip("numba")
+
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    for n in [5, 20, 50]:
+
+        Z = np.random.randn(2 * n, n)
+        x = np.random.randn(2 * n)
+
+        for P_initial in [np.zeros(0, dtype=int), np.arange(0, n, 3)]:
+
+            d, res, info = fnnls(Z, x, P_initial=P_initial, full_output=True)
+            d_numba, res_numba, info_numba = fnnls(Z, x, P_initial=P_initial, full_output=True, backend="numba")
+
+            assert(np.max(np.abs(d - d_numba)) < epsilon)
+            assert(np.array_equal(info["P"], info_numba["P"]))
+            assert(info["iterations"] == info_numba["iterations"])
+
+    with pytest.raises(ValueError):
+        fnnls(Z, x, backend="numba", upper=np.ones(n))
+
+def test_randomized():
+    """
+    Ensure RK and RGS, with both samplings, converge to the
+    solution of a consistent system, and that the
+    nonnegative RGS converges to the solution of fnnls
+    """
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    A = np.random.randn(100,10)
+    x = np.abs(np.random.rand(10))
+    b = A.dot(x)
+
+    for method in [RK, RGS]:
+        for sampling in ["uniform", "norm"]:
+
+            x_approx = method(A, b, k=5000, random_state=1, sampling=sampling)
+
+            assert(np.max(np.abs(x_approx - x)) < epsilon)
+
+    Z = np.abs(np.random.rand(50,10))
+    x = np.random.randn(50)
+
+    d, res = fnnls(Z, x)
+    d_approx = RGS(Z, x, k=20000, random_state=1, nonnegative=True)
 
+    assert(np.min(d_approx) >= 0)
+    assert(np.max(np.abs(d_approx - d)) < epsilon)
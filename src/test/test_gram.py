@@ -0,0 +1,50 @@
+import pytest
+import numpy as np
+from scipy import sparse
+
+from fnnls.gram import gram
+
+
+def test_gram_sparse():
+    """
+    Ensure gram keeps the Gram matrix of a very sparse Z
+    sparse, and makes the one of a denser Z dense
+    """
+
+    Z = sparse.random(1000, 100, density=0.001, format='csr', random_state=1)
+    x = np.ones(1000)
+
+    ZTZ, ZTx = gram(Z, x)
+
+    assert(sparse.issparse(ZTZ))
+    assert(np.allclose(ZTZ.toarray(), Z.toarray().T.dot(Z.toarray())))
+    assert(np.allclose(ZTx, Z.toarray().T.dot(x)))
+
+    Z = sparse.random(1000, 100, density=0.2, format='csc', random_state=1)
+
+    ZTZ, ZTx = gram(Z, x)
+
+    assert(isinstance(ZTZ, np.ndarray))
+    assert(np.allclose(ZTZ, Z.toarray().T.dot(Z.toarray())))
+
+def test_gram_weights():
+    """
+    Ensure the weighted Gram quantities, accumulated by blocks
+    of rows, match the ones of the scaled rows of Z and X
+    """
+
+    np.random.seed(1)
+
+    Z = np.random.rand(1000, 20)
+    X = np.random.rand(1000, 3)
+    weights = np.random.rand(1000)
+
+    for Z_ in [Z, sparse.csr_matrix(Z)]:
+
+        ZTZ, ZTX = gram(Z_, X, weights=weights, chunk_size=64)
+
+        assert(np.allclose(ZTZ, Z.T.dot(weights[:, None] * Z)))
+        assert(np.allclose(ZTX, Z.T.dot(weights[:, None] * X)))
+
+    with pytest.raises(ValueError):
+        gram(Z, X, weights=-weights)
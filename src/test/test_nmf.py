@@ -0,0 +1,40 @@
+import pytest
+import numpy as np
+
+from fnnls.nmf import nmf
+from fnnls.engines import CholeskyEngine, FactorCache
+
+
+def test_nmf():
+    """
+    Ensure nmf recovers a nonnegative low rank matrix, that its
+    objective decreases, that a callback can stop it and that engines
+    keeping factorizations between calls are rejected
+    """
+    np.random.seed(1)
+
+    W = np.random.rand(60, 4) * (np.random.rand(60, 4) < 0.5)
+    H = np.random.rand(4, 50) * (np.random.rand(4, 50) < 0.5)
+    X = W.dot(H)
+
+    W_approx, H_approx, info = nmf(X, 4, random_state=1, tol=1e-8, full_output=True)
+
+    assert(np.min(W_approx) >= 0 and np.min(H_approx) >= 0)
+    assert(np.linalg.norm(X - W_approx.dot(H_approx)) < 0.01 * np.linalg.norm(X))
+    assert(np.abs(info["objective"][-1] - np.linalg.norm(X - W_approx.dot(H_approx))) < 1e-6)
+    assert(np.all(np.diff(info["objective"]) <= 1e-6))
+    assert(len(info["times"]) == info["iterations"])
+
+    W_approx, H_approx, info = nmf(X, 4, random_state=1, full_output=True,
+                                   callback=lambda iteration, W, H, objective: iteration == 3)
+
+    assert(info["iterations"] == 3)
+    assert(info["exit_reason"] == "callback")
+
+    with pytest.raises(ValueError):
+        nmf(-X, 4)
+
+    # Engines that keep factorizations between the half steps are rejected
+    for engine in ["cholesky", CholeskyEngine(), FactorCache()]:
+        with pytest.raises(ValueError):
+            nmf(X, 4, engine=engine)
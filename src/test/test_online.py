@@ -0,0 +1,52 @@
+import pytest
+import numpy as np
+
+from fnnls.fnnls import fnnls
+from fnnls.online import OnlineNNLS
+
+
+def test_online():
+    """
+    Ensure the online solver matches a refit of fnnls on the
+    weighted observations of the window as they arrive and expire
+    """
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    Z = np.random.rand(600, 20)
+    x = Z.dot(np.random.rand(20) * (np.random.rand(20) < 0.5)) + 0.1 * np.random.randn(600)
+
+    window = 100
+
+    for forgetting in [1, 0.99]:
+
+        solver = OnlineNNLS(20, window=window, forgetting=forgetting)
+
+        for t in range(600):
+
+            solver.add(Z[t], x[t])
+
+            if t % 97 == 0:
+                start = max(0, t + 1 - window)
+                weights = forgetting ** np.arange(t - start, -1, -1)
+
+                d, res = solver.solve()
+                d_refit, res_refit = fnnls(Z[start:t + 1], x[start:t + 1], weights=weights)
+
+                assert(solver.count == t + 1 - start)
+                assert(np.max(np.abs(d - d_refit)) < epsilon)
+                assert(np.abs(res - res_refit) < epsilon)
+
+    # Blocks of observations, and explicit removal without a window
+    solver = OnlineNNLS(20)
+    solver.add(Z[:300], x[:300])
+    solver.remove(Z[:100], x[:100])
+
+    d, res = solver.solve()
+    d_refit, res_refit = fnnls(Z[100:300], x[100:300])
+
+    assert(np.max(np.abs(d - d_refit)) < epsilon)
+
+    with pytest.raises(ValueError):
+        OnlineNNLS(20, window=window).remove(Z[0], x[0])
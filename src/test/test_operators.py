@@ -0,0 +1,39 @@
+import pytest
+import numpy as np
+from scipy.sparse.linalg import aslinearoperator
+
+from fnnls.fnnls import fnnls
+from fnnls.operators import Convolution
+
+
+def test_convolution():
+    """
+    Ensure fnnls gives the same solution with a Convolution or a
+    LinearOperator as with the dense matrix Z, for every mode
+    """
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    n = 80
+
+    for L, mode in [(9, "full"), (9, "same"), (9, "valid"), (100, "full")]:
+
+        kernel = np.random.rand(L)
+        Z = Convolution(kernel, n, mode)
+        Z_dense = np.column_stack([np.convolve(np.eye(n)[j], kernel, mode) for j in range(n)])
+
+        x = Z_dense.dot(np.random.rand(n) * (np.random.rand(n) < 0.2)) + 0.01 * np.random.randn(Z_dense.shape[0])
+
+        assert(Z.shape == Z_dense.shape)
+        assert(np.max(np.abs(Z.gram()[np.arange(n)[:,None], np.arange(n)] - Z_dense.T.dot(Z_dense))) < epsilon)
+
+        for engine in [None, "cholesky"]:
+
+            d, res = fnnls(Z_dense, x, engine=engine, l2=0.1)
+            d_op, res_op = fnnls(Z, x, engine=engine, l2=0.1)
+            d_lin, res_lin = fnnls(aslinearoperator(Z_dense), x, engine=engine, l2=0.1)
+
+            assert(np.max(np.abs(d - d_op)) < epsilon)
+            assert(np.max(np.abs(d - d_lin)) < epsilon)
+            assert(np.abs(res - res_op) < epsilon)
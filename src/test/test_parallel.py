@@ -0,0 +1,51 @@
+import pytest
+import numpy as np
+
+from fnnls.batch import fnnls_batch
+from fnnls.parallel import fnnls_parallel
+
+
+def test_parallel_matches_batch():
+    """
+    Run fnnls_parallel on two workers with small chunks
+    and ensure it matches fnnls_batch
+    """
+
+    epsilon = 0.00001
+    np.random.seed(1)
+
+    Z = np.abs(np.random.rand(30,10))
+    X = np.abs(np.random.rand(30,25))
+
+    D, res = fnnls_batch(Z, X)
+    D_parallel, res_parallel = fnnls_parallel(Z, X, n_jobs=2, chunk_size=4)
+
+    assert(np.max(np.abs(D - D_parallel)) < epsilon)
+    assert(np.max(np.abs(res - res_parallel)) < epsilon)
+
+
+def test_parallel_dtype_weights():
+    """
+    Ensure fnnls_parallel keeps a float32 solution in float32,
+    and matches fnnls_batch with weights and a given lstsq
+    """
+
+    epsilon = 0.0001
+    np.random.seed(1)
+
+    Z = np.abs(np.random.rand(30,10))
+    X = np.abs(np.random.rand(30,25))
+    weights = np.random.rand(30) + 0.5
+
+    D, res = fnnls_batch(Z.astype(np.float32), X.astype(np.float32))
+    D_parallel, res_parallel = fnnls_parallel(Z.astype(np.float32), X.astype(np.float32), n_jobs=2, chunk_size=4)
+
+    assert(D_parallel.dtype == np.float32)
+    assert(np.max(np.abs(D - D_parallel)) < epsilon)
+    assert(np.max(np.abs(res - res_parallel)) < epsilon)
+
+    D, res = fnnls_batch(Z, X, weights=weights)
+    D_parallel, res_parallel = fnnls_parallel(Z, X, n_jobs=2, chunk_size=4, lstsq=np.linalg.solve, weights=weights)
+
+    assert(np.max(np.abs(D - D_parallel)) < epsilon)
+    assert(np.max(np.abs(res - res_parallel)) < epsilon)
@@ -0,0 +1,39 @@
+import pytest
+import numpy as np
+
+from fnnls.fnnls import fnnls
+from fnnls.path import fnnls_path
+
+
+def test_path():
+    """
+    Ensure every solution of the path matches a cold solve
+    of fnnls with the same penalty
+    """
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    Z = np.abs(np.random.rand(200,40))
+    x = Z.dot(np.random.rand(40) * (np.random.rand(40) < 0.3)) + 0.1 * np.random.randn(200)
+
+    lambdas = 2 * np.max(Z.T.dot(x)) * np.logspace(0, -3, 10)
+
+    for penalty in ["l1", "l2"]:
+        for engine in [None, "cholesky"]:
+
+            D, res, info = fnnls_path(Z, x, lambdas, penalty=penalty, engine=engine, full_output=True)
+
+            assert(D.shape == (10, 40))
+
+            for i, lambda_ in enumerate(lambdas):
+
+                d, r = fnnls(Z, x, **{penalty: lambda_})
+
+                assert(np.max(np.abs(D[i] - d)) < epsilon)
+                assert(np.abs(res[i] - r) < epsilon)
+                assert(np.array_equal(info["P"][i], d > 0))
+
+    D, res = fnnls_path(Z, x, lambdas)
+
+    assert(np.all(D[0] == 0))
@@ -0,0 +1,41 @@
+import pytest
+import numpy as np
+
+from fnnls.fnnls import fnnls
+from fnnls.screening import fnnls_screened, screen
+
+
+def test_screening():
+    """
+    Ensure the screened solver matches fnnls, in both modes and with
+    penalties, and that the safe rules never discard a column of the
+    support of the solution
+    """
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    Z = np.random.rand(100, 1000)
+    x = Z[:, :10].dot(np.random.rand(10)) + 0.01 * np.random.randn(100)
+
+    for l1, l2 in [(0, 0), (1, 0), (0, 1)]:
+
+        d, res = fnnls(Z, x, l1=l1, l2=l2)
+
+        kept = screen(Z, x, d, l1=l1, l2=l2)
+
+        assert(np.all(kept[d > 0]))
+        assert(np.sum(kept) < 1000)
+
+        for aggressive in [False, True]:
+
+            d_screened, res_screened, info = fnnls_screened(Z, x, l1=l1, l2=l2, aggressive=aggressive,
+                                                            working_size=20, full_output=True)
+
+            assert(np.max(np.abs(d - d_screened)) < epsilon)
+            assert(np.abs(res - res_screened) < epsilon)
+            assert(np.all(info["kept"][d > 0]))
+            assert(np.max(info["w"]) < epsilon)
+
+    # Without penalties, columns with a nonpositive sum leave no safe rule
+    assert(np.all(screen(-Z, x)))
@@ -0,0 +1,95 @@
+import pytest
+import numpy as np
+from scipy import sparse
+
+from fnnls.fnnls import fnnls
+from fnnls.sketching import fnnls_sketched
+
+
+def test_sketching():
+    """
+    Ensure the exact refinement of the sketched solution matches fnnls
+    for both sketches, with penalties and weights, and that the sketched
+    solution alone has a residual close to the optimal one
+    """
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    Z = np.random.rand(3000, 40)
+    x = Z.dot(np.random.rand(40) * (np.random.rand(40) < 0.3)) + 0.1 * np.random.randn(3000)
+    weights = np.random.rand(3000) + 0.5
+
+    for method in ["countsketch", "srht"]:
+
+        for l1, l2, w in [(0, 0, None), (1, 0.5, None), (0, 0, weights)]:
+
+            d, res = fnnls(Z, x, l1=l1, l2=l2, weights=w)
+            d_sketched, res_sketched, info = fnnls_sketched(Z, x, l1=l1, l2=l2, weights=w, method=method,
+                                                            random_state=1, full_output=True)
+
+            assert(np.max(np.abs(d - d_sketched)) < epsilon)
+            assert(np.abs(res - res_sketched) < epsilon)
+            assert(np.max(info["w"]) < epsilon)
+            assert(info["sketch_size"] == 160)
+
+            d_sketched, res_sketched = fnnls_sketched(Z, x, l1=l1, l2=l2, weights=w, method=method,
+                                                      random_state=1, exact=False)
+
+            assert(res <= res_sketched + epsilon)
+            assert(res_sketched < 1.5 * res)
+
+    # A sparse Z is sketched without densifying it
+    d, res = fnnls(Z, x)
+    d_sketched, res_sketched = fnnls_sketched(sparse.csr_matrix(Z), x, random_state=1)
+
+    assert(np.max(np.abs(d - d_sketched)) < epsilon)
+
+
+def test_sketching_sparse():
+    """
+    Ensure the exact refinement matches fnnls on the unsketched problem
+    for a sparse Z, whose working set columns are kept sparse, and for
+    the same Z dense, whose rows are taken in several blocks
+    """
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    Z = sparse.random(20000, 60, density=0.05, format="csr", random_state=1)
+    x = Z @ (np.random.rand(60) * (np.random.rand(60) < 0.3)) + 0.1 * np.random.randn(20000)
+    weights = np.random.rand(20000) + 0.5
+
+    for A in [Z, Z.toarray()]:
+
+        for w in [None, weights]:
+
+            d, res = fnnls(Z.toarray(), x, weights=w)
+            d_sketched, res_sketched, info = fnnls_sketched(A, x, weights=w, random_state=1, full_output=True)
+
+            assert(np.max(np.abs(d - d_sketched)) < epsilon)
+            assert(np.abs(res - res_sketched) < epsilon)
+            assert(np.max(info["w"]) < epsilon)
+
+
+def test_sketching_srht_blocks():
+    """
+    Ensure the SRHT sketch of a Z tall enough to be transformed in
+    several blocks of columns is close to the original problem
+    """
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    Z = np.random.rand(40000, 40)
+    x = Z.dot(np.random.rand(40) * (np.random.rand(40) < 0.3)) + 0.1 * np.random.randn(40000)
+
+    d, res = fnnls(Z, x)
+    d_sketched, res_sketched = fnnls_sketched(Z, x, method="srht", random_state=1, exact=False)
+
+    assert(res <= res_sketched + epsilon)
+    assert(res_sketched < 1.5 * res)
+
+    d_sketched, res_sketched = fnnls_sketched(Z, x, method="srht", random_state=1)
+
+    assert(np.max(np.abs(d - d_sketched)) < epsilon)
@@ -0,0 +1,56 @@
+import pytest
+import numpy as np
+
+from fnnls.fnnls import fnnls
+from fnnls.solver import NNLSSolver
+
+
+def test_solver_reuse():
+    """
+    Solve several problems with the same NNLSSolver, with
+    and without the Cholesky engine, and ensure every
+    solution matches the one of fnnls
+    """
+
+    epsilon = 0.00001
+    np.random.seed(1)
+
+    Z = np.random.randn(40,15)
+    X = np.random.randn(40,5)
+
+    solver = NNLSSolver(Z)
+    solver_chol = NNLSSolver(Z, engine="cholesky")
+
+    for j in range(X.shape[1]):
+
+        d, res = fnnls(Z, X[:,j])
+
+        for s in [solver, solver_chol]:
+
+            d_s, res_s = s.solve(X[:,j])
+
+            assert(np.max(np.abs(d - d_s)) < epsilon)
+            assert(np.abs(res - res_s) < epsilon)
+
+            # Warm starting from the support gives the same solution
+            d_s, res_s = s.solve(X[:,j], P_initial=np.nonzero(d)[0])
+
+            assert(np.max(np.abs(d - d_s)) < epsilon)
+
+def test_solver_many():
+    """
+    Ensure solve_many matches solve on every column
+    """
+
+    epsilon = 0.00001
+    np.random.seed(1)
+
+    Z = np.abs(np.random.rand(20,8))
+    X = np.abs(np.random.rand(20,10))
+
+    solver = NNLSSolver(Z)
+
+    D, res = solver.solve_many(X)
+
+    for j in range(X.shape[1]):
+        assert(np.max(np.abs(D[:,j] - solver.solve(X[:,j])[0])) < epsilon)
@@ -0,0 +1,41 @@
+import pytest
+import numpy as np
+
+from fnnls.fnnls import fnnls
+from fnnls.stats import SolverStats
+
+
+def test_stats():
+    """
+    Ensure the stats of a call are filled in, that they do not change
+    the solution, and that a callback can stop the outer loop
+    """
+    epsilon = 0.00001
+
+    np.random.seed(1)
+
+    Z = np.abs(np.random.rand(300,80))
+    x = np.random.rand(300)
+
+    d, res = fnnls(Z, x)
+
+    for engine in [None, "cholesky"]:
+
+        stats = SolverStats()
+        d_stats, res_stats = fnnls(Z, x, engine=engine, stats=stats)
+
+        assert(np.max(np.abs(d - d_stats)) < epsilon)
+        assert(stats.iterations > 0)
+        assert(stats.lstsq_calls == stats.iterations + stats.inner_iterations)
+        assert(stats.exit_reason == "converged")
+        assert(stats.kkt_violation < epsilon)
+        assert(stats.total_time >= stats.gram_time + stats.lstsq_time)
+
+    iterations = []
+    callback = lambda iteration, d, P, w: iterations.append(iteration) or iteration == 2
+
+    fnnls(Z, x, stats=stats, callback=callback)
+
+    assert(iterations == [1, 2])
+    assert(stats.iterations == 2)
+    assert(stats.exit_reason == "callback")
@@ -0,0 +1,46 @@
+import pytest
+import numpy as np
+
+from fnnls.fnnls import fnnls
+from fnnls.streaming import fnnls_chunked, accumulate_gram, iter_blocks
+
+
+def test_chunked_matches_fnnls():
+    """
+    Run fnnls_chunked on blocks of rows of random data,
+    with and without prefetching, and ensure it matches
+    fnnls on the whole matrix
+    """
+
+    epsilon = 0.00001
+    np.random.seed(1)
+
+    Z = np.random.randn(1000,20)
+    x = np.random.randn(1000)
+
+    d, res = fnnls(Z, x)
+
+    for prefetch in [True, False]:
+
+        d_chunked, res_chunked = fnnls_chunked(Z, x, chunk_size=128, prefetch=prefetch)
+
+        assert(np.max(np.abs(d - d_chunked)) < epsilon)
+        assert(np.abs(res - res_chunked) < epsilon)
+
+def test_accumulate_gram():
+    """
+    Ensure the Gram quantities accumulated from blocks of
+    uneven sizes match the ones of the whole matrix
+    """
+
+    epsilon = 0.00001
+    np.random.seed(1)
+
+    Z = np.random.randn(100,7)
+    x = np.random.randn(100)
+
+    ZTZ, ZTx, xTx = accumulate_gram(iter_blocks(Z, x, chunk_size=33))
+
+    assert(np.max(np.abs(ZTZ - Z.T.dot(Z))) < epsilon)
+    assert(np.max(np.abs(ZTx - Z.T.dot(x))) < epsilon)
+    assert(np.abs(xTx - x.dot(x)) < epsilon)